@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -50,7 +51,6 @@ INSTALLED_APPS = [
 
 AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',  # backend padrão para autenticação de usuários do Django
-    'backend.backend.UsernameBackend',  # ou outro backend que você criou
 ]
 
 
@@ -106,6 +106,12 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'backend.wsgi.application'
+ASGI_APPLICATION = 'backend.asgi.application'
+
+# 'wsgi' (gunicorn sync) ou 'asgi' (gunicorn + uvicorn); ver gunicorn.conf.py.
+# No modo asgi as rotas de leitura usam as views de orders/async_views.py
+SERVER_MODE = os.environ.get('SERVER_MODE', 'wsgi')
+ASYNC_VIEWS = SERVER_MODE == 'asgi'
 
 
 # accept all requisition
@@ -132,24 +138,68 @@ CORS_ALLOW_METHODS = [
 CORS_ALLOW_HEADERS = [
     'content-type',
     'authorization',
+    'idempotency-key',
+]
+
+# Marca as respostas repetidas de uma Idempotency-Key (orders.idempotency)
+CORS_EXPOSE_HEADERS = [
+    'idempotent-replayed',
 ]
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
-import os
 
+def env_bool(name, default=False):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+# Conexão configurável por variáveis de ambiente; sem elas vale o banco de produção
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'sistemag_5hfo',
-        'USER': 'sistemag_5hfo_user',
-        'PASSWORD': 'gzs0Eauce4jfBUj2ckylvD30PHs5EKQx',
-       'HOST': 'dpg-ctrb2kbqf0us7385egb0-a.oregon-postgres.render.com',
-        'PORT': '5432',  # Porta padrão do PostgreSQL
-
+        'ENGINE': os.environ.get('DB_ENGINE', 'django.db.backends.postgresql'),
+        'NAME': os.environ.get('DB_NAME', 'sistemag_5hfo'),
+        'USER': os.environ.get('DB_USER', 'sistemag_5hfo_user'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', 'gzs0Eauce4jfBUj2ckylvD30PHs5EKQx'),
+        'HOST': os.environ.get('DB_HOST', 'dpg-ctrb2kbqf0us7385egb0-a.oregon-postgres.render.com'),
+        'PORT': os.environ.get('DB_PORT', '5432'),  # Porta padrão do PostgreSQL
+        # Reaproveita a conexão entre requisições (segundos; 0 fecha a cada requisição).
+        # No modo asgi cada requisição roda numa thread nova, então o padrão é 0
+        # e o reaproveitamento fica com DB_POOL ou com o PgBouncer
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '0' if SERVER_MODE == 'asgi' else '60')),
+        # Testa a conexão reaproveitada antes de usá-la, para não falhar após queda do banco
+        'CONN_HEALTH_CHECKS': env_bool('DB_CONN_HEALTH_CHECKS', True),
+        'OPTIONS': {},
     }
 }
 
+if DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    if os.environ.get('DB_SSLMODE'):
+        DATABASES['default']['OPTIONS']['sslmode'] = os.environ['DB_SSLMODE']
+    DATABASES['default']['OPTIONS']['connect_timeout'] = int(os.environ.get('DB_CONNECT_TIMEOUT', '10'))
+
+    if env_bool('DB_POOL'):
+        # Pool nativo do Django 5.1; exige psycopg 3 com psycopg-pool
+        # (pip install "psycopg[binary,pool]") e não combina com CONN_MAX_AGE
+        try:
+            import psycopg_pool  # noqa: F401
+        except ImportError:
+            from django.core.exceptions import ImproperlyConfigured
+            raise ImproperlyConfigured('DB_POOL requer psycopg 3 com psycopg-pool: pip install "psycopg[binary,pool]".')
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '10')),
+            'timeout': int(os.environ.get('DB_POOL_TIMEOUT', '10')),
+        }
+
+    if env_bool('DB_PGBOUNCER'):
+        # PgBouncer em modo transaction: cursores do lado do servidor (usados
+        # por .iterator()) não sobrevivem entre transações
+        DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+
 
 
 
@@ -165,7 +215,54 @@ DATABASES = {
 #      }
 #}
 
-      
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# CACHE_BACKEND: 'locmem' (padrão, um cache por processo), 'file' (CACHE_LOCATION
+# é um diretório; sobrevive a reinícios) ou 'redis' (CACHE_LOCATION, ex.
+# redis://127.0.0.1:6379/1; exige o pacote redis). Com mais de um worker o
+# Redis é obrigatório (ver WEB_CONCURRENCY abaixo)
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+if CACHE_BACKEND not in CACHE_BACKENDS:
+    from django.core.exceptions import ImproperlyConfigured
+    raise ImproperlyConfigured(f"CACHE_BACKEND inválido: {CACHE_BACKEND} (use {', '.join(CACHE_BACKENDS)}).")
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': os.environ.get('CACHE_LOCATION', {
+            'locmem': 'sistemag',
+            'file': str(BASE_DIR / 'django_cache'),
+            'redis': 'redis://127.0.0.1:6379/1',
+        }[CACHE_BACKEND]),
+        'KEY_PREFIX': os.environ.get('CACHE_KEY_PREFIX', 'sistemag'),
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 5000} if CACHE_BACKEND != 'redis' else {},
+    }
+}
+
+# Tempo máximo (segundos) das listagens em cache (orders.cache); a
+# invalidação por escrita é imediata, isto só limita o espaço ocupado
+API_CACHE_TIMEOUT = int(os.environ.get('API_CACHE_TIMEOUT', '3600'))
+
+# Processos do servidor; gunicorn.conf.py exporta aqui o número de workers.
+# O estado guardado no cache (estoque ativo, versões das listagens, carrinho,
+# eventos do feed) precisa ser o mesmo para todos os processos, e os
+# contadores e travas usados por ele precisam ser atômicos entre processos:
+# só o Redis garante as duas coisas. Com locmem ou file, um worker só
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', '1'))
+if WEB_CONCURRENCY > 1 and CACHE_BACKEND != 'redis':
+    from django.core.exceptions import ImproperlyConfigured
+    raise ImproperlyConfigured(
+        f"WEB_CONCURRENCY={WEB_CONCURRENCY} requer CACHE_BACKEND=redis; "
+        f"com '{CACHE_BACKEND}' cada worker teria o seu próprio cache."
+    )
+
 
 
 # Password validation
@@ -204,6 +301,21 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Relatórios PDF gerados em segundo plano (orders.reports)
+REPORTS_CACHE_DIR = BASE_DIR / 'report_cache'
+REPORTS_MAX_WORKERS = 2  # 0 renderiza no próprio processo da requisição
+
+# Registros de login (people.audit) gravados em lote por uma thread
+LOGIN_AUDIT_BATCH_SIZE = 100
+LOGIN_AUDIT_FLUSH_INTERVAL = 2.0  # segundos; 0 grava na própria requisição
+
+# Carrinhos alterados no cache (orders.cart) gravados no banco a cada N segundos
+CART_FLUSH_INTERVAL = 5.0  # 0 grava na própria requisição
+
+# Validade (segundos) da resposta guardada para um header Idempotency-Key
+# (orders.idempotency); as linhas vencidas saem com purge_idempotency_keys
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
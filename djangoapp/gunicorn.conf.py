@@ -0,0 +1,44 @@
+# Configuração do gunicorn: gunicorn -c gunicorn.conf.py (a partir de djangoapp/)
+#
+# SERVER_MODE=wsgi  -> workers síncronos com backend.wsgi (padrão)
+# SERVER_MODE=asgi  -> workers uvicorn com backend.asgi; as rotas de leitura
+#                      passam a usar orders/async_views.py e o feed de
+#                      notificações não prende um worker por cliente
+import multiprocessing
+import os
+
+SERVER_MODE = os.environ.get('SERVER_MODE', 'wsgi')
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+# O estado em cache (estoque ativo, listagens, carrinho, feed) só é
+# compartilhado entre processos no Redis; com locmem ou file, um worker só
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+default_workers = multiprocessing.cpu_count() * 2 + 1 if CACHE_BACKEND == 'redis' else 1
+workers = int(os.environ.get('WEB_CONCURRENCY', default_workers))
+if workers > 1 and CACHE_BACKEND != 'redis':
+    raise RuntimeError(f"WEB_CONCURRENCY={workers} requer CACHE_BACKEND=redis (cache atual: {CACHE_BACKEND}).")
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '60'))
+keepalive = 5
+
+if SERVER_MODE == 'asgi':
+    wsgi_app = 'backend.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+else:
+    wsgi_app = 'backend.wsgi:application'
+    worker_class = 'sync'
+    # Threads deixam um worker síncrono atender outro cliente enquanto um
+    # relatório ou agregação espera o banco
+    threads = int(os.environ.get('GUNICORN_THREADS', '1'))
+
+
+def when_ready(server):
+    # `-w`/`--workers` na linha de comando substitui `workers` acima, então a
+    # conferência vale para o número de workers que o arbiter vai de fato criar
+    cache_backend = os.environ.get('CACHE_BACKEND', 'locmem')
+    if server.cfg.workers > 1 and cache_backend != 'redis':
+        server.halt(
+            reason=f"{server.cfg.workers} workers requerem CACHE_BACKEND=redis (cache atual: {cache_backend}).",
+            exit_status=1,
+        )
+    # Os workers conferem o mesmo valor no settings.py
+    os.environ['WEB_CONCURRENCY'] = str(server.cfg.workers)
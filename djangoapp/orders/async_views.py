@@ -0,0 +1,129 @@
+"""
+Versões assíncronas das rotas de leitura mais usadas.
+
+Usadas no modo ASGI (SERVER_MODE=asgi, ver gunicorn.conf.py): orders/urls.py
+registra estas views nos mesmos caminhos das views síncronas, então o
+frontend não muda. As consultas são as mesmas das views de views.py,
+executadas com o ORM assíncrono, e a resposta tem o mesmo JSON.
+"""
+import functools
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from rest_framework.request import Request
+from rest_framework.utils.encoders import JSONEncoder
+
+from .cache import EMPLOYEES, PRODUCTS, SALES, STOCK, STOCK_REFERENCES, acached_list, astock_reset_at
+from .feed import authenticate
+from .models import DailySalesRollup, StockReference
+from .pagination import KeysetPagination
+from .serializers import NotificationSerializer, ProductListSerializer
+from .views import (
+    PRODUCT_VALUE_TOTAL, SALES_TOTALS, AggregateSalesByDateViewSet, ProductViewSet, SalesByEmployee,
+    StockManagerViewSet, TotalProductValueView, TotalSalesAndAcquisitionValueView, employee_notifications,
+    leaderboard_queryset, leaderboard_row, notifications_queryset, product_list_queryset, product_value_queryset,
+    sales_by_date_queryset, sales_totals_response, stock_changes, stock_list_queryset, stock_list_row,
+)
+
+
+def json_response(data, status=200):
+    # Mesmo encoder e formato do JSONRenderer do DRF, para o JSON sair idêntico
+    return JsonResponse(
+        data, status=status, safe=False, encoder=JSONEncoder,
+        json_dumps_params={'ensure_ascii': False, 'separators': (',', ':')},
+    )
+
+
+def async_api_view(sync_view):
+    """
+    Autentica como o DRF (JWT, sessão, ...) e atende o GET de forma
+    assíncrona; os demais métodos vão para a view síncrona original.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return await sync_to_async(sync_view)(request, *args, **kwargs)
+
+            user = await sync_to_async(authenticate)(request)
+            if user is None:
+                return json_response({'detail': 'Authentication credentials were not provided.'}, status=401)
+            request.user = user
+            return await view(Request(request), *args, **kwargs)
+        # Como nas views do DRF: a autenticação por token dispensa o CSRF
+        wrapper.csrf_exempt = True
+        return wrapper
+    return decorator
+
+
+@async_api_view(ProductViewSet.as_view({'get': 'list', 'post': 'create'}))
+@acached_list(PRODUCTS, STOCK_REFERENCES)
+async def product_list(request):
+    queryset = product_list_queryset(await StockReference.aget_active())
+
+    paginator = KeysetPagination(ordering=('name', 'id'))
+    page = await paginator.apaginate_queryset(queryset, request)
+    if page is not None:
+        return json_response({
+            'next': paginator.get_next_link(),
+            'results': ProductListSerializer(page, many=True).data,
+        })
+
+    products = [row async for row in queryset.order_by('name', 'id')]
+    return json_response(ProductListSerializer(products, many=True).data)
+
+
+@async_api_view(StockManagerViewSet.as_view({'get': 'list', 'post': 'create'}))
+@acached_list(STOCK, PRODUCTS, STOCK_REFERENCES, EMPLOYEES)
+async def stock_list(request):
+    if 'since' in request.query_params:
+        try:
+            version, full, queryset = stock_changes(request.query_params['since'], await astock_reset_at())
+        except ValueError as e:
+            return json_response({"error": str(e)}, status=400)
+        return json_response({
+            'version': version,
+            'full': full,
+            'results': [stock_list_row(item) async for item in queryset],
+        })
+
+    return json_response([stock_list_row(item) async for item in stock_list_queryset()])
+
+
+@async_api_view(employee_notifications)
+async def notification_list(request):
+    stock_reference = await StockReference.aget_active()
+    notifications = [notification async for notification in notifications_queryset(stock_reference, request)]
+    return json_response(NotificationSerializer(notifications, many=True).data)
+
+
+@async_api_view(TotalSalesAndAcquisitionValueView.as_view())
+async def sales_totals(request):
+    try:
+        stock_reference = await StockReference.aget_active()
+        totals = await DailySalesRollup.objects.filter(stock_reference=stock_reference).aaggregate(**SALES_TOTALS)
+        return json_response(sales_totals_response(totals))
+    except Exception as e:
+        return json_response({"error": str(e)}, status=400)
+
+
+@async_api_view(TotalProductValueView.as_view())
+async def product_value(request):
+    stock_reference = await StockReference.aget_active()
+    totals = await product_value_queryset(stock_reference).aaggregate(**PRODUCT_VALUE_TOTAL)
+    return json_response({"total_stock_value": totals['total_stock_value'] or 0})
+
+
+@async_api_view(AggregateSalesByDateViewSet.as_view({'get': 'list'}))
+@acached_list(SALES, PRODUCTS)
+async def sales_by_date(request):
+    return json_response([row async for row in sales_by_date_queryset()])
+
+
+@async_api_view(SalesByEmployee.as_view({'get': 'list'}))
+async def sales_by_employee(request):
+    try:
+        ranking = leaderboard_queryset(request)
+    except ValueError as e:
+        return json_response({"error": str(e)}, status=400)
+    return json_response([leaderboard_row(row) async for row in ranking])
@@ -0,0 +1,177 @@
+"""
+Cache das listagens de produtos, estoque, estoques e vendas por data.
+
+Cada grupo de dados tem uma versão guardada no cache do Django. A chave de
+uma resposta inclui a versão dos grupos de que ela depende, então uma escrita
+só precisa trocar essas versões (bump) para que as respostas antigas deixem
+de ser usadas. O bump é feito pelos signals de orders/signals.py e, nos
+caminhos em lote que não disparam signals (update, bulk_create,
+bulk_update), explicitamente.
+
+A versão também gera o ETag e a hora do bump o Last-Modified, para que o
+cliente que já tem a resposta receba um 304 sem nenhuma consulta ao banco.
+
+As versões só valem para todos os workers porque o cache é compartilhado:
+com mais de um worker o settings exige o Redis (WEB_CONCURRENCY).
+"""
+import functools
+import hashlib
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+# Grupos de dados com versão própria
+PRODUCTS = 'products'
+STOCK = 'stock'
+STOCK_REFERENCES = 'stock-references'
+SALES = 'sales'
+EMPLOYEES = 'employees'
+
+
+def _version_key(group):
+    return f'orders:cache:version:{group}'
+
+
+def _new_version():
+    return (uuid.uuid4().hex, int(time.time()))
+
+
+def _set_versions(groups):
+    cache.set_many({_version_key(group): _new_version() for group in groups}, timeout=None)
+
+
+def bump(*groups):
+    """
+    Invalida as respostas em cache dos grupos. Troca a versão agora e de novo
+    após o commit, para que nenhuma requisição concorrente guarde os dados de
+    antes do commit com a versão nova.
+    """
+    _set_versions(groups)
+    transaction.on_commit(functools.partial(_set_versions, groups))
+
+
+def get_versions(groups):
+    keys = {_version_key(group): group for group in groups}
+    found = cache.get_many(keys)
+    for key in keys.keys() - found.keys():
+        version = _new_version()
+        # Outro processo pode ter criado a versão ao mesmo tempo; vale a que ficou
+        cache.add(key, version, timeout=None)
+        found[key] = cache.get(key, version)
+    return {keys[key]: version for key, version in found.items()}
+
+
+async def aget_versions(groups):
+    keys = {_version_key(group): group for group in groups}
+    found = await cache.aget_many(keys)
+    for key in keys.keys() - found.keys():
+        version = _new_version()
+        await cache.aadd(key, version, timeout=None)
+        found[key] = await cache.aget(key, version)
+    return {keys[key]: version for key, version in found.items()}
+
+
+def response_key(request, versions, suffix):
+    """Chave da resposta em cache, ETag e Last-Modified para a URL e as versões"""
+    tokens = [versions[group][0] for group in sorted(versions)]
+    query = sorted((name, request.GET.getlist(name)) for name in request.GET)
+    digest = hashlib.sha1(repr((request.get_host(), request.path, query, tokens)).encode('utf-8')).hexdigest()
+    last_modified = max(version[1] for version in versions.values())
+    return f'orders:cache:response:{suffix}:{digest}', quote_etag(digest), last_modified
+
+
+def add_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    # O navegador guarda a resposta, mas sempre revalida com o ETag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def cached_list(*groups):
+    """
+    Decorator para o list() de uma view do DRF: responde 304 quando o
+    cliente já tem a versão atual, senão usa os dados em cache e só chama a
+    view quando eles não existem. Só respostas 200 são guardadas.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            key, etag, last_modified = response_key(request, get_versions(groups), 'data')
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                data = cache.get(key)
+                if data is not None:
+                    response = Response(data)
+                else:
+                    response = method(view, request, *args, **kwargs)
+                    if response.status_code != 200:
+                        return response
+                    cache.set(key, response.data, settings.API_CACHE_TIMEOUT)
+            return add_validators(response, etag, last_modified)
+        return wrapper
+    return decorator
+
+
+def acached_list(*groups):
+    """Versão de cached_list para as views de async_views; guarda o JSON já pronto"""
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            key, etag, last_modified = response_key(request, await aget_versions(groups), 'json')
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                content = await cache.aget(key)
+                if content is not None:
+                    response = HttpResponse(content, content_type='application/json')
+                else:
+                    response = await view(request, *args, **kwargs)
+                    if response.status_code != 200:
+                        return response
+                    await cache.aset(key, response.content, settings.API_CACHE_TIMEOUT)
+            return add_validators(response, etag, last_modified)
+        return wrapper
+    return decorator
+
+
+# Modo incremental da listagem de estoque (?since=): remoções e mudanças de
+# estoque ativo não aparecem como linhas alteradas, então o cliente que
+# sincronizou antes delas recebe a listagem completa
+STOCK_RESET_KEY = 'orders:cache:stock-reset'
+
+
+def _set_stock_reset():
+    cache.set(STOCK_RESET_KEY, timezone.now(), timeout=None)
+
+
+def mark_stock_reset():
+    """Força listagem completa para quem sincronizou antes de agora (e de novo no commit)"""
+    _set_stock_reset()
+    transaction.on_commit(_set_stock_reset)
+
+
+def stock_reset_at():
+    value = cache.get(STOCK_RESET_KEY)
+    if value is None:
+        # Sem o registro (cache limpo) não dá para saber: todos recebem a listagem completa
+        value = timezone.now()
+        cache.add(STOCK_RESET_KEY, value, timeout=None)
+        value = cache.get(STOCK_RESET_KEY, value)
+    return value
+
+
+async def astock_reset_at():
+    value = await cache.aget(STOCK_RESET_KEY)
+    if value is None:
+        value = timezone.now()
+        await cache.aadd(STOCK_RESET_KEY, value, timeout=None)
+        value = await cache.aget(STOCK_RESET_KEY, value)
+    return value
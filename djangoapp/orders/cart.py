@@ -0,0 +1,371 @@
+"""
+Carrinho mantido no cache, por usuário, com gravação adiada no banco.
+
+O carrinho vivo fica no cache do Django; adicionar e ler itens não consulta
+o banco no caminho comum. Os itens são validados contra um retrato do
+estoque ativo (quantidade, disponibilidade, nome e preço) também em cache,
+refeito quando a versão de estoque ou de produtos muda (orders.cache). A
+venda confere o estoque de novo, com a linha bloqueada, então um retrato um
+pouco atrasado nunca vende mais do que existe.
+
+Toda alteração do carrinho de um usuário roda com a trava dele (locked(),
+um cache.add com prazo), então duas requisições simultâneas não perdem
+itens uma da outra. O cache guarda, além dos itens, o que já está gravado
+(`saved`); a gravação em lote, feita por uma thread a cada
+CART_FLUSH_INTERVAL segundos e sempre na venda, grava só os itens que
+mudaram desde então e nunca apaga linhas. A remoção de um item apaga a
+linha na hora. Os ids dos itens são gerados aqui e usados no banco, então a
+remoção por id funciona antes e depois da gravação.
+"""
+import atexit
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.db.models import F
+
+from .cache import PRODUCTS, STOCK, get_versions
+from .models import Cart, CartItem, Product, Stock
+
+# Um carrinho parado sai do cache depois disto (já gravado no banco)
+CART_TIMEOUT = 24 * 60 * 60
+# A trava de um carrinho expira sozinha se o processo morrer com ela
+LOCK_TIMEOUT = 10
+# Quanto uma requisição espera pela trava antes de desistir com 409
+LOCK_WAIT = 5
+
+# O add do cache em arquivo não é atômico entre threads; com vários
+# processos o settings exige o Redis, em que ele é
+_add_lock = threading.Lock()
+
+
+class CartError(ValueError):
+    """Erro ao alterar o carrinho, com o status HTTP que a view deve devolver."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _key(user_id):
+    return f'orders:cart:{user_id}'
+
+
+def _lock_key(user_id):
+    return f'orders:cart:lock:{user_id}'
+
+
+def _acquire(user_id, wait):
+    """Tenta pegar a trava do carrinho por até `wait` segundos; retorna o token ou None"""
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + wait
+    while True:
+        with _add_lock:
+            if cache.add(_lock_key(user_id), token, LOCK_TIMEOUT):
+                return token
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(0.01)
+
+
+def _release(user_id, token):
+    if cache.get(_lock_key(user_id)) == token:
+        cache.delete(_lock_key(user_id))
+
+
+@contextmanager
+def locked(user_id):
+    """Trava o carrinho do usuário (entre processos, pelo cache) durante o bloco"""
+    token = _acquire(user_id, LOCK_WAIT)
+    if token is None:
+        raise CartError("Carrinho em uso por outra requisição; tente novamente.", status_code=409)
+    try:
+        yield
+    finally:
+        _release(user_id, token)
+
+
+def stock_snapshot(stock_reference):
+    """Estoque do estoque ativo por id de produto, refeito só quando estoque ou produtos mudam"""
+    versions = get_versions((STOCK, PRODUCTS))
+    key = f'orders:cart:stock:{stock_reference.id}:{versions[STOCK][0]}:{versions[PRODUCTS][0]}'
+    snapshot = cache.get(key)
+    if snapshot is None:
+        rows = Stock.objects.filter(stock_reference=stock_reference).values(
+            'product_id', 'quantity', 'available', name=F('product__name'), price=F('product__price'),
+        )
+        snapshot = {str(row.pop('product_id')): row for row in rows}
+        cache.set(key, snapshot, settings.API_CACHE_TIMEOUT)
+    return snapshot
+
+
+def load(user, create=True):
+    """Carrinho do usuário (do cache ou, na primeira vez, do banco); None se não existe e create=False"""
+    entry = cache.get(_key(user.id))
+    if entry is None:
+        cart = Cart.objects.filter(user=user).order_by('created_at').first()
+        if cart is None:
+            if not create:
+                return None
+            cart = Cart.objects.create(user=user)
+        items = {
+            str(product_id): {'id': str(item_id), 'quantity': quantity}
+            for item_id, product_id, quantity in CartItem.objects.filter(cart__user=user).values_list(
+                'id', 'product_id', 'quantity'
+            )
+        }
+        entry = {
+            'cart_id': str(cart.id),
+            'user_id': user.id,
+            'created_at': cart.created_at,
+            'items': items,
+            'saved': {product_id: (item['id'], item['quantity']) for product_id, item in items.items()},
+        }
+        # add: não sobrescreve o carrinho que outra requisição pôs no cache enquanto este era lido
+        if not cache.add(_key(user.id), entry, CART_TIMEOUT):
+            entry = cache.get(_key(user.id)) or entry
+    return entry
+
+
+def _pending(entry):
+    """Itens alterados desde a última gravação"""
+    saved = entry.get('saved', {})
+    return [
+        (product_id, item)
+        for product_id, item in entry['items'].items()
+        if saved.get(product_id) != (item['id'], item['quantity'])
+    ]
+
+
+def add(user, product_id, quantity, stock_reference):
+    """Soma `quantity` do produto ao carrinho; retorna (dados do produto no estoque, quantidade no carrinho)"""
+    try:
+        product_id = str(uuid.UUID(str(product_id)))
+    except ValueError:
+        raise CartError("Produto não encontrado.", status_code=404)
+
+    stock = stock_snapshot(stock_reference).get(product_id)
+    if stock is None:
+        if not Product.objects.filter(id=product_id).exists():
+            raise CartError("Produto não encontrado.", status_code=404)
+        raise CartError("Produto não está disponível em estoque.", status_code=404)
+
+    if not stock['available']:
+        raise CartError("Produto não está disponível para adicionar ao carrinho.")
+    if quantity > stock['quantity']:
+        raise CartError("A quantidade solicitada excede o estoque disponível.")
+
+    with locked(user.id):
+        entry = load(user)
+        item = entry['items'].get(product_id)
+        if item is None:
+            item = entry['items'][product_id] = {'id': str(uuid.uuid4()), 'quantity': quantity}
+        else:
+            if item['quantity'] + quantity > stock['quantity']:
+                raise CartError("A quantidade total excede o estoque disponível.")
+            item['quantity'] += quantity
+        cache.set(_key(user.id), entry, CART_TIMEOUT)
+    flusher.mark(user.id)
+    return stock, item['quantity']
+
+
+def remove(user, item_id):
+    """Remove o item pelo id, do cache e do banco; retorna False se ele não está no carrinho"""
+    with locked(user.id):
+        entry = load(user)
+        for product_id, item in entry['items'].items():
+            if item['id'] == str(item_id):
+                CartItem.objects.filter(id=item['id']).delete()
+                del entry['items'][product_id]
+                entry.get('saved', {}).pop(product_id, None)
+                cache.set(_key(user.id), entry, CART_TIMEOUT)
+                return True
+    return False
+
+
+def items(entry, stock_reference):
+    """Itens do carrinho com nome e preço do produto, do retrato do estoque"""
+    snapshot = stock_snapshot(stock_reference) if stock_reference else {}
+    # Produto fora do estoque ativo: uma consulta só para os que faltam
+    missing = [product_id for product_id in entry['items'] if product_id not in snapshot]
+    if missing:
+        snapshot = dict(snapshot)
+        for product in Product.objects.filter(id__in=missing).values('id', 'name', 'price'):
+            snapshot[str(product['id'])] = product
+
+    return [
+        {
+            'id': item['id'],
+            'product_id': product_id,
+            'product_name': snapshot[product_id]['name'],
+            'product_price': snapshot[product_id]['price'],
+            'quantity': item['quantity'],
+        }
+        for product_id, item in entry['items'].items()
+        if product_id in snapshot
+    ]
+
+
+def _write(entries):
+    """
+    Grava no banco os itens alterados dos carrinhos (com as travas já
+    tomadas), na transação atual. Retorna o que foi gravado, por usuário.
+    """
+    pending = {entry['user_id']: (entry, _pending(entry)) for entry in entries}
+    pending = {user_id: value for user_id, value in pending.items() if value[1]}
+    if not pending:
+        return {}
+
+    carts = set(
+        Cart.objects.filter(id__in=[entry['cart_id'] for entry, _ in pending.values()]).values_list('id', flat=True)
+    )
+    product_ids = {product_id for _, changed in pending.values() for product_id, _ in changed}
+    existing_products = {
+        str(product_id) for product_id in Product.objects.filter(id__in=product_ids).values_list('id', flat=True)
+    }
+    CartItem.objects.bulk_create(
+        [
+            CartItem(id=item['id'], cart_id=entry['cart_id'], product_id=product_id, quantity=item['quantity'])
+            for entry, changed in pending.values()
+            if uuid.UUID(entry['cart_id']) in carts
+            for product_id, item in changed
+            if product_id in existing_products
+        ],
+        update_conflicts=True, unique_fields=['id'], update_fields=['quantity'],
+    )
+    return {
+        user_id: {product_id: (item['id'], item['quantity']) for product_id, item in changed}
+        for user_id, (_, changed) in pending.items()
+    }
+
+
+def _mark_saved(written):
+    """Registra no cache o que foi gravado (depois do commit)"""
+    for user_id, saved in written.items():
+        token = _acquire(user_id, LOCK_WAIT)
+        if token is None:
+            # Os itens continuam pendentes e são regravados (upsert) na próxima vez
+            continue
+        try:
+            entry = cache.get(_key(user_id))
+            if entry is None:
+                continue
+            entry.setdefault('saved', {}).update({
+                product_id: value for product_id, value in saved.items()
+                if product_id in entry['items'] and entry['items'][product_id]['id'] == value[0]
+            })
+            cache.set(_key(user_id), entry, CART_TIMEOUT)
+        finally:
+            _release(user_id, token)
+
+
+def flush(user_ids):
+    """
+    Grava no banco, numa transação, os itens alterados dos carrinhos em
+    cache. Carrinhos travados por uma requisição ficam para a próxima vez;
+    retorna os usuários que ficaram.
+    """
+    tokens = {}
+    busy = set()
+    for user_id in user_ids:
+        token = _acquire(user_id, 0)
+        if token is None:
+            busy.add(user_id)
+        else:
+            tokens[user_id] = token
+    if not tokens:
+        return busy
+
+    try:
+        entries = list(cache.get_many([_key(user_id) for user_id in tokens]).values())
+        with transaction.atomic():
+            written = _write(entries)
+    finally:
+        for user_id, token in tokens.items():
+            _release(user_id, token)
+    # Só depois do commit; se uma transação externa desfizer a gravação, os itens continuam pendentes
+    transaction.on_commit(partial(_mark_saved, written))
+    return busy
+
+
+def checkout(user, sell):
+    """
+    Vende o carrinho: com o carrinho travado, grava os itens pendentes e
+    chama sell() na mesma transação. O carrinho sai do cache dentro da
+    transação e de novo após o commit; se a venda falhar, nada muda.
+    """
+    with locked(user.id):
+        with transaction.atomic():
+            entry = cache.get(_key(user.id))
+            if entry is not None:
+                _write([entry])
+            result = sell()
+            discard(user.id)
+            transaction.on_commit(partial(discard, user.id))
+    return result
+
+
+def discard(user_id):
+    """Tira o carrinho do cache; a próxima leitura carrega do banco"""
+    cache.delete(_key(user_id))
+
+
+def clear(user):
+    """Esvazia o carrinho no banco e no cache"""
+    with locked(user.id):
+        with transaction.atomic():
+            CartItem.objects.filter(cart__user=user).delete()
+            discard(user.id)
+            transaction.on_commit(partial(discard, user.id))
+
+
+class CartFlusher:
+    """Thread que grava em lote os carrinhos alterados neste processo"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dirty = set()
+        self._thread = None
+        atexit.register(self.flush)
+
+    @property
+    def interval(self):
+        return getattr(settings, 'CART_FLUSH_INTERVAL', 5.0)
+
+    def mark(self, user_id):
+        if not self.interval:
+            # Modo síncrono (testes, scripts): grava na própria requisição
+            flush([user_id])
+            return
+        with self._lock:
+            self._dirty.add(user_id)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='cart-flusher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            user_ids, self._dirty = self._dirty, set()
+        try:
+            busy = flush(user_ids)
+        except Exception:
+            # Tenta de novo no próximo ciclo; o carrinho continua no cache
+            busy = user_ids
+        finally:
+            close_old_connections()
+        if busy:
+            with self._lock:
+                self._dirty |= busy
+
+
+flusher = CartFlusher()
@@ -0,0 +1,156 @@
+import asyncio
+import threading
+from collections import defaultdict
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+
+# Eventos ficam no cache por este tempo; um cliente mais atrasado recebe um snapshot
+EVENT_TTL = 10 * 60
+# Com vários workers a notificação em processo não chega aos outros; eles
+# conferem a versão no cache (sem tocar no banco) neste intervalo
+BROKER_POLL_INTERVAL = 1.0
+
+
+def _key(stock_reference_id, suffix):
+    return f'orders:feed:{stock_reference_id}:{suffix}'
+
+
+class Hub:
+    """Fan-out em processo: acorda os clientes (asyncio) à espera de um estoque"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters = defaultdict(set)
+
+    async def wait(self, channel, timeout):
+        """Espera até `timeout` segundos por um notify(channel); retorna True se houve aviso"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        waiter = (loop, future)
+        with self._lock:
+            self._waiters[channel].add(waiter)
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self._lock:
+                self._waiters[channel].discard(waiter)
+                if not self._waiters[channel]:
+                    del self._waiters[channel]
+
+    def notify(self, channel):
+        # Pode ser chamado de qualquer thread (sinais rodam fora do event loop)
+        with self._lock:
+            waiters = list(self._waiters.get(channel, ()))
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_wake, future)
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+hub = Hub()
+
+
+class CacheBroker:
+    """
+    Broker local sobre o cache do Django.
+
+    Cada estoque tem um contador de versão (cache.incr) e cada evento fica
+    numa chave própria com a sua versão, então os leitores nunca consultam o
+    banco para saber se algo mudou.
+
+    Duas publicações nunca podem receber a mesma versão. No Redis o incr é
+    atômico entre processos; no locmem e no arquivo é uma leitura seguida de
+    gravação, atômica só com a trava do processo abaixo. Por isso o settings
+    exige o Redis com mais de um worker (WEB_CONCURRENCY).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def publish(self, stock_reference_id, kind, data):
+        version_key = _key(stock_reference_id, 'version')
+        with self._lock:
+            cache.add(version_key, 0, timeout=None)
+            try:
+                version = cache.incr(version_key)
+            except ValueError:
+                # A chave expirou entre o add e o incr
+                cache.set(version_key, 1, timeout=None)
+                version = 1
+            cache.set(_key(stock_reference_id, f'event:{version}'), {'kind': kind, 'data': data}, EVENT_TTL)
+        hub.notify(str(stock_reference_id))
+        return version
+
+    def current_version(self, stock_reference_id):
+        return cache.get(_key(stock_reference_id, 'version'), 0)
+
+    async def acurrent_version(self, stock_reference_id):
+        return await cache.aget(_key(stock_reference_id, 'version'), 0)
+
+    def events_since(self, stock_reference_id, since, version):
+        """
+        Eventos com versão em (since, version], em ordem.
+
+        Retorna None quando algum deles já não está no cache (cliente muito
+        atrasado, cache reiniciado) e o cliente precisa de um snapshot.
+        """
+        if since is None or since > version:
+            return None
+        keys = [_key(stock_reference_id, f'event:{number}') for number in range(since + 1, version + 1)]
+        if not keys:
+            return []
+        found = cache.get_many(keys)
+        if len(found) != len(keys):
+            return None
+        return [dict(found[key], version=number) for number, key in zip(range(since + 1, version + 1), keys)]
+
+    async def wait_for_change(self, stock_reference_id, version, timeout):
+        """Espera a versão do estoque mudar; retorna a versão atual (igual à recebida se nada mudou)"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            current = await self.acurrent_version(stock_reference_id)
+            if current != version:
+                return current
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return current
+            await hub.wait(str(stock_reference_id), min(remaining, BROKER_POLL_INTERVAL))
+
+
+broker = CacheBroker()
+
+
+def publish(stock_reference_id, kind, data):
+    """Publica um evento do estoque depois do commit da transação atual"""
+    if stock_reference_id is None:
+        return
+    transaction.on_commit(partial(broker.publish, stock_reference_id, kind, data), robust=True)
+
+
+def notification_event(notification):
+    return {
+        'id': str(notification.id),
+        'employee': str(notification.employee_id),
+        'message': notification.message,
+        'product_description': notification.product_description,
+        'is_read': notification.is_read,
+        'created_at': notification.created_at.isoformat() if notification.created_at else None,
+    }
+
+
+def stock_event(stock):
+    return {
+        'id': str(stock.id),
+        'product': str(stock.product_id),
+        'quantity': stock.quantity,
+        'available': stock.available,
+    }
@@ -0,0 +1,338 @@
+import csv
+import datetime
+import json
+import re
+import uuid
+import zipfile
+from collections import deque
+from concurrent.futures import Future
+from decimal import Decimal
+from itertools import groupby
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import UUIDField
+from django.db.models.functions import Coalesce
+from django.utils.dateparse import parse_datetime
+from django.utils.text import slugify
+
+from .models import ActionHistory, SaleHistory
+from .pagination import KeysetPagination
+from .pdf import render_sales_report
+from .reports import get_executor
+
+CHUNK_SIZE = 2000
+
+FORMATS = ('pdf', 'csv', 'xlsx')
+
+COLUMNS = (
+    'date', 'employee_id', 'employee_name', 'product_name', 'sale_quantity', 'product_price', 'sale_total_value',
+)
+HEADERS = ('Data', 'Funcionário (id)', 'Funcionário', 'Produto', 'Quantidade', 'Preço unitário', 'Total')
+
+CONTENT_TYPES = {
+    'pdf': 'application/zip',
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+EXTENSIONS = {'pdf': 'zip', 'csv': 'csv', 'xlsx': 'xlsx', 'ndjson': 'ndjson'}
+
+# Tabelas brutas para o BI: colunas exportadas e a ordem que serve de marca d'água
+HISTORY_TABLES = {
+    'sale-history': {
+        'model': SaleHistory,
+        'columns': (
+            'id', 'date', 'sale_id', 'stock_reference_id', 'product_id', 'product_name', 'product_price',
+            'product_acquisition_value', 'sale_quantity', 'sale_total_value', 'employee_id', 'employee_name',
+            'employee_email', 'employee_address',
+        ),
+        'ordering': ('id',),
+    },
+    'action-history': {
+        'model': ActionHistory,
+        'columns': ('id', 'action_date_timestamp', 'employee_id', 'action', 'sale_id'),
+        'ordering': ('action_date_timestamp', 'id'),
+    },
+}
+HISTORY_FORMATS = ('csv', 'ndjson')
+
+# Caracteres de controle que não podem aparecer num XML
+_INVALID_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def export_rows(date_from, date_to, employee_ids=None, stock_reference=None):
+    """
+    Linhas de SaleHistory do intervalo, ordenadas por funcionário e data.
+
+    Lidas com iterator() em blocos de CHUNK_SIZE, então a exportação nunca
+    carrega o período inteiro na memória.
+    """
+    histories = SaleHistory.objects.filter(date__gte=date_from, date__lte=date_to)
+    if employee_ids:
+        histories = histories.filter(employee_id__in=employee_ids)
+    if stock_reference is not None:
+        histories = histories.filter(stock_reference=stock_reference)
+    return (
+        histories
+        .order_by('employee_id', 'date', 'id')
+        .values_list(*COLUMNS, 'employee_address')
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+def stream_export(fmt, rows):
+    """Gera os bytes do arquivo no formato pedido (pdf devolve um ZIP com um PDF por funcionário)"""
+    if fmt == 'csv':
+        return stream_csv(rows)
+    if fmt == 'xlsx':
+        return stream_xlsx(rows)
+    if fmt == 'pdf':
+        return stream_pdf_zip(rows)
+    raise ValueError(f"Formato desconhecido: {fmt}")
+
+
+def history_rows(table, since=None, since_id=None):
+    """
+    Linhas de SaleHistory ou ActionHistory depois da marca d'água, em ordem.
+
+    Em sale-history `since` é o último id recebido. Em action-history é o
+    último action_date_timestamp (ISO 8601), opcionalmente com `since_id` para
+    desempatar linhas com o mesmo instante. Levanta ValueError se a marca for
+    inválida.
+    """
+    config = HISTORY_TABLES[table]
+    queryset = config['model'].objects.order_by(*config['ordering'])
+
+    if since:
+        if table == 'sale-history':
+            queryset = queryset.filter(id__gt=int(since))
+        else:
+            timestamp = parse_datetime(since)
+            if timestamp is None:
+                raise ValueError(f"Data e hora inválida: {since}")
+            if since_id:
+                # (timestamp, id) > (since, since_id), o mesmo filtro da paginação por chave
+                paginator = KeysetPagination(ordering=config['ordering'])
+                queryset = queryset.filter(paginator.build_filter([timestamp, uuid.UUID(since_id)]))
+            else:
+                queryset = queryset.filter(action_date_timestamp__gt=timestamp)
+
+    # Vendas arquivadas deixam sale_id vazio e o id em archived_sale_id
+    columns = [
+        Coalesce('sale_id', 'archived_sale_id', output_field=UUIDField()) if column == 'sale_id' else column
+        for column in config['columns']
+    ]
+    return queryset.values_list(*columns).iterator(chunk_size=CHUNK_SIZE)
+
+
+def stream_table(columns, rows, fmt):
+    """CSV (com cabeçalho) ou JSON por linha, em blocos de 500 linhas"""
+    buffer = _TextBuffer()
+    if fmt == 'csv':
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        write = writer.writerow
+    else:
+        encoder = _ExportEncoder(ensure_ascii=False, separators=(',', ':'))
+
+        def write(row):
+            buffer.write(encoder.encode(dict(zip(columns, row))))
+            buffer.write('\n')
+
+    for index, row in enumerate(rows, start=1):
+        write(row)
+        if index % 500 == 0:
+            yield buffer.drain()
+    yield buffer.drain()
+
+
+class _ExportEncoder(DjangoJSONEncoder):
+    """Mantém os microssegundos, que o DjangoJSONEncoder corta, para `since` não repetir linhas"""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class _StreamBuffer:
+    """Arquivo só de escrita; o gerador esvazia o buffer a cada bloco"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+class _TextBuffer:
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(data)
+
+    def drain(self):
+        data = ''.join(self.chunks).encode('utf-8')
+        self.chunks = []
+        return data
+
+
+def stream_csv(rows):
+    buffer = _TextBuffer()
+    writer = csv.writer(buffer)
+    # BOM para o Excel abrir os acentos corretamente
+    yield '\ufeff'.encode('utf-8')
+    writer.writerow(HEADERS)
+    for index, row in enumerate(rows, start=1):
+        writer.writerow(row[:len(COLUMNS)])
+        if index % 500 == 0:
+            yield buffer.drain()
+    yield buffer.drain()
+
+
+def stream_pdf_zip(rows):
+    """
+    Um PDF por funcionário, renderizados no pool de orders.reports.
+
+    Os PDFs são enviados ao pool à medida que cada funcionário termina de ser
+    lido e entram no ZIP na mesma ordem; no máximo 2 por worker ficam em
+    andamento, o que limita a memória usada.
+    """
+    buffer = _StreamBuffer()
+    executor = get_executor()
+    max_pending = 2 * max(getattr(settings, 'REPORTS_MAX_WORKERS', 2), 1)
+    pending = deque()
+    names = set()
+
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for employee_id, group in groupby(rows, key=lambda row: row[1]):
+            group = list(group)
+            employee_name, employee_address = group[0][2], group[0][7]
+            payload = {
+                'invoice_number': f"EMP-{employee_id}-{group[0][0]:%Y%m%d}-{group[-1][0]:%Y%m%d}",
+                'client_name': employee_name,
+                'client_address': [employee_address],
+                'rows': [
+                    (f"{sale_date:%d/%m} {product_name}", quantity, float(price))
+                    for sale_date, _, _, product_name, quantity, price, *_ in group
+                ],
+            }
+            pending.append((_archive_name(employee_name, employee_id, names), _render(executor, payload)))
+
+            while len(pending) >= max_pending:
+                name, future = pending.popleft()
+                archive.writestr(name, future.result())
+                yield buffer.drain()
+
+        while pending:
+            name, future = pending.popleft()
+            archive.writestr(name, future.result())
+            yield buffer.drain()
+
+    yield buffer.drain()
+
+
+def _render(executor, payload):
+    if executor is not None:
+        return executor.submit(render_sales_report, **payload)
+    # Sem pool (REPORTS_MAX_WORKERS = 0): renderiza aqui mesmo
+    future = Future()
+    future.set_result(render_sales_report(**payload))
+    return future
+
+
+def _archive_name(employee_name, employee_id, names):
+    name = f"{slugify(employee_name) or 'funcionario'}-{str(employee_id)[:8]}.pdf"
+    if name in names:
+        name = f"{slugify(employee_name) or 'funcionario'}-{employee_id}.pdf"
+    names.add(name)
+    return name
+
+
+_XLSX_STATIC = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Vendas" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def _xlsx_cell(value):
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        return f'<c><v>{value}</v></c>'
+    text = _INVALID_XML.sub('', str(value))
+    return f'<c t="inlineStr"><is><t>{escape(text)}</t></is></c>'
+
+
+def _xlsx_row(values):
+    return ('<row>' + ''.join(_xlsx_cell(value) for value in values) + '</row>').encode('utf-8')
+
+
+def stream_xlsx(rows):
+    """
+    Planilha XLSX mínima (uma aba, strings inline) escrita em fluxo.
+
+    O ZIP é gravado sem seek, com descritores de dados, então cada bloco de
+    linhas sai para o cliente assim que é comprimido.
+    """
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_STATIC.items():
+            archive.writestr(name, content)
+        yield buffer.drain()
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            sheet.write(_xlsx_row(HEADERS))
+            for index, row in enumerate(rows, start=1):
+                sale_date, employee_id, *rest = row[:len(COLUMNS)]
+                sheet.write(_xlsx_row([sale_date.isoformat(), str(employee_id), *rest]))
+                if index % 500 == 0:
+                    yield buffer.drain()
+            sheet.write(b'</sheetData></worksheet>')
+
+    yield buffer.drain()
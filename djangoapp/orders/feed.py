@@ -0,0 +1,148 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .events import broker, notification_event
+from .models import Notification, StockReference
+from .notifications import MAX_NOTIFICATIONS
+
+# Tempo máximo de espera do long-poll; fica abaixo do timeout usual dos proxies (60s)
+LONG_POLL_TIMEOUT = 25
+MAX_LONG_POLL_TIMEOUT = 55
+# Comentário enviado pelo SSE sem eventos, para manter a conexão viva
+SSE_HEARTBEAT = 15
+
+
+def authenticate(django_request, allow_query_token=False):
+    """
+    Autentica com as mesmas classes do DRF. O EventSource do navegador não
+    envia cabeçalhos, então notification_feed aceita o token JWT também em
+    ?token= (allow_query_token); nas demais views o token na URL acabaria
+    nos logs de acesso e dos proxies.
+    """
+    request = Request(
+        django_request,
+        authenticators=[authenticator() for authenticator in api_settings.DEFAULT_AUTHENTICATION_CLASSES],
+    )
+    try:
+        user = request.user
+    except APIException:
+        return None
+    if user is not None and user.is_authenticated:
+        return user
+
+    raw_token = django_request.GET.get('token') if allow_query_token else None
+    if raw_token:
+        authenticator = JWTAuthentication()
+        try:
+            return authenticator.get_user(authenticator.get_validated_token(raw_token))
+        except APIException:
+            return None
+    return None
+
+
+def snapshot(stock_reference_id):
+    """Alertas abertos do estoque, como em employee_notifications"""
+    notifications = (
+        Notification.objects
+        .filter(is_read=False, stock_reference_id=stock_reference_id)
+        .order_by('-created_at')[:MAX_NOTIFICATIONS]
+    )
+    return [notification_event(notification) for notification in notifications]
+
+
+def collect(stock_reference_id, since, version):
+    """Eventos desde `since` ou, se o cliente está atrasado demais, um snapshot (reset)"""
+    events = broker.events_since(stock_reference_id, since, version)
+    if events is not None:
+        return {'version': version, 'reset': False, 'events': events}
+    return {'version': version, 'reset': True, 'notifications': snapshot(stock_reference_id), 'events': []}
+
+
+def make_etag(stock_reference_id, version):
+    return f'"{stock_reference_id}:{version}"'
+
+
+def parse_etag(value, stock_reference_id):
+    """Versão contida no ETag, ou None se for de outro estoque ou inválido"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.startswith('W/'):
+        value = value[2:]
+    reference, _, version = value.strip('"').rpartition(':')
+    if reference != str(stock_reference_id):
+        return None
+    try:
+        return int(version)
+    except ValueError:
+        return None
+
+
+async def notification_feed(request):
+    """
+    Canal de notificações e mudanças de estoque do estoque ativo.
+
+    Long-poll: envie o ETag recebido em If-None-Match (ou ?since=); a
+    resposta só volta quando algo mudar, com os eventos novos, ou com 304
+    após `timeout` segundos. Com Accept: text/event-stream (ou ?stream=1) a
+    mesma informação é enviada como Server-Sent Events. Clientes parados só
+    consultam o cache, nunca o banco. Só é roteada no modo ASGI
+    (settings.ASYNC_VIEWS).
+    """
+    user = await sync_to_async(authenticate)(request, allow_query_token=True)
+    if user is None:
+        return JsonResponse({'error': 'Usuário não autenticado.'}, status=401)
+
+    stock_reference = await StockReference.aget_active()
+    if stock_reference is None:
+        return JsonResponse({'error': 'Nenhum estoque ativo encontrado.'}, status=404)
+    stock_reference_id = stock_reference.id
+
+    if request.GET.get('stream') or 'text/event-stream' in request.headers.get('Accept', ''):
+        since = parse_etag(request.headers.get('Last-Event-ID') or request.GET.get('since'), stock_reference_id)
+        response = StreamingHttpResponse(event_stream(stock_reference_id, since), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    since = parse_etag(request.headers.get('If-None-Match') or request.GET.get('since'), stock_reference_id)
+    try:
+        timeout = min(max(float(request.GET.get('timeout', LONG_POLL_TIMEOUT)), 0), MAX_LONG_POLL_TIMEOUT)
+    except ValueError:
+        timeout = LONG_POLL_TIMEOUT
+
+    version = await broker.acurrent_version(stock_reference_id)
+    if since == version:
+        version = await broker.wait_for_change(stock_reference_id, since, timeout)
+        if version == since:
+            response = HttpResponse(status=304)
+            response['ETag'] = make_etag(stock_reference_id, version)
+            return response
+
+    payload = await sync_to_async(collect)(stock_reference_id, since, version)
+    response = JsonResponse(payload, encoder=DjangoJSONEncoder)
+    response['ETag'] = make_etag(stock_reference_id, version)
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+async def event_stream(stock_reference_id, since):
+    yield 'retry: 3000\n\n'
+    while True:
+        version = await broker.acurrent_version(stock_reference_id)
+        if since is None or version != since:
+            payload = await sync_to_async(collect)(stock_reference_id, since, version)
+            data = json.dumps(payload, cls=DjangoJSONEncoder)
+            yield f'id: {make_etag(stock_reference_id, version)}\nevent: feed\ndata: {data}\n\n'
+            since = version
+
+        version = await broker.wait_for_change(stock_reference_id, since, SSE_HEARTBEAT)
+        if version == since:
+            yield ': ping\n\n'
@@ -0,0 +1,181 @@
+"""
+Header Idempotency-Key nas views que gravam (vendas, carrinho, estoque,
+produtos).
+
+O frontend reenvia o POST quando a resposta demora; com a mesma chave, o
+reenvio recebe a resposta guardada da primeira vez, sem rodar a view de
+novo, com o header Idempotent-Replayed: true.
+
+A chave vale por usuário e fica IDEMPOTENCY_KEY_TTL segundos no cache (o
+caminho comum do reenvio, sem consulta ao banco) e na tabela IdempotencyKey.
+A linha da tabela é criada antes de a view rodar e serve de trava: um
+reenvio que chega enquanto a primeira requisição ainda roda recebe 409. A
+resposta é gravada na mesma transação da view, então ou as duas ficam ou
+nenhuma fica. Erros 5xx e exceções liberam a chave para uma nova tentativa.
+
+A mesma chave com outro método, caminho ou corpo recebe 422. O comando
+purge_idempotency_keys apaga as linhas expiradas.
+"""
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+REPLAY_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+# Uma chave em andamento há mais que isto é de uma requisição que morreu
+# (processo reiniciado, por exemplo) e pode ser assumida por um reenvio
+LOCK_TIMEOUT = timedelta(minutes=2)
+
+
+def ttl():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+
+
+def _cache_key(user_id, key):
+    digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+    return f'orders:idempotency:{user_id}:{digest}'
+
+
+def fingerprint(request):
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    payload = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True, default=str)
+    return hashlib.sha256(f'{request.method} {request.path}\n{payload}'.encode('utf-8')).hexdigest()
+
+
+def replay(status_code, data):
+    response = Response(data, status=status_code)
+    response[REPLAY_HEADER] = 'true'
+    return response
+
+
+def _mismatch():
+    return Response(
+        {"error": "Idempotency-Key já usada com outra requisição."},
+        status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+    )
+
+
+def _in_progress():
+    return Response(
+        {"error": "Requisição com esta Idempotency-Key ainda em andamento."},
+        status=status.HTTP_409_CONFLICT,
+    )
+
+
+def _stored(entry, request_fingerprint):
+    """Resposta de uma chave já usada: a guardada ou o erro de chave reutilizada"""
+    if entry['fingerprint'] != request_fingerprint:
+        return _mismatch()
+    return replay(entry['status_code'], entry['response'])
+
+
+def claim(user, key, request_fingerprint):
+    """
+    Reserva a chave para esta requisição. Retorna None se ela foi reservada
+    ou a resposta a devolver no lugar da view (guardada, 409 ou 422).
+    """
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            IdempotencyKey.objects.create(user=user, key=key, fingerprint=request_fingerprint, created_at=now)
+        return None
+    except IntegrityError:
+        pass
+
+    # Chave expirada, ou presa por uma requisição que não terminou: assume a linha
+    taken = IdempotencyKey.objects.filter(user=user, key=key).filter(
+        Q(created_at__lt=now - ttl()) | Q(status_code__isnull=True, created_at__lt=now - LOCK_TIMEOUT)
+    ).update(fingerprint=request_fingerprint, status_code=None, response=None, created_at=now)
+    if taken:
+        return None
+
+    entry = IdempotencyKey.objects.filter(user=user, key=key).values('fingerprint', 'status_code', 'response').first()
+    if entry is None or entry['status_code'] is None:
+        # Ainda em andamento (ou liberada agora mesmo; o cliente pode reenviar)
+        if entry is not None and entry['fingerprint'] != request_fingerprint:
+            return _mismatch()
+        return _in_progress()
+    cache.set(_cache_key(user.pk, key), entry, int(ttl().total_seconds()))
+    return _stored(entry, request_fingerprint)
+
+
+def release(user, key):
+    IdempotencyKey.objects.filter(user=user, key=key, status_code__isnull=True).delete()
+
+
+def idempotent(method):
+    """
+    Decorator para métodos de views do DRF que gravam: com o header
+    Idempotency-Key, a mesma chave devolve a mesma resposta sem rodar a
+    view de novo. Sem o header, nada muda.
+    """
+    @functools.wraps(method)
+    def wrapper(view, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key or not request.user.is_authenticated:
+            return method(view, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {"error": f"Idempotency-Key deve ter no máximo {MAX_KEY_LENGTH} caracteres."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        user = request.user
+        request_fingerprint = fingerprint(request)
+        entry = cache.get(_cache_key(user.pk, key))
+        if entry is not None:
+            return _stored(entry, request_fingerprint)
+
+        response = claim(user, key, request_fingerprint)
+        if response is not None:
+            return response
+
+        try:
+            with transaction.atomic():
+                response = method(view, request, *args, **kwargs)
+                if response.status_code < 500:
+                    entry = {
+                        'fingerprint': request_fingerprint,
+                        'status_code': response.status_code,
+                        'response': json.loads(json.dumps(response.data, cls=DjangoJSONEncoder)),
+                    }
+                    IdempotencyKey.objects.filter(user=user, key=key).update(
+                        status_code=entry['status_code'], response=entry['response'],
+                    )
+        except Exception:
+            release(user, key)
+            raise
+
+        if response.status_code >= 500:
+            release(user, key)
+        else:
+            cache.set(_cache_key(user.pk, key), entry, int(ttl().total_seconds()))
+        return response
+    return wrapper
+
+
+def expired(now=None):
+    """Chaves vencidas (IDEMPOTENCY_KEY_TTL)"""
+    return IdempotencyKey.objects.filter(created_at__lt=(now or timezone.now()) - ttl())
+
+
+def purge(now=None):
+    """Apaga as chaves vencidas; retorna quantas"""
+    deleted, _ = expired(now).delete()
+    return deleted
@@ -0,0 +1,165 @@
+import csv
+import io
+import json
+
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import PRODUCTS, bump
+from .models import Product, ProductHistory
+from .sync import record_many as record_sync_changes
+from .serializers import ProductImportRowSerializer
+
+BATCH_SIZE = 500
+MAX_STORED_ERRORS = 1000
+
+FORMATS = ('csv', 'jsonl')
+
+
+def guess_format(filename):
+    """Deduz o formato pelo nome do arquivo; CSV por padrão"""
+    if filename and filename.lower().endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    return 'csv'
+
+
+def read_rows(stream, fmt):
+    """
+    Lê as linhas de um arquivo binário sem carregá-lo inteiro na memória.
+
+    Gera (número da linha, dados) ou (número da linha, None) quando a linha
+    não pôde ser interpretada.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        if fmt == 'jsonl':
+            for row_number, line in enumerate(text, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    data = json.loads(line)
+                except ValueError:
+                    data = None
+                yield row_number, data if isinstance(data, dict) else None
+        else:
+            # A linha 1 é o cabeçalho
+            for row_number, data in enumerate(csv.DictReader(text), start=2):
+                yield row_number, data
+    finally:
+        text.detach()
+
+
+# Campos de um produto existente que a importação atualiza; a quantidade só
+# com update_quantities, para não apagar as vendas feitas desde a exportação
+UPDATE_FIELDS = ['name', 'price', 'acquisition_value', 'updated_at']
+
+
+def import_products(stream, fmt, job, stock_reference, batch_size=BATCH_SIZE, update_quantities=False):
+    """
+    Importa produtos em lotes, fazendo upsert por `description`.
+
+    Cada lote é validado em memória e gravado numa transação curta com
+    bulk_create(update_conflicts=True) mais os ProductHistory correspondentes.
+    Produtos novos entram no `stock_reference`; os existentes ficam no estoque
+    em que estão e só têm nome, preço e valor de aquisição atualizados (e a
+    quantidade, com update_quantities). O progresso e os erros por linha
+    ficam no `job` (ProductImport) a cada lote.
+    """
+    job.status = 'running'
+    job.save(update_fields=['status'])
+
+    batch = []
+    try:
+        for row_number, data in read_rows(stream, fmt):
+            job.processed_rows += 1
+            if data is None:
+                _add_error(job, row_number, {'non_field_errors': ['Linha inválida.']})
+                continue
+
+            serializer = ProductImportRowSerializer(data=data)
+            if not serializer.is_valid():
+                _add_error(job, row_number, serializer.errors)
+                continue
+
+            batch.append(serializer.validated_data)
+            if len(batch) >= batch_size:
+                _import_batch(batch, job, stock_reference, update_quantities)
+                batch = []
+                _save_progress(job)
+
+        if batch:
+            _import_batch(batch, job, stock_reference, update_quantities)
+        job.status = 'done'
+    except Exception as e:
+        job.status = 'failed'
+        _add_error(job, None, {'non_field_errors': [str(e)]})
+        raise
+    finally:
+        job.finished_at = timezone.now()
+        _save_progress(job)
+    return job
+
+
+def _import_batch(rows, job, stock_reference, update_quantities):
+    # Dentro do lote a última linha de cada descrição prevalece
+    rows_by_description = {row['description']: row for row in rows}
+
+    with transaction.atomic():
+        existing = dict(
+            Product.objects.filter(description__in=rows_by_description).values_list('description', 'id')
+        )
+
+        products = []
+        for description, row in rows_by_description.items():
+            product = Product(stock_reference=stock_reference, **row)
+            if description in existing:
+                product.id = existing[description]
+            products.append(product)
+
+        Product.objects.bulk_create(
+            products,
+            update_conflicts=True,
+            unique_fields=['description'],
+            update_fields=UPDATE_FIELDS + ['quantity'] if update_quantities else UPDATE_FIELDS,
+        )
+        bump(PRODUCTS)
+        record_sync_changes(Product, [product.id for product in products])
+
+        histories = {
+            history.product_id: history
+            for history in ProductHistory.objects.filter(product_id__in=existing.values())
+        }
+        new_histories = []
+        for product in products:
+            history = histories.get(product.id)
+            if history is None:
+                new_histories.append(ProductHistory(
+                    product_id=product.id,
+                    stock_reference=stock_reference,
+                    acquisition_value=product.acquisition_value,
+                    product_quantity=product.quantity,
+                ))
+            else:
+                history.acquisition_value = product.acquisition_value
+                if update_quantities:
+                    history.product_quantity = product.quantity
+
+        ProductHistory.objects.bulk_update(
+            histories.values(), ['acquisition_value', 'product_quantity'] if update_quantities else ['acquisition_value'],
+        )
+        ProductHistory.objects.bulk_create(new_histories)
+
+    job.updated_count += len(existing)
+    job.created_count += len(products) - len(existing)
+
+
+def _add_error(job, row_number, errors):
+    job.error_count += 1
+    if len(job.errors) < MAX_STORED_ERRORS:
+        job.errors.append({'row': row_number, 'errors': errors})
+
+
+def _save_progress(job):
+    job.save(update_fields=[
+        'status', 'processed_rows', 'created_count', 'updated_count', 'error_count', 'errors', 'finished_at',
+    ])
@@ -1,16 +1,106 @@
 # your_app/management/commands/archive_old_sales.py
-from django.core.management.base import BaseCommand
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, Q
 from django.utils import timezone
-from orders.models import Sale
+from orders.models import ActionHistory, Sale, SaleArchive, SaleHistory, StockReference
+
+# Vendas mais novas que isto ficam em orders_sale se --older-than não for informado
+DEFAULT_RETENTION_DAYS = 365
+
 
 class Command(BaseCommand):
-    help = 'Archive all sales by setting is_archived to True.'
+    help = ('Move old sales from orders_sale into the SaleArchive table in short, primary-key-ordered chunks. '
+            'Each chunk commits on its own, so an interrupted run can simply be started again.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=DEFAULT_RETENTION_DAYS,
+                            help=f'Arquivar vendas com pelo menos N dias (padrão: {DEFAULT_RETENTION_DAYS}).')
+        parser.add_argument('--all', action='store_true',
+                            help='Arquivar todas as vendas, inclusive as de hoje (necessário para --older-than 0).')
+        parser.add_argument('--stock-reference', help='Arquivar apenas vendas deste estoque (UUID).')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help='Segundos de espera entre lotes, para não disputar o banco com os caixas.')
+        parser.add_argument('--dry-run', action='store_true', help='Apenas conta as vendas que seriam arquivadas.')
+
+    def handle(self, *args, **options):
+        if options['older_than'] < 0 or options['chunk_size'] <= 0:
+            raise CommandError("--older-than e --chunk-size devem ser positivos.")
+        if options['all']:
+            options['older_than'] = 0
+        elif options['older_than'] == 0:
+            raise CommandError("--older-than 0 arquiva as vendas de hoje; use --all para confirmar.")
+
+        cutoff = timezone.localdate() - timedelta(days=options['older_than'])
+        # Vendas já marcadas pela versão anterior do comando também são movidas
+        sales = Sale.objects.filter(Q(date__lte=cutoff) | Q(is_archived=True))
+
+        if options['stock_reference']:
+            try:
+                stock_reference = StockReference.objects.get(id=options['stock_reference'])
+            except (StockReference.DoesNotExist, ValueError):
+                raise CommandError(f"Estoque {options['stock_reference']} não encontrado.")
+            sales = sales.filter(stock_reference=stock_reference)
 
-    def handle(self, *args, **kwargs):
-        # Arquivar todas as vendas que não estão arquivadas
-        archived_sales_count = Sale.objects.filter(is_archived=False).update(is_archived=True, archived_at=timezone.now())
+        if options['dry_run']:
+            count = sales.count()
+            self.stdout.write(f"{count} vendas seriam arquivadas (até {cutoff.isoformat()}).")
+            return
 
-        if archived_sales_count > 0:
-            self.stdout.write(self.style.SUCCESS(f"{archived_sales_count} vendas arquivadas com sucesso."))
+        total = 0
+        chunks = 0
+        last_pk = None
+        started = time.perf_counter()
+
+        while True:
+            chunk_started = time.perf_counter()
+            moved, last_pk = self.archive_chunk(sales, last_pk, options['chunk_size'])
+            if not moved:
+                break
+
+            total += moved
+            chunks += 1
+            elapsed = time.perf_counter() - chunk_started
+            self.stdout.write(f"Lote {chunks}: {moved} vendas em {elapsed:.2f}s ({moved / max(elapsed, 1e-6):.0f}/s), até {last_pk}")
+
+            if options['pause']:
+                time.sleep(options['pause'])
+
+        elapsed = time.perf_counter() - started
+        if total > 0:
+            self.stdout.write(self.style.SUCCESS(
+                f"{total} vendas arquivadas com sucesso em {chunks} lotes, {elapsed:.2f}s ({total / max(elapsed, 1e-6):.0f}/s)."
+            ))
         else:
             self.stdout.write(self.style.WARNING("Nenhuma venda encontrada para arquivamento."))
+
+    def archive_chunk(self, sales, last_pk, chunk_size):
+        """Copia um lote para SaleArchive e o remove de orders_sale numa transação curta"""
+        with transaction.atomic():
+            chunk = sales.order_by('pk')
+            if last_pk is not None:
+                chunk = chunk.filter(pk__gt=last_pk)
+            rows = list(
+                chunk.select_for_update(skip_locked=True)
+                .values('id', 'stock_reference_id', 'product_id', 'employee_id', 'sale_quantity', 'date', 'archived_at')
+                [:chunk_size]
+            )
+            if not rows:
+                return 0, last_pk
+
+            now = timezone.now()
+            ids = [row['id'] for row in rows]
+            SaleArchive.objects.bulk_create(
+                [SaleArchive(**dict(row, archived_at=row['archived_at'] or now)) for row in rows],
+                ignore_conflicts=True,
+            )
+            # Os históricos permanecem e guardam o id da venda, agora em SaleArchive
+            ActionHistory.objects.filter(sale_id__in=ids).update(archived_sale_id=F('sale_id'), sale=None)
+            SaleHistory.objects.filter(sale_id__in=ids).update(archived_sale_id=F('sale_id'), sale=None)
+            Sale.objects.filter(pk__in=ids).delete()
+
+        return len(rows), ids[-1]
@@ -0,0 +1,436 @@
+import json
+import statistics
+import tempfile
+import time
+import tracemalloc
+import uuid
+from collections import namedtuple
+from contextlib import contextmanager
+from decimal import Decimal
+from pathlib import Path
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from orders import cart as cart_store
+from orders.models import (
+    ActionHistory, Cart, CartItem, Notification, Product, ProductHistory, ProductImport, Sale, SaleHistory, Stock,
+    StockReference,
+)
+from orders.reports import collect_report, enqueue_report
+from orders.services import build_action_history, build_sale_history, rebuild_daily_sales_rollup
+from people.models import Employee
+
+BENCHMARK_PASSWORD = 'benchmark'
+
+# `prepare`, quando existe, roda antes de cada chamada (fora da medição) e
+# devolve (caminho, payload), para as rotas que consomem o que encontram
+Route = namedtuple('Route', 'name method path payload prepare format', defaults=(None, None, 'json'))
+
+
+class Command(BaseCommand):
+    help = ('Benchmark every API route (query count, p50/p95 latency, peak memory) on a seeded dataset. '
+            'The command creates a throwaway test database (like manage.py test) and a private cache, '
+            'and destroys both at the end; the configured database and cache are never touched.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=200)
+        parser.add_argument('--employees', type=int, default=20)
+        parser.add_argument('--sales', type=int, default=2000)
+        parser.add_argument('--cart-items', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=10, help='Execuções medidas por rota.')
+        parser.add_argument('--route', action='append', help='Executar apenas estas rotas (pode repetir).')
+        parser.add_argument('--baseline', help='Arquivo JSON de baseline para comparar (ou criar).')
+        parser.add_argument('--update-baseline', action='store_true', help='Sobrescrever o baseline com esta execução.')
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help='Regressão tolerada em latência e memória (0.25 = 25%%). Consultas não têm tolerância.')
+
+    def handle(self, *args, **options):
+        results = {}
+        with tempfile.TemporaryDirectory() as reports_dir, self.isolated(reports_dir):
+            context = self.seed(options)
+            for route in self.routes(context):
+                if options['route'] and route.name not in options['route']:
+                    continue
+                results[route.name] = self.measure(context['client'], route, options['repeat'])
+
+        report = {
+            'meta': {
+                'vendor': connection.vendor,
+                'products': options['products'],
+                'employees': options['employees'],
+                'sales': options['sales'],
+                'cart_items': options['cart_items'],
+                'repeat': options['repeat'],
+            },
+            'routes': results,
+        }
+        self.print_table(results)
+
+        if not options['baseline']:
+            return
+
+        baseline_path = Path(options['baseline'])
+        if options['update_baseline'] or not baseline_path.exists():
+            baseline_path.write_text(json.dumps(report, indent=2, sort_keys=True))
+            self.stdout.write(self.style.SUCCESS(f"Baseline gravado em {baseline_path}."))
+            return
+
+        baseline = json.loads(baseline_path.read_text())
+        regressions = self.compare(baseline.get('routes', {}), results, options['threshold'])
+        if regressions:
+            for line in regressions:
+                self.stderr.write(line)
+            raise CommandError(f"{len(regressions)} métrica(s) pioraram em relação ao baseline.")
+        self.stdout.write(self.style.SUCCESS("Nenhuma regressão em relação ao baseline."))
+
+    @contextmanager
+    def isolated(self, reports_dir):
+        """
+        Banco de teste novo (test_<NAME>, ou em memória no SQLite) e cache
+        próprio durante o benchmark. As gravações adiadas (carrinho,
+        LoginActivity) e os relatórios rodam na própria requisição, para nada
+        ser gravado depois que o banco de teste deixar de existir.
+        """
+        with override_settings(
+            CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': f'benchmark-{uuid.uuid4().hex}',
+            }},
+            CART_FLUSH_INTERVAL=0,
+            LOGIN_AUDIT_FLUSH_INTERVAL=0,
+            REPORTS_MAX_WORKERS=0,
+            REPORTS_CACHE_DIR=Path(reports_dir),
+        ):
+            try:
+                old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            except Exception as e:
+                raise CommandError(f"Não foi possível criar o banco de teste do benchmark: {e}")
+            self.stdout.write(f"Banco de teste: {connection.settings_dict['NAME']}")
+            try:
+                yield
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def seed(self, options):
+        """Cria um estoque ativo com produtos, funcionários, vendas, carrinho e notificações"""
+        StockReference.objects.filter(is_active=True).update(is_active=False)
+        stock_reference = StockReference.objects.create(name=f'Benchmark {time.time_ns()}', is_active=True)
+        spare_reference = StockReference.objects.create(name=f'Benchmark reserva {time.time_ns()}')
+        StockReference.clear_active_cache()
+
+        password = make_password(None)
+        users = User.objects.bulk_create(
+            User(username=f'bench-{stock_reference.id.hex[:8]}-{i}', email=f'bench{i}@example.com', password=password)
+            for i in range(max(options['employees'], 1))
+        )
+        employees = Employee.objects.bulk_create(
+            Employee(
+                user=user,
+                stock_reference=stock_reference,
+                name=f'Funcionário {i}',
+                contact='900000000',
+                address='Endereço',
+                role='admin' if i == 0 else 'employee',
+            )
+            for i, user in enumerate(users)
+        )
+        Cart.objects.bulk_create(Cart(user=user) for user in users)
+        admin = employees[0]
+        admin.user.set_password(BENCHMARK_PASSWORD)
+        admin.user.save(update_fields=['password'])
+
+        products = Product.objects.bulk_create(
+            Product(
+                stock_reference=stock_reference,
+                name=f'Produto {i:06d}',
+                description=f'bench-{stock_reference.id.hex[:8]}-{i}',
+                price=Decimal('10.00') + i % 50,
+                quantity=1_000_000,
+                acquisition_value=Decimal('4.00'),
+            )
+            for i in range(max(options['products'], 1))
+        )
+        ProductHistory.objects.bulk_create(
+            ProductHistory(product=product, stock_reference=stock_reference,
+                           acquisition_value=product.acquisition_value, product_quantity=1_000_000)
+            for product in products
+        )
+        Stock.objects.bulk_create(
+            Stock(product=product, stock_reference=stock_reference, quantity=1_000_000,
+                  available=True, responsible_user=admin)
+            for product in products
+        )
+
+        sales = Sale.objects.bulk_create(
+            Sale(
+                stock_reference=stock_reference,
+                product=products[i % len(products)],
+                employee=employees[i % len(employees)],
+                sale_quantity=1 + i % 3,
+            )
+            for i in range(options['sales'])
+        )
+        SaleHistory.objects.bulk_create(
+            (build_sale_history(sale, sale.product, sale.employee) for sale in sales), batch_size=1000
+        )
+        ActionHistory.objects.bulk_create(
+            (build_action_history(sale, sale.product, sale.employee) for sale in sales), batch_size=1000
+        )
+        rebuild_daily_sales_rollup(stock_reference)
+
+        cart = Cart.objects.filter(user=admin.user).first()
+        CartItem.objects.bulk_create(
+            CartItem(cart=cart, product=product, quantity=1)
+            for product in products[:options['cart_items']]
+        )
+        Notification.objects.bulk_create(
+            Notification(stock_reference=stock_reference, employee=admin, product_description=product.description,
+                         message=f"O produto '{product.name}' está abaixo de 10 unidades em estoque.")
+            for product in products[:10]
+        )
+
+        report_job = None
+        if sales:
+            params = {'employee_id': str(sales[0].employee_id), 'date': sales[0].date.isoformat()}
+            report = collect_report('employee', params)
+            if report is not None:
+                # Com REPORTS_MAX_WORKERS = 0 o PDF é gerado aqui mesmo
+                report_job = enqueue_report('employee', params, report)
+
+        client = APIClient(HTTP_HOST='localhost')
+        client.force_authenticate(admin.user)
+        return {
+            'client': client,
+            'stock_reference': stock_reference,
+            'spare_reference': spare_reference,
+            'admin': admin,
+            'employee': employees[-1],
+            'product': products[0],
+            'import_job': ProductImport.objects.create(employee=admin, source='benchmark.csv'),
+            'report_job': report_job,
+            'today': sales[0].date.isoformat() if sales else time.strftime('%Y-%m-%d'),
+        }
+
+    def new_product(self, context, with_stock=False):
+        """Produto novo no estoque do benchmark, para as rotas que criam ou removem"""
+        stock_reference = context['stock_reference']
+        product = Product.objects.create(
+            stock_reference=stock_reference, name=f'Extra {uuid.uuid4().hex[:8]}', description=f'extra-{uuid.uuid4()}',
+            price=Decimal('10.00'), quantity=1_000, acquisition_value=Decimal('4.00'),
+        )
+        ProductHistory.objects.create(product=product, stock_reference=stock_reference,
+                                      acquisition_value=product.acquisition_value, product_quantity=1_000)
+        if with_stock:
+            Stock.objects.create(product=product, stock_reference=stock_reference, quantity=100, available=True,
+                                 responsible_user=context['admin'])
+        return product
+
+    def activate_only(self, *stock_references):
+        StockReference.objects.update(is_active=False)
+        StockReference.objects.filter(id__in=[reference.id for reference in stock_references]).update(is_active=True)
+        StockReference.clear_active_cache()
+
+    def routes(self, context):
+        """
+        Todas as rotas de orders/urls.py e people/urls.py no modo WSGI. As
+        views assíncronas e o feed só existem no modo ASGI (load_test mede
+        esse modo).
+        """
+        admin = context['admin']
+        employee = context['employee']
+        product = context['product']
+        stock_reference = context['stock_reference']
+        spare_reference = context['spare_reference']
+        today = context['today']
+
+        def in_cart():
+            cart_store.add(admin.user, product.id, 1, stock_reference)
+            return cart_store.load(admin.user)['items'][str(product.id)]['id']
+
+        def cart_checkout(path, payload):
+            in_cart()
+            return path, payload
+
+        def cart_remove(path, payload):
+            return f'/api/cart/remove/{in_cart()}/', payload
+
+        def sales_batch(path, payload):
+            return path, {'sales': [
+                {'client_id': str(uuid.uuid4()), 'product_id': str(product.id), 'sale_quantity': 1,
+                 'client_timestamp': timezone.now().isoformat()}
+                for _ in range(10)
+            ]}
+
+        def product_create(path, payload):
+            return path, {'name': 'Novo', 'description': f'novo-{uuid.uuid4()}', 'price': '10.00',
+                          'quantity': 10, 'acquisition_value': '4.00'}
+
+        def product_import(path, payload):
+            lines = ['name,description,price,quantity,acquisition_value'] + [
+                f'Importado {i},import-{uuid.uuid4()},10.00,5,4.00' for i in range(50)
+            ]
+            return path, {'file': SimpleUploadedFile('produtos.csv', '\n'.join(lines).encode('utf-8'))}
+
+        def stock_create(path, payload):
+            return path, {'product_id': str(self.new_product(context).id), 'quantity': 10, 'is_available': True}
+
+        def stock_destroy(path, payload):
+            return f'/api/stockmanager/{self.new_product(context, with_stock=True).id}/', payload
+
+        def stock_reference_activate(path, payload):
+            self.activate_only(stock_reference)
+            return path, payload
+
+        def stock_reference_deactivate(path, payload):
+            self.activate_only(stock_reference, spare_reference)
+            return path, payload
+
+        def stock_reference_delete(path, payload):
+            return f'/api/stock-reference/{StockReference.objects.create(name=f"Apagar {uuid.uuid4()}").id}/delete/', payload
+
+        def notification_read(path, payload):
+            notification = Notification.objects.create(
+                stock_reference=stock_reference, employee=admin, product_description=f'lida-{uuid.uuid4()}',
+                message='Estoque baixo.',
+            )
+            return f'/api/api/notifications/{notification.id}/read/', payload
+
+        def employee_destroy(path, payload):
+            user = User.objects.create(username=f'bench-apagar-{uuid.uuid4().hex[:12]}', password=make_password(None))
+            removed = Employee.objects.create(user=user, stock_reference=stock_reference, name='Apagar',
+                                              contact='900000000', address='Endereço', role='employee')
+            return f'/api/employee/{removed.id}/', payload
+
+        routes = [
+            Route('token', 'post', '/api/token/', {'username': admin.user.username, 'password': BENCHMARK_PASSWORD}),
+            Route('products-list', 'get', '/api/products/'),
+            Route('products-page', 'get', '/api/products/?page_size=50'),
+            Route('products-create', 'post', '/api/products/create/', prepare=product_create),
+            Route('products-update', 'put', f'/api/products/{product.id}/update/', {'price': '11.00', 'quantity': 0}),
+            Route('products-import', 'post', '/api/products/import/', prepare=product_import, format='multipart'),
+            Route('products-import-status', 'get', f'/api/products/import/{context["import_job"].id}/'),
+            Route('stockmanager-list', 'get', '/api/stockmanager/'),
+            Route('stockmanager-since', 'get', '/api/stockmanager/?since=0'),
+            Route('stockmanager-create', 'post', '/api/stockmanager/', prepare=stock_create),
+            Route('stockmanager-update', 'put', f'/api/stockmanager/{product.id}/', {'quantity': 1}),
+            Route('stockmanager-destroy', 'delete', None, prepare=stock_destroy),
+            Route('stock-references-list', 'get', '/api/stock-references/'),
+            Route('sales-list', 'get', '/api/sales/'),
+            Route('sale-create', 'post', '/api/sales/', {'product': str(product.id), 'sale_quantity': 1}),
+            Route('sales-batch', 'post', '/api/sales/batch/', prepare=sales_batch),
+            Route('aggregate-sales-by-date', 'get', '/api/aggregate-sales-by-date/'),
+            Route('sales-by-employee', 'get', '/api/sales-by-employee/'),
+            Route('sales-by-employee-range', 'get', f'/api/sales-by-employee/?from={today}&to={today}&limit=5'),
+            Route('employee-sales', 'get', f'/api/employee/{employee.id}/sales/'),
+            Route('employee-sales-page', 'get', f'/api/employee/{employee.id}/sales/?page_size=20'),
+            Route('static-value', 'get', '/api/static-value/'),
+            Route('total-product-value', 'get', '/api/total-product-value/'),
+            Route('cart', 'get', '/api/cart/'),
+            Route('cart-items', 'get', f'/api/cart/items/{admin.id}/'),
+            Route('cart-add', 'post', '/api/cart/add/', {'product_id': str(product.id), 'quantity': 1}),
+            Route('cart-remove', 'delete', None, prepare=cart_remove),
+            Route('cart-checkout', 'post', '/api/cart/checkout/', prepare=cart_checkout),
+            Route('notifications', 'get', '/api/notifications/'),
+            Route('notification-read', 'patch', None, prepare=notification_read),
+            Route('generate-report', 'get', f'/api/generate-report/?id={employee.id}&date={today}'),
+            Route('sales-export-csv', 'get', f'/api/reports/export/?from={today}&to={today}&output=csv'),
+            Route('sales-export-pdf', 'get', f'/api/reports/export/?from={today}&to={today}&employee={employee.id}'),
+            Route('sale-history-export', 'get', '/api/exports/sale-history/'),
+            Route('action-history-export', 'get', '/api/exports/action-history/?output=ndjson'),
+            Route('sync-snapshot', 'get', '/api/sync/snapshot/'),
+            Route('sync-changes', 'get', '/api/sync/changes/?since=0'),
+            Route('employee-sector', 'put', f'/api/employee/{employee.id}/sector', {'sector': str(stock_reference.id)}),
+            Route('employee-list', 'get', '/api/employee/'),
+            Route('employee-detail', 'get', f'/api/employee/{employee.id}/'),
+            Route('employee-update', 'put', f'/api/employee/{employee.id}/', {'name': employee.name}),
+            Route('employee-destroy', 'delete', None, prepare=employee_destroy),
+            Route('employee-history-list', 'get', '/api/employee-history/'),
+            Route('login-activities-list', 'get', '/api/login-activities/'),
+            # Mudam o estoque ativo: ficam por último e cada chamada parte do mesmo estado
+            Route('stock-reference-activate', 'post', f'/api/stock-reference/{spare_reference.id}/activate/',
+                  prepare=stock_reference_activate),
+            Route('stock-reference-deactivate', 'post', f'/api/stock-reference/{spare_reference.id}/deactivate/',
+                  prepare=stock_reference_deactivate),
+            Route('stock-reference-delete', 'delete', None, prepare=stock_reference_delete),
+        ]
+        report_job = context['report_job']
+        if report_job is not None:
+            routes[-3:-3] = [
+                Route('report-job', 'get', f'/api/reports/{report_job.id}/'),
+                Route('report-job-download', 'get', f'/api/reports/{report_job.id}/download/'),
+            ]
+        return routes
+
+    def measure(self, client, route, repeat):
+        call = getattr(client, route.method)
+
+        def request():
+            path, payload = route.prepare(route.path, route.payload) if route.prepare else (route.path, route.payload)
+            if payload is None:
+                return lambda: call(path)
+            return lambda: call(path, payload, format=route.format)
+
+        def consume(response):
+            # Respostas em fluxo (exportações, PDFs) só custam quando lidas
+            if response.streaming:
+                b''.join(response.streaming_content)
+            response.close()
+            return response
+
+        # Aquecimento (caches locais, conexões)
+        response = consume(request()())
+
+        timings = []
+        queries = []
+        for _ in range(max(repeat, 1)):
+            send = request()
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                response = consume(send())
+                timings.append((time.perf_counter() - start) * 1000)
+            queries.append(len(ctx.captured_queries))
+
+        send = request()
+        tracemalloc.start()
+        try:
+            tracemalloc.reset_peak()
+            consume(send())
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        timings.sort()
+        return {
+            'status': response.status_code,
+            'queries': max(queries),
+            'p50_ms': round(statistics.median(timings), 3),
+            'p95_ms': round(timings[min(len(timings) - 1, int(round(0.95 * (len(timings) - 1))))], 3),
+            'peak_kb': round(peak / 1024, 1),
+        }
+
+    def compare(self, baseline, results, threshold):
+        regressions = []
+        for name, current in results.items():
+            previous = baseline.get(name)
+            if previous is None:
+                continue
+            if current['queries'] > previous['queries']:
+                regressions.append(f"{name}: consultas {previous['queries']} -> {current['queries']}")
+            for metric in ('p50_ms', 'p95_ms', 'peak_kb'):
+                if current[metric] > previous[metric] * (1 + threshold):
+                    regressions.append(f"{name}: {metric} {previous[metric]} -> {current[metric]}")
+        return regressions
+
+    def print_table(self, results):
+        self.stdout.write(f"{'rota':<26}{'status':>7}{'consultas':>10}{'p50 ms':>10}{'p95 ms':>10}{'pico KB':>10}")
+        for name, row in results.items():
+            self.stdout.write(
+                f"{name:<26}{row['status']:>7}{row['queries']:>10}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['peak_kb']:>10}"
+            )
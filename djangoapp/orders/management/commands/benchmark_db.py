@@ -0,0 +1,111 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from people.models import Employee
+
+# Variáveis de ambiente de cada modo (ver DATABASES em backend/settings.py)
+MODES = {
+    'no-persist': {'DB_CONN_MAX_AGE': '0', 'DB_POOL': '0'},
+    'persistent': {'DB_CONN_MAX_AGE': '600', 'DB_CONN_HEALTH_CHECKS': '1', 'DB_POOL': '0'},
+    'persistent-no-check': {'DB_CONN_MAX_AGE': '600', 'DB_CONN_HEALTH_CHECKS': '0', 'DB_POOL': '0'},
+    'pool': {'DB_CONN_MAX_AGE': '0', 'DB_POOL': '1'},
+}
+
+
+class Command(BaseCommand):
+    help = ('Measure per-request latency with the different database connection modes (no persistence, '
+            'CONN_MAX_AGE with and without health checks, psycopg pool). Each mode runs in a fresh process '
+            'with the DB_* environment variables set; point DB_HOST/DB_NAME/... at a local PostgreSQL.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', action='append', choices=sorted(MODES),
+                            help='Modos a medir (pode repetir); padrão: todos.')
+        parser.add_argument('--requests', type=int, default=200, help='Requisições por modo.')
+        parser.add_argument('--route', default='/api/static-value/', help='Rota usada em cada requisição.')
+        parser.add_argument('--run-mode', help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['run_mode']:
+            # Processo filho: mede com as configurações já aplicadas pelo ambiente
+            self.stdout.write(json.dumps(self.measure(options['route'], options['requests'])))
+            return
+
+        self.stdout.write(f"{'modo':<22}{'conexões':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'média ms':>10}")
+        for mode in options['mode'] or list(MODES):
+            env = dict(os.environ, **MODES[mode], PYTHONPATH=os.pathsep.join(sys.path))
+            completed = subprocess.run(
+                [sys.executable, 'manage.py', 'benchmark_db', '--run-mode', mode,
+                 '--requests', str(options['requests']), '--route', options['route']],
+                cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+            )
+            if completed.returncode != 0:
+                error = (completed.stderr.strip().splitlines() or ['erro desconhecido'])[-1]
+                self.stderr.write(f"{mode:<22}falhou: {error}")
+                continue
+            row = json.loads(completed.stdout.strip().splitlines()[-1])
+            self.stdout.write(
+                f"{mode:<22}{row['connections']:>10}{row['p50_ms']:>10}{row['p95_ms']:>10}"
+                f"{row['p99_ms']:>10}{row['mean_ms']:>10}"
+            )
+
+    def measure(self, route, requests):
+        employee = Employee.objects.select_related('user').filter(role='admin').order_by('name').first()
+        user = employee.user if employee else User.objects.order_by('id').first()
+        if user is None:
+            raise CommandError('Nenhum usuário para autenticar as requisições.')
+        connection.close()
+
+        client = APIClient(HTTP_HOST='localhost')
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+
+        # Conta as conexões novas abertas durante o teste
+        connections = []
+        original_connect = connection.connect
+
+        def counting_connect():
+            connections.append(1)
+            return original_connect()
+
+        connection.connect = counting_connect
+
+        def request():
+            # O Client de teste desliga close_old_connections dos sinais
+            # request_started/finished; aqui o ciclo é refeito como no servidor
+            close_old_connections()
+            response = client.get(route)
+            close_old_connections()
+            return response
+
+        # Aquecimento: importações, caches locais e a primeira conexão
+        request()
+        connections.clear()
+
+        timings = []
+        for _ in range(max(requests, 1)):
+            start = time.perf_counter()
+            response = request()
+            timings.append((time.perf_counter() - start) * 1000)
+            if response.status_code >= 400:
+                raise CommandError(f"{route} respondeu {response.status_code}.")
+
+        timings.sort()
+        return {
+            'connections': len(connections),
+            'p50_ms': round(statistics.median(timings), 3),
+            'p95_ms': round(timings[min(len(timings) - 1, int(round(0.95 * (len(timings) - 1))))], 3),
+            'p99_ms': round(timings[min(len(timings) - 1, int(round(0.99 * (len(timings) - 1))))], 3),
+            'mean_ms': round(statistics.fmean(timings), 3),
+        }
+
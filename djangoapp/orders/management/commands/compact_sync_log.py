@@ -0,0 +1,54 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Exists, Max, OuterRef
+from django.utils import timezone
+
+from orders.models import ChangeLog, SyncCompaction
+from orders.sync import horizon
+
+# Só entradas com pelo menos isto de idade são juntadas, para não abrir
+# lacunas nas versões que os caixas ainda estão lendo
+SETTLE_TIME = timedelta(hours=1)
+
+
+class Command(BaseCommand):
+    help = ('Compact the catalog sync change log: drop entries superseded by a newer change of the same object, '
+            'and drop everything older than --retention-days. Tills whose version is below the new horizon get '
+            '410 from sync/changes/ and download a fresh snapshot.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int, default=7,
+                            help='Apaga todas as entradas com mais de N dias (padrão: 7).')
+        parser.add_argument('--dry-run', action='store_true', help='Apenas conta as entradas que seriam apagadas.')
+
+    def handle(self, *args, **options):
+        if options['retention_days'] < 1:
+            raise CommandError('--retention-days deve ser pelo menos 1.')
+
+        now = timezone.now()
+        expired = ChangeLog.objects.filter(created_at__lt=now - timedelta(days=options['retention_days']))
+        settled = now - SETTLE_TIME
+        newer = ChangeLog.objects.filter(
+            model=OuterRef('model'), object_id=OuterRef('object_id'), id__gt=OuterRef('id'), created_at__lt=settled,
+        )
+        superseded = ChangeLog.objects.filter(created_at__lt=settled).filter(Exists(newer))
+
+        if options['dry_run']:
+            self.stdout.write(
+                f"{expired.count()} entradas expiradas e {superseded.count()} substituídas seriam apagadas."
+            )
+            return
+
+        with transaction.atomic():
+            new_horizon = max(expired.aggregate(last=Max('id'))['last'] or 0, horizon())
+            removed_expired, _ = expired.delete()
+            removed_superseded, _ = superseded.delete()
+            removed = removed_expired + removed_superseded
+            if removed:
+                SyncCompaction.objects.create(horizon=new_horizon, removed=removed)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{removed_expired} entradas expiradas e {removed_superseded} substituídas apagadas; horizonte {new_horizon}."
+        ))
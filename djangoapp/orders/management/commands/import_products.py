@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from orders.importers import BATCH_SIZE, FORMATS, guess_format, import_products
+from orders.models import ProductImport, StockReference
+
+class Command(BaseCommand):
+    help = 'Import (upsert by description) products from a CSV or JSON lines file in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Arquivo CSV ou JSON lines.')
+        parser.add_argument('--format', choices=FORMATS, help='Formato do arquivo (padrão: pela extensão).')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--update-quantities', action='store_true',
+                            help='Também substitui a quantidade dos produtos existentes pela do arquivo.')
+
+    def handle(self, *args, **options):
+        stock_reference = StockReference.get_active()
+        if not stock_reference:
+            raise CommandError("Nenhum estoque ativo encontrado.")
+
+        path = options['path']
+        fmt = options['format'] or guess_format(path)
+        job = ProductImport.objects.create(source=path[-255:])
+
+        try:
+            with open(path, 'rb') as stream:
+                import_products(
+                    stream, fmt, job, stock_reference,
+                    batch_size=options['batch_size'], update_quantities=options['update_quantities'],
+                )
+        except OSError as e:
+            raise CommandError(str(e))
+        except Exception as e:
+            raise CommandError(f"Importação {job.id} falhou: {e}")
+
+        for error in job.errors:
+            self.stderr.write(f"Linha {error['row']}: {error['errors']}")
+
+        message = (f"Importação {job.id}: {job.processed_rows} linhas, {job.created_count} criados, "
+                   f"{job.updated_count} atualizados, {job.error_count} erros.")
+        if job.error_count:
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,202 @@
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from people.models import Employee
+
+# Rotas de leitura que têm versão assíncrona (orders/async_views.py)
+DEFAULT_ROUTES = [
+    '/api/products/',
+    '/api/stockmanager/',
+    '/api/notifications/',
+    '/api/static-value/',
+    '/api/total-product-value/',
+    '/api/aggregate-sales-by-date/',
+    '/api/sales-by-employee/',
+]
+
+
+class Command(BaseCommand):
+    help = ('Load-test the read-heavy routes (requests per second and p50/p95/p99 latency). Either point it at '
+            'running servers with --url, or use --spawn to start gunicorn in sync (wsgi) and uvicorn (asgi) '
+            'mode and compare both against the same database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', action='append', help='Servidor já em execução, ex. http://127.0.0.1:8000 (pode repetir).')
+        parser.add_argument('--spawn', action='store_true', help='Sobe gunicorn nos modos wsgi e asgi e compara.')
+        parser.add_argument(
+            '--workers', type=int,
+            help='Workers de cada gunicorn com --spawn; padrão: 2 com CACHE_BACKEND=redis, senão 1.',
+        )
+        parser.add_argument('--route', action='append', help='Caminho a testar (pode repetir); padrão: rotas de leitura.')
+        parser.add_argument('--concurrency', type=int, default=16, help='Clientes simultâneos.')
+        parser.add_argument('--duration', type=float, default=10.0, help='Segundos por rota.')
+        parser.add_argument('--username', help='Usuário do token JWT; padrão: primeiro funcionário admin.')
+        parser.add_argument('--output', help='Grava os resultados em JSON neste arquivo.')
+
+    def handle(self, *args, **options):
+        if not options['url'] and not options['spawn']:
+            raise CommandError('Informe --url ou --spawn.')
+
+        # Sem Redis cada worker teria o próprio cache (ver gunicorn.conf.py) e a
+        # comparação mediria caches frios e carrinhos divergentes
+        workers = options['workers'] or (2 if settings.CACHE_BACKEND == 'redis' else 1)
+        if options['spawn'] and workers > 1 and settings.CACHE_BACKEND != 'redis':
+            raise CommandError(f'--workers {workers} requer CACHE_BACKEND=redis (cache atual: {settings.CACHE_BACKEND}).')
+
+        token = self.get_token(options['username'])
+        routes = options['route'] or DEFAULT_ROUTES
+        targets = [(url, url.rstrip('/')) for url in options['url'] or []]
+
+        servers = []
+        try:
+            if options['spawn']:
+                for mode in ('wsgi', 'asgi'):
+                    process, base_url = self.spawn(mode, workers)
+                    servers.append(process)
+                    targets.append((mode, base_url))
+
+            self.stdout.write(
+                f"{'alvo':<8}{'rota':<34}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'erros':>8}"
+            )
+            results = {}
+            for name, base_url in targets:
+                results[name] = {}
+                for route in routes:
+                    results[name][route] = self.run(base_url, route, token, options['concurrency'], options['duration'])
+                    self.print_row(name, route, results[name][route])
+        finally:
+            for process in servers:
+                process.terminate()
+            for process in servers:
+                try:
+                    process.wait(timeout=15)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+        if len(targets) == 2:
+            self.print_comparison(targets[0][0], targets[1][0], results, routes)
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(results, indent=2))
+            self.stdout.write(self.style.SUCCESS(f"Resultados gravados em {options['output']}."))
+
+    def get_token(self, username):
+        if username:
+            user = User.objects.filter(username=username).first()
+        else:
+            employee = Employee.objects.select_related('user').filter(role='admin').order_by('name').first()
+            user = employee.user if employee else None
+        if user is None:
+            raise CommandError('Usuário não encontrado para gerar o token.')
+        return str(AccessToken.for_user(user))
+
+    def spawn(self, mode, workers):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+
+        env = dict(os.environ, SERVER_MODE=mode, PYTHONPATH=os.pathsep.join(sys.path))
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+             '--bind', f'127.0.0.1:{port}', '--workers', str(workers)],
+            cwd=settings.BASE_DIR,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f'gunicorn ({mode}) terminou ao iniciar.')
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+                return process, f'http://127.0.0.1:{port}'
+            except OSError:
+                time.sleep(0.2)
+        process.kill()
+        raise CommandError(f'gunicorn ({mode}) não respondeu em 30s.')
+
+    def run(self, base_url, route, token, concurrency, duration):
+        parts = urlsplit(base_url)
+        headers = {'Authorization': f'Bearer {token}', 'Connection': 'keep-alive'}
+        latencies = []
+        errors = [0]
+        lock = threading.Lock()
+        deadline = time.monotonic() + duration
+
+        def client():
+            connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+            local = []
+            local_errors = 0
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                try:
+                    connection.request('GET', parts.path.rstrip('/') + route, headers=headers)
+                    response = connection.getresponse()
+                    response.read()
+                    if response.status >= 400:
+                        local_errors += 1
+                except (OSError, http.client.HTTPException):
+                    local_errors += 1
+                    connection.close()
+                    connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+                    continue
+                local.append((time.perf_counter() - start) * 1000)
+            connection.close()
+            with lock:
+                latencies.extend(local)
+                errors[0] += local_errors
+
+        started = time.monotonic()
+        threads = [threading.Thread(target=client) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        latencies.sort()
+        return {
+            'requests': len(latencies),
+            'errors': errors[0],
+            'rps': round(len(latencies) / elapsed, 1) if elapsed else 0,
+            'p50_ms': round(statistics.median(latencies), 2) if latencies else None,
+            'p95_ms': self.percentile(latencies, 0.95),
+            'p99_ms': self.percentile(latencies, 0.99),
+        }
+
+    def percentile(self, values, fraction):
+        if not values:
+            return None
+        return round(values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))], 2)
+
+    def print_row(self, name, route, row):
+        self.stdout.write(
+            f"{name:<8}{route:<34}{row['rps']:>9}{str(row['p50_ms']):>10}{str(row['p95_ms']):>10}"
+            f"{str(row['p99_ms']):>10}{row['errors']:>8}"
+        )
+
+    def print_comparison(self, first, second, results, routes):
+        self.stdout.write('')
+        self.stdout.write(f"{'rota':<34}{'req/s ' + first:>14}{'req/s ' + second:>14}{'p99 ' + first:>12}{'p99 ' + second:>12}")
+        for route in routes:
+            a = results[first][route]
+            b = results[second][route]
+            self.stdout.write(
+                f"{route:<34}{a['rps']:>14}{b['rps']:>14}{str(a['p99_ms']):>12}{str(b['p99_ms']):>12}"
+            )
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from orders.idempotency import expired, purge
+
+
+class Command(BaseCommand):
+    help = ('Delete stored Idempotency-Key responses older than IDEMPOTENCY_KEY_TTL. '
+            'Run it periodically (e.g. hourly from cron).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Apenas conta as chaves que seriam apagadas.')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            self.stdout.write(f"{expired().count()} chaves expiradas seriam apagadas.")
+            return
+
+        deleted = purge()
+        self.stdout.write(self.style.SUCCESS(f"{deleted} chaves expiradas apagadas."))
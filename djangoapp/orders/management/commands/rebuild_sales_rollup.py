@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from orders.models import StockReference
+from orders.services import rebuild_daily_sales_rollup
+
+class Command(BaseCommand):
+    help = 'Recalculate the DailySalesRollup table from SaleHistory.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stock-reference', help='Recalcular apenas este estoque (UUID).')
+
+    def handle(self, *args, **options):
+        stock_reference = None
+        if options['stock_reference']:
+            try:
+                stock_reference = StockReference.objects.get(id=options['stock_reference'])
+            except (StockReference.DoesNotExist, ValueError):
+                raise CommandError(f"Estoque {options['stock_reference']} não encontrado.")
+
+        days = rebuild_daily_sales_rollup(stock_reference)
+        self.stdout.write(self.style.SUCCESS(f"{days} dias de vendas recalculados."))
@@ -0,0 +1,47 @@
+# Generated by Django 5.1.2 on 2026-10-18 15:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, F, Sum
+
+
+def populate_rollup(apps, schema_editor):
+    SaleHistory = apps.get_model('orders', 'SaleHistory')
+    DailySalesRollup = apps.get_model('orders', 'DailySalesRollup')
+    rows = SaleHistory.objects.values('stock_reference_id', 'date').annotate(
+        sale_count=Count('id'),
+        total_quantity=Sum('sale_quantity'),
+        total_sales_value=Sum('sale_total_value'),
+        total_acquisition_value=Sum(
+            F('sale_quantity') * F('product_acquisition_value'),
+            output_field=DecimalField(max_digits=14, decimal_places=2),
+        ),
+    ).order_by()
+    DailySalesRollup.objects.bulk_create((DailySalesRollup(**row) for row in rows), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_alter_product_stock_reference'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('sale_count', models.PositiveIntegerField(default=0)),
+                ('total_quantity', models.PositiveIntegerField(default=0)),
+                ('total_sales_value', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_acquisition_value', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('stock_reference', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='orders.stockreference')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('stock_reference', 'date'), name='unique_daily_sales_rollup')],
+            },
+        ),
+        migrations.RunPython(populate_rollup, migrations.RunPython.noop),
+    ]
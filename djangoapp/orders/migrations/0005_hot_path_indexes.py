@@ -0,0 +1,69 @@
+# Generated by Django 5.1.2 on 2026-10-18 15:35
+
+from django.db import migrations, models
+
+from orders.operations import AddIndexConcurrently
+
+
+def merge_duplicate_stocks(apps, schema_editor):
+    """
+    Junta as linhas repetidas de Stock de cada (produto, estoque) na de menor
+    pk, somando as quantidades (cada uma já foi descontada do produto).
+    """
+    Stock = apps.get_model('orders', 'Stock')
+    keep = {}
+    duplicates = []
+    rows = Stock.objects.order_by('product_id', 'stock_reference_id', 'pk').values_list(
+        'pk', 'product_id', 'stock_reference_id', 'quantity', 'available',
+    )
+    for pk, product_id, stock_reference_id, quantity, available in rows.iterator(chunk_size=2000):
+        key = (product_id, stock_reference_id)
+        if key not in keep:
+            keep[key] = [pk, quantity, available, False]
+            continue
+        kept = keep[key]
+        kept[1] += quantity
+        kept[2] = kept[2] or available
+        kept[3] = True
+        duplicates.append(pk)
+
+    for pk, quantity, available, merged in keep.values():
+        if merged:
+            Stock.objects.filter(pk=pk).update(quantity=quantity, available=available)
+    for start in range(0, len(duplicates), 1000):
+        Stock.objects.filter(pk__in=duplicates[start:start + 1000]).delete()
+
+
+class Migration(migrations.Migration):
+
+    # Os índices são criados com CONCURRENTLY no PostgreSQL, fora de transação
+    atomic = False
+
+    dependencies = [
+        ('orders', '0004_dailysalesrollup'),
+        ('people', '0001_initial'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['stock_reference', '-created_at'], name='notification_unread_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='sale',
+            index=models.Index(condition=models.Q(('is_archived', False)), fields=['employee', 'date'], name='sale_active_emp_date_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='salehistory',
+            index=models.Index(fields=['stock_reference', 'date'], name='salehistory_ref_date_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='salehistory',
+            index=models.Index(fields=['employee', 'date'], name='salehistory_emp_date_idx'),
+        ),
+        migrations.RunPython(merge_duplicate_stocks, migrations.RunPython.noop, atomic=True),
+        migrations.AddConstraint(
+            model_name='stock',
+            constraint=models.UniqueConstraint(fields=('product', 'stock_reference'), name='unique_stock_product_reference'),
+        ),
+    ]
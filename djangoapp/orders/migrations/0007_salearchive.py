@@ -0,0 +1,30 @@
+# Generated by Django 5.1.2 on 2026-10-18 15:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0006_productimport'),
+        ('people', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SaleArchive',
+            fields=[
+                ('id', models.UUIDField(editable=False, primary_key=True, serialize=False)),
+                ('sale_quantity', models.PositiveIntegerField()),
+                ('date', models.DateField()),
+                ('archived_at', models.DateTimeField()),
+                ('employee', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='people.employee')),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='orders.product')),
+                ('stock_reference', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='orders.stockreference')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['stock_reference', 'date'], name='salearchive_ref_date_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.2 on 2026-10-18 15:43
+
+from django.db import migrations, models
+
+from orders.operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+
+    # Índice criado com CONCURRENTLY no PostgreSQL, fora de transação
+    atomic = False
+
+    dependencies = [
+        ('orders', '0008_reportjob'),
+        ('people', '0001_initial'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='actionhistory',
+            index=models.Index(fields=['action_date_timestamp', 'id'], name='actionhistory_ts_id_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.1.2 on 2026-10-18 15:44
+
+from django.db import migrations, models
+
+
+def close_duplicate_notifications(apps, schema_editor):
+    """Mantém aberto só o alerta mais recente de cada (estoque, produto)"""
+    Notification = apps.get_model('orders', 'Notification')
+    seen = set()
+    duplicates = []
+    rows = (
+        Notification.objects.filter(is_read=False)
+        .order_by('stock_reference_id', 'product_description', '-created_at')
+        .values_list('id', 'stock_reference_id', 'product_description')
+    )
+    for notification_id, stock_reference_id, product_description in rows.iterator(chunk_size=2000):
+        key = (stock_reference_id, product_description)
+        if key in seen:
+            duplicates.append(notification_id)
+        else:
+            seen.add(key)
+
+    for start in range(0, len(duplicates), 1000):
+        Notification.objects.filter(id__in=duplicates[start:start + 1000]).update(is_read=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_actionhistory_export_index'),
+        ('people', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='low_stock_threshold',
+            field=models.PositiveIntegerField(default=10),
+        ),
+        migrations.RunPython(close_duplicate_notifications, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_read', False)), fields=('stock_reference', 'product_description'), name='unique_open_notification'),
+        ),
+    ]
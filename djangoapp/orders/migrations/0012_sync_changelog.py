@@ -0,0 +1,36 @@
+# Generated by Django 5.1.2 on 2026-10-18 16:00
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0011_stock_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncCompaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('horizon', models.BigIntegerField()),
+                ('removed', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ChangeLog',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('model', models.CharField(choices=[('product', 'product'), ('stock', 'stock'), ('stock_reference', 'stock_reference')], max_length=20)),
+                ('object_id', models.CharField(max_length=64)),
+                ('op', models.CharField(choices=[('upsert', 'upsert'), ('delete', 'delete')], default='upsert', max_length=10)),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['model', 'object_id', 'id'], name='changelog_object_idx')],
+            },
+        ),
+    ]
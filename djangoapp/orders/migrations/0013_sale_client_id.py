@@ -0,0 +1,23 @@
+# Generated by Django 5.1.2 on 2026-10-18 16:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0012_sync_changelog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sale',
+            name='client_id',
+            field=models.UUIDField(blank=True, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='client_timestamp',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.2 on 2026-10-18 16:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0014_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='actionhistory',
+            name='archived_sale_id',
+            field=models.UUIDField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='salehistory',
+            name='archived_sale_id',
+            field=models.UUIDField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.2 on 2026-10-18 16:17
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def seed_counter(apps, schema_editor):
+    # Continua a partir da última versão já distribuída pela sequência antiga
+    ChangeLog = apps.get_model('orders', 'ChangeLog')
+    SyncCompaction = apps.get_model('orders', 'SyncCompaction')
+    SyncCounter = apps.get_model('orders', 'SyncCounter')
+    version = max(
+        ChangeLog.objects.aggregate(last=Max('id'))['last'] or 0,
+        SyncCompaction.objects.aggregate(last=Max('horizon'))['last'] or 0,
+    )
+    SyncCounter.objects.update_or_create(pk=1, defaults={'version': version})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0015_history_archived_sale_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncCounter',
+            fields=[
+                ('id', models.PositiveSmallIntegerField(default=1, primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='changelog',
+            name='id',
+            field=models.BigIntegerField(primary_key=True, serialize=False),
+        ),
+        migrations.RunPython(seed_counter, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.2 on 2026-10-18 16:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0016_sync_counter'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='dailysalesrollup',
+            name='unique_daily_sales_rollup',
+        ),
+        migrations.AddField(
+            model_name='dailysalesrollup',
+            name='shard',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddConstraint(
+            model_name='dailysalesrollup',
+            constraint=models.UniqueConstraint(fields=('stock_reference', 'date', 'shard'), name='unique_daily_sales_rollup'),
+        ),
+    ]
@@ -1,13 +1,13 @@
 from django.db import models
+from django.core.cache import cache
 import uuid
 from people.models import Employee
-from django.db.models.signals import post_save
-from django.dispatch import receiver
 from django.utils import timezone
 import uuid
 from django.contrib.auth.models import User
 from django.shortcuts import get_object_or_404
 from django.http import HttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
     
 # Create your models here.
 class StockReference(models.Model):
@@ -18,9 +18,43 @@ class StockReference(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)  # Data de criação
     updated_at = models.DateTimeField(auto_now=True)  # Última atualização
 
+    ACTIVE_CACHE_KEY = 'orders:stock-reference:active'
+    ACTIVE_CACHE_TIMEOUT = 60 * 60
+
     def __str__(self):
         return self.name
 
+    @classmethod
+    def get_active(cls):
+        """
+        Retorna o estoque ativo (ou None) sem consultar o banco no caminho comum.
+
+        O valor fica no cache do Django, que com mais de um worker é o Redis
+        (ver WEB_CONCURRENCY no settings), então a invalidação feita por um
+        processo vale para todos.
+        """
+        entry = cache.get(cls.ACTIVE_CACHE_KEY)
+        if entry is None:
+            # Numa tupla, para que "nenhum estoque ativo" (None) também fique em cache
+            entry = (cls.objects.filter(is_active=True).first(),)
+            cache.set(cls.ACTIVE_CACHE_KEY, entry, cls.ACTIVE_CACHE_TIMEOUT)
+        return entry[0]
+
+    @classmethod
+    async def aget_active(cls):
+        """Versão assíncrona de get_active, para as views de async_views"""
+        entry = await cache.aget(cls.ACTIVE_CACHE_KEY)
+        if entry is None:
+            entry = (await cls.objects.filter(is_active=True).afirst(),)
+            await cache.aset(cls.ACTIVE_CACHE_KEY, entry, cls.ACTIVE_CACHE_TIMEOUT)
+        return entry[0]
+
+    @classmethod
+    def clear_active_cache(cls):
+        """Invalida o estoque ativo em cache (chamado pelos signals e pelas ações activate/deactivate)"""
+        cache.delete(cls.ACTIVE_CACHE_KEY)
+
+
 class Product(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     stock_reference = models.ForeignKey(StockReference, on_delete=models.CASCADE, null=True, blank=True)  # Permite valores nulos
@@ -29,6 +63,7 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     quantity = models.PositiveIntegerField(default=0)
     acquisition_value = models.DecimalField(max_digits=10, decimal_places=2, default=0.00) 
+    low_stock_threshold = models.PositiveIntegerField(default=10)  # Abaixo disso o estoque gera um alerta
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -51,6 +86,31 @@ class ProductHistory(models.Model):
         return f'{self.acquisition_value:.2f}' 
 
 
+class ProductImport(models.Model):
+    """Progresso e erros de uma importação em lote de produtos (CSV ou JSON lines)"""
+    STATUS_CHOICES = [
+        ('pending', 'pending'),
+        ('running', 'running'),
+        ('done', 'done'),
+        ('failed', 'failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    employee = models.ForeignKey(Employee, on_delete=models.SET_NULL, null=True, blank=True)
+    source = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    processed_rows = models.PositiveIntegerField(default=0)
+    created_count = models.PositiveIntegerField(default=0)
+    updated_count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)  # [{'row': n, 'errors': {...}}]
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'Importação {self.id} ({self.status})'
+
+
 class Sale(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     stock_reference = models.ForeignKey(StockReference, on_delete=models.CASCADE) 
@@ -60,56 +120,44 @@ class Sale(models.Model):
     employee = models.ForeignKey(Employee, on_delete=models.CASCADE)
     is_archived = models.BooleanField(default=False)
     archived_at = models.DateTimeField(null=True, blank=True)
+    # Vendas enviadas em lote pelo caixa (sales/batch/): id gerado no caixa,
+    # que torna o reenvio idempotente, e a hora da venda no caixa
+    client_id = models.UUIDField(null=True, blank=True, unique=True)
+    client_timestamp = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Vendas não arquivadas de um funcionário (SalesByEmployeeWithIdViewSet)
+            models.Index(fields=['employee', 'date'], name='sale_active_emp_date_idx', condition=models.Q(is_archived=False)),
+        ]
 
     def __str__(self) -> str:
         return f"{self.product.name} - {self.sale_quantity} unidades"
     
 
-    def save(self, *args, **kwargs):
-        # Verifica se há estoque suficiente
-        from orders.models import Stock
-        try:
-            stock_reference = StockReference.objects.filter(is_active=True).first()
-            stock = Stock.objects.get(product=self.product, stock_reference=stock_reference.id)
-        except Stock.DoesNotExist:
-            raise ValueError("Produto não encontrado no estoque.")
-        
-        # Verifica se o produto está disponível
-        if not stock.available:
-            raise ValueError(f"O produto {self.product.name} não está disponível para venda.")
-
-        # Permite a venda se a quantidade a ser vendida for menor ou igual à quantidade disponível
-        if self.sale_quantity > stock.quantity:
-            raise ValueError("A quantidade vendida excede o estoque disponível.")
-
-        # Diminui a quantidade no estoque
-        stock.quantity -= self.sale_quantity
-        stock.save()
-
-        # Chama o método save padrão para registrar a venda
-        super().save(*args, **kwargs)
+class SaleArchive(models.Model):
+    """Vendas antigas movidas para fora de orders_sale pelo comando archive_old_sales"""
+    id = models.UUIDField(primary_key=True, editable=False)  # Mesmo id da venda original
+    stock_reference = models.ForeignKey(StockReference, on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True)
+    employee = models.ForeignKey(Employee, on_delete=models.SET_NULL, null=True, blank=True)
+    sale_quantity = models.PositiveIntegerField()
+    date = models.DateField()
+    archived_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['stock_reference', 'date'], name='salearchive_ref_date_idx'),
+        ]
 
-        # Adiciona o histórico de vendas
-        SaleHistory.objects.create(
-            sale=self,
-            product=self.product,
-            product_name=self.product.name,
-            product_price=self.product.price,  # Supondo que o Product tenha um campo de preço
-            product_acquisition_value =self.product.acquisition_value,
-            
-            sale_quantity=self.sale_quantity,
-            sale_total_value=self.product.price * self.sale_quantity,  # Preço total da venda
-
-            employee=self.employee,
-            employee_name=self.employee.name,
-            employee_email=self.employee.user.email,
-            employee_address=self.employee.address,
-            stock_reference=self.stock_reference
-        )
+    def __str__(self):
+        return f"Venda arquivada {self.id} - {self.sale_quantity} unidades"
 
 
 class SaleHistory(models.Model):
     sale = models.ForeignKey(Sale, on_delete=models.SET_NULL, null=True, blank=True, related_name='history')
+    # Id da venda depois que archive_old_sales a move para SaleArchive (sale fica vazio)
+    archived_sale_id = models.UUIDField(null=True, blank=True, db_index=True)
     stock_reference = models.ForeignKey(StockReference, on_delete=models.CASCADE)
     
     product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True)
@@ -131,6 +179,39 @@ class SaleHistory(models.Model):
     def __str__(self):
         return f"Histórico de venda: {self.product_name} - {self.sale_quantity} unidades"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['stock_reference', 'date'], name='salehistory_ref_date_idx'),
+            models.Index(fields=['employee', 'date'], name='salehistory_emp_date_idx'),
+        ]
+
+
+class DailySalesRollup(models.Model):
+    """
+    Totais de vendas por estoque e por dia, atualizados a cada venda
+    registrada. Cada dia tem até ROLLUP_SHARDS linhas (shard), para que as
+    vendas simultâneas não esperem todas pela mesma linha; quem lê soma as
+    linhas.
+    """
+    ROLLUP_SHARDS = 16
+
+    stock_reference = models.ForeignKey(StockReference, on_delete=models.CASCADE, related_name='daily_sales')
+    date = models.DateField()
+    shard = models.PositiveSmallIntegerField(default=0)
+    sale_count = models.PositiveIntegerField(default=0)
+    total_quantity = models.PositiveIntegerField(default=0)
+    total_sales_value = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_acquisition_value = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['stock_reference', 'date', 'shard'], name='unique_daily_sales_rollup'),
+        ]
+
+    def __str__(self):
+        return f'{self.stock_reference_id} - {self.date} ({self.shard}): {self.total_sales_value}'
+
 
 class ActionHistory(models.Model):
   
@@ -138,19 +219,38 @@ class ActionHistory(models.Model):
     employee = models.ForeignKey(Employee, on_delete=models.CASCADE)
     action = models.CharField(max_length=255)
     sale = models.ForeignKey(Sale, null=True, on_delete=models.CASCADE)
+    archived_sale_id = models.UUIDField(null=True, blank=True, db_index=True)  # Ver SaleHistory.archived_sale_id
     action_date_timestamp = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f'Ação: {self.action} por {self.employee.name}'
 
-@receiver(post_save, sender=Sale)
-def create_action_history(sender, instance, created, **kwargs):
-    if created:
-        ActionHistory.objects.get_or_create(
-            employee=instance.employee,
-            action=f'Venda realizada: {instance.product.name} - Quantidade: {instance.sale_quantity}',
-            sale=instance
-        )
+    class Meta:
+        indexes = [
+            # Exportação incremental por (action_date_timestamp, id)
+            models.Index(fields=['action_date_timestamp', 'id'], name='actionhistory_ts_id_idx'),
+        ]
+
+class ReportJob(models.Model):
+    """Geração de relatório PDF em segundo plano; o arquivo fica no cache em disco"""
+    STATUS_CHOICES = [
+        ('pending', 'pending'),
+        ('done', 'done'),
+        ('failed', 'failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=20)  # 'employee' ou 'receipt'
+    params = models.JSONField(default=dict)
+    cache_key = models.CharField(max_length=255, db_index=True)  # Caminho relativo no cache em disco
+    filename = models.CharField(max_length=255)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'Relatório {self.kind} {self.id} ({self.status})'
 
 
 class Cart(models.Model):
@@ -180,18 +280,26 @@ class Stock(models.Model):
     quantity = models.PositiveIntegerField(default=0)  # Quantidade no estoque
     available = models.BooleanField(default=False)
     date_added = models.DateTimeField(auto_now_add=True)
+    # Última alteração; usada pelo modo incremental (?since=) da listagem de estoque.
+    # Os caminhos com update()/bulk_update() preenchem o campo explicitamente
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     responsible_user = models.ForeignKey(Employee, on_delete=models.CASCADE)  # Usuário responsável
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'stock_reference'], name='unique_stock_product_reference'),
+        ]
+
     def __str__(self):
         return f"{self.quantity} unidades de {self.product.name} em estoque"
 
     def save(self, *args, **kwargs):
         # Atribui automaticamente o estoque ativo se não estiver definido
-        if not self.stock_reference:
-            self.stock_reference = StockReference.objects.filter(is_active=True).first()  # Pega o estoque ativo
+        if not self.stock_reference_id:
+            self.stock_reference = StockReference.get_active()  # Pega o estoque ativo
 
         # Verifica se o produto já tem uma entrada no estoque
-        if not self.pk and Stock.objects.filter(product=self.product, stock_reference=StockReference.objects.filter(is_active=True).first()).exists():
+        if not self.pk and Stock.objects.filter(product=self.product, stock_reference=StockReference.get_active()).exists():
             raise ValueError(f"Estoque para o produto {self.product.name} já foi adicionado.")
 
         # Se for a primeira vez que o estoque é adicionado, subtrai a quantidade do produto
@@ -210,5 +318,99 @@ class Notification(models.Model):
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Notificações não lidas do estoque ativo (employee_notifications)
+            models.Index(fields=['stock_reference', '-created_at'], name='notification_unread_idx', condition=models.Q(is_read=False)),
+        ]
+        constraints = [
+            # Um único alerta aberto por produto e estoque
+            models.UniqueConstraint(
+                fields=['stock_reference', 'product_description'],
+                condition=models.Q(is_read=False),
+                name='unique_open_notification',
+            ),
+        ]
+
     def __str__(self):
         return f'Notificação para {self.employee.name}: {self.message}'
+
+
+class ChangeLog(models.Model):
+    """
+    Registro de alterações de Product, Stock e StockReference para a
+    sincronização dos caixas (orders.sync). O id é a versão: o cliente pede
+    as alterações com id maior que a última que recebeu. Ele vem do
+    SyncCounter, numa transação curta logo após o commit da alteração.
+    """
+    MODEL_CHOICES = [
+        ('product', 'product'),
+        ('stock', 'stock'),
+        ('stock_reference', 'stock_reference'),
+    ]
+    OP_CHOICES = [
+        ('upsert', 'upsert'),
+        ('delete', 'delete'),
+    ]
+
+    id = models.BigIntegerField(primary_key=True)
+    model = models.CharField(max_length=20, choices=MODEL_CHOICES)
+    object_id = models.CharField(max_length=64)
+    op = models.CharField(max_length=10, choices=OP_CHOICES, default='upsert')
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Compactação: alterações mais novas do mesmo objeto
+            models.Index(fields=['model', 'object_id', 'id'], name='changelog_object_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.id} {self.op} {self.model} {self.object_id}'
+
+
+class SyncCounter(models.Model):
+    """
+    Última versão distribuída ao ChangeLog (linha única). A transação que
+    grava as entradas do log atualiza esta linha e a mantém bloqueada até o
+    commit, então as versões ficam visíveis na ordem, sem lacunas.
+    """
+    id = models.PositiveSmallIntegerField(primary_key=True, default=1)
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f'Versão {self.version}'
+
+
+class SyncCompaction(models.Model):
+    """Execução da compactação do ChangeLog; versões até `horizon` não existem mais"""
+    horizon = models.BigIntegerField()
+    removed = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'Compactação até {self.horizon} ({self.removed} removidas)'
+
+
+class IdempotencyKey(models.Model):
+    """
+    Resposta de uma requisição enviada com o header Idempotency-Key
+    (orders.idempotency). A linha é criada antes de a view rodar e serve de
+    trava: status_code vazio quer dizer que a requisição ainda está em
+    andamento.
+    """
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)  # SHA-256 de método, caminho e corpo
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key_per_user'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} {self.key} ({self.status_code or "em andamento"})'
@@ -0,0 +1,75 @@
+from .events import notification_event, publish
+from .models import Notification
+
+# Padrão para produtos sem limite próprio (Product.low_stock_threshold)
+DEFAULT_LOW_STOCK_THRESHOLD = 10
+
+MAX_NOTIFICATIONS = 200
+
+
+def low_stock_message(product):
+    return f"O produto '{product.name}' está abaixo de {product.low_stock_threshold} unidades em estoque."
+
+
+def open_low_stock_alerts(employee, stock_reference, levels):
+    """
+    Abre o alerta de estoque baixo dos produtos que ficaram abaixo do limite.
+
+    `levels` é uma lista de (produto, quantidade restante). Existe no máximo um
+    alerta aberto (não lido) por produto e estoque, garantido pela restrição
+    única parcial em Notification; os que já existem são ignorados pelo banco
+    numa única inserção. Retorna o número de alertas realmente criados.
+    """
+    below = {
+        product.description: product
+        for product, quantity in levels
+        if quantity < product.low_stock_threshold
+    }
+    if not below:
+        return 0
+
+    # Só os produtos sem alerta aberto; a restrição única cobre corridas entre vendas
+    already_open = set(
+        Notification.objects.filter(
+            stock_reference=stock_reference, product_description__in=below, is_read=False,
+        ).values_list('product_description', flat=True)
+    )
+    alerts = [
+        Notification(
+            employee=employee,
+            message=low_stock_message(product),
+            product_description=description,
+            stock_reference=stock_reference,
+        )
+        for description, product in below.items()
+        if description not in already_open
+    ]
+    if not alerts:
+        return 0
+    Notification.objects.bulk_create(alerts, ignore_conflicts=True)
+    # Os ids são gerados aqui: os que estão no banco são os que foram
+    # inseridos; os ignorados pela restrição única não são publicados
+    inserted = list(Notification.objects.filter(pk__in=[alert.pk for alert in alerts]))
+    if inserted:
+        publish(stock_reference.id, 'notification', {'items': [notification_event(alert) for alert in inserted]})
+    return len(inserted)
+
+
+def resolve_low_stock_alerts(stock_reference, levels):
+    """
+    Fecha, num único UPDATE, os alertas dos produtos que voltaram ao limite.
+
+    `levels` é uma lista de (produto, quantidade atual). Retorna o número de
+    alertas resolvidos.
+    """
+    descriptions = [product.description for product, quantity in levels if quantity >= product.low_stock_threshold]
+    if not descriptions:
+        return 0
+    resolved = Notification.objects.filter(
+        stock_reference=stock_reference,
+        product_description__in=descriptions,
+        is_read=False,
+    ).update(is_read=True)
+    if resolved:
+        publish(stock_reference.id, 'notification_resolved', {'product_descriptions': descriptions})
+    return resolved
@@ -0,0 +1,107 @@
+from datetime import datetime
+
+from fpdf import FPDF
+
+# Este módulo não importa nada do Django: as funções de renderização rodam
+# nos processos do pool de relatórios (orders.reports).
+
+
+class PDF(FPDF):
+    def header(self):
+        # Logotipo (substitua 'path/to/logo.png' pelo caminho do seu logotipo)
+        #self.image('https://www.google.com/url?sa=i&url=https%3A%2F%2Fseekvectors.com%2Fpost%2Fimg-vector-logo&psig=AOvVaw0s2mDXYulUzs-tRKKDHHUc&ust=1736094791731000&source=images&cd=vfe&opi=89978449&ved=0CBQQjRxqFwoTCPidsp2_3IoDFQAAAAAdAAAAABAE', 10, 8, 33)
+        # Nome da empresa
+        self.set_font('Arial', 'B', 12)
+        self.cell(0, 10, 'YourCompany', ln=True, align='R')
+        self.set_font('Arial', '', 10)
+        self.cell(0, 5, '250 Executive Park Blvd, Suite 3400', ln=True, align='R')
+        self.cell(0, 5, 'San Francisco CA 94134, United States', ln=True, align='R')
+        self.ln(20)
+
+    def footer(self):
+        # Rodapé
+        self.set_y(-15)
+        self.set_font('Arial', 'I', 8)
+        self.cell(0, 10, f'Página {self.page_no()} | YourCompany - http://www.example.com', align='C')
+
+    def add_invoice_details(self, invoice_number, invoice_date, due_date):
+        self.set_font('Arial', 'B', 12)
+        self.cell(0, 10, f"Invoice {invoice_number}", ln=True)
+        self.set_font('Arial', '', 10)
+        self.cell(0, 6, f"Invoice Date: {invoice_date}", ln=True)
+        self.cell(0, 6, f"Due Date: {due_date}", ln=True)
+        self.ln(10)
+
+    def add_client_details(self, client_name, client_address):
+        self.set_font('Arial', 'B', 12)
+        self.cell(0, 10, client_name, ln=True)
+        self.set_font('Arial', '', 10)
+        for line in client_address:
+            self.cell(0, 6, line, ln=True)
+        self.ln(10)
+
+    def add_table(self, data):
+        self.set_font('Arial', 'B', 10)
+        self.cell(60, 10, 'Description', border=1, align='C')
+        self.cell(30, 10, 'Quantity', border=1, align='C')
+        self.cell(40, 10, 'Unit Price', border=1, align='C')
+        self.cell(30, 10, 'Taxes', border=1, align='C')
+        self.cell(30, 10, 'Amount', border=1, align='C')
+        self.ln()
+        self.set_font('Arial', '', 10)
+
+        for row in data:
+            self.cell(60, 10, row['description'], border=1)
+            self.cell(30, 10, str(row['quantity']), border=1, align='C')
+            self.cell(40, 10, f"${row['unit_price']:.2f}", border=1, align='C')
+            self.cell(30, 10, row['tax'], border=1, align='C')
+            self.cell(30, 10, f"${row['amount']:.2f}", border=1, align='C')
+            self.ln()
+
+    def add_totals(self, untaxed, tax, total):
+        self.ln(10)
+        self.set_font('Arial', 'B', 10)
+        self.cell(160, 10, 'Untaxed Amount', border=0, align='R')
+        self.cell(30, 10, f"${untaxed:.2f}", border=0, align='C')
+        self.ln()
+        self.cell(160, 10, 'Tax 15%', border=0, align='R')
+        self.cell(30, 10, f"${tax:.2f}", border=0, align='C')
+        self.ln()
+        self.cell(160, 10, 'Total', border=0, align='R')
+        self.cell(30, 10, f"${total:.2f}", border=0, align='C')
+
+
+def render_sales_report(invoice_number, client_name, client_address, rows):
+    """
+    Gera o PDF de um relatório de vendas e retorna os bytes.
+
+    `rows` é uma lista de (descrição, quantidade, preço unitário).
+    """
+    sales_data = []
+    for description, quantity, unit_price in rows:
+        # Cálculo do valor total (amount); o imposto é fixo em 15%
+        amount = float(unit_price) * quantity
+        sales_data.append({
+            "description": description,
+            "quantity": quantity,
+            "unit_price": float(unit_price),
+            "tax": "15%",
+            "amount": amount,
+        })
+
+    # Calcula os totais
+    untaxed_amount = sum(item['amount'] for item in sales_data)
+    tax_amount = untaxed_amount * 0.15
+    total_amount = untaxed_amount + tax_amount
+
+    pdf = PDF()
+    pdf.add_page()
+    pdf.add_invoice_details(
+        invoice_number=invoice_number,
+        invoice_date=datetime.now().strftime('%d/%m/%Y'),
+        due_date=datetime.now().strftime('%d/%m/%Y')
+    )
+    pdf.add_client_details(client_name, client_address)
+    pdf.add_table(sales_data)
+    pdf.add_totals(untaxed_amount, tax_amount, total_amount)
+    return pdf.output(dest='S').encode('latin1')
@@ -0,0 +1,200 @@
+import hashlib
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from functools import partial
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from people.models import Employee
+from .models import ReportJob, SaleHistory
+from .pdf import render_sales_report
+
+# Um job pendente mais antigo do que isso e que não está neste processo é
+# considerado perdido (processo reiniciado) e é enviado de novo ao pool
+STALE_AFTER = timedelta(minutes=2)
+
+_executor = None
+_executor_lock = threading.Lock()
+_in_flight = set()
+
+
+def get_cache_dir():
+    return Path(getattr(settings, 'REPORTS_CACHE_DIR', Path(settings.BASE_DIR) / 'report_cache'))
+
+
+def cache_path(cache_key):
+    return get_cache_dir() / cache_key
+
+
+def collect_report(kind, params):
+    """
+    Lê as linhas do relatório e calcula a chave do cache em disco.
+
+    A chave combina o tipo, o funcionário/venda, a data, um hash das linhas
+    de SaleHistory e a data de emissão, que vai no número da fatura: qualquer
+    venda nova gera um arquivo novo, e o PDF de ontem não é servido hoje com
+    o número antigo. Retorna
+    None quando não há dados, senão um dict com cache_key, filename e os
+    argumentos de render_sales_report.
+    """
+    histories = SaleHistory.objects.all()
+    if kind == 'employee':
+        histories = histories.filter(employee_id=params['employee_id'], date=params['date'])
+        label = params['employee_id']
+        prefix = f"employee/{params['employee_id']}/{params['date']}"
+    elif kind == 'receipt':
+        # Venda arquivada: o histórico guarda o id em archived_sale_id
+        histories = histories.filter(Q(sale_id=params['sale_id']) | Q(archived_sale_id=params['sale_id']))
+        label = params['sale_id']
+        prefix = f"receipt/{params['sale_id']}"
+    else:
+        raise ValueError(f"Tipo de relatório desconhecido: {kind}")
+
+    rows = list(
+        histories.order_by('id').values_list(
+            'id', 'product_name', 'sale_quantity', 'product_price', 'employee_id', 'employee_name', 'employee_address'
+        )
+    )
+    if not rows:
+        return None
+
+    # Dados do empregado (assumindo que todos têm os mesmos dados básicos)
+    employee = Employee.objects.filter(id=rows[0][4]).values('name', 'address').first()
+    if employee is None:
+        employee = {'name': rows[0][5], 'address': rows[0][6]}
+
+    digest = hashlib.sha256()
+    digest.update(repr((employee['name'], employee['address'])).encode('utf-8'))
+    for row in rows:
+        digest.update(repr(row[:4]).encode('utf-8'))
+
+    issued = datetime.now().strftime('%Y%m%d')
+    return {
+        'cache_key': f"{prefix}/{issued}/{digest.hexdigest()}.pdf",
+        'filename': f"Report-{label}.pdf",
+        'payload': {
+            'invoice_number': f"EMP-{label}-{issued}",
+            'client_name': employee['name'],
+            'client_address': [employee['address']],
+            'rows': [(name, quantity, float(price)) for _, name, quantity, price, *_ in rows],
+        },
+    }
+
+
+def enqueue_report(kind, params, report):
+    """Cria (ou reaproveita) o job do relatório e envia a renderização ao pool"""
+    job = ReportJob.objects.filter(cache_key=report['cache_key'], status='pending').first()
+    if job is None:
+        job = ReportJob.objects.create(
+            kind=kind, params=params, cache_key=report['cache_key'], filename=report['filename'],
+        )
+        _submit(job.id, job.cache_key, report['payload'])
+    elif is_stale(job):
+        _submit(job.id, job.cache_key, report['payload'])
+    return job
+
+
+def resume_job(job):
+    """Reenvia um job pendente que se perdeu (por exemplo, após reiniciar o processo)"""
+    report = collect_report(job.kind, job.params)
+    if report is None:
+        _finish(job.id, job.cache_key, None, ValueError("Nenhum dado encontrado para o relatório."))
+    elif cache_path(report['cache_key']).exists():
+        ReportJob.objects.filter(id=job.id).update(
+            cache_key=report['cache_key'], status='done', finished_at=timezone.now()
+        )
+    else:
+        ReportJob.objects.filter(id=job.id).update(cache_key=report['cache_key'], status='pending', created_at=timezone.now())
+        _submit(job.id, report['cache_key'], report['payload'])
+    job.refresh_from_db()
+    return job
+
+
+def is_stale(job):
+    return job.id not in _in_flight and job.created_at < timezone.now() - STALE_AFTER
+
+
+def get_executor():
+    """Pool de processos criado sob demanda; None quando REPORTS_MAX_WORKERS é 0"""
+    global _executor
+    max_workers = getattr(settings, 'REPORTS_MAX_WORKERS', 2)
+    if not max_workers:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _executor
+
+
+def _reset_executor():
+    global _executor
+    with _executor_lock:
+        _executor = None
+
+
+def _submit(job_id, cache_key, payload):
+    if job_id in _in_flight:
+        return
+    _in_flight.add(job_id)
+
+    executor = get_executor()
+    if executor is not None:
+        try:
+            future = executor.submit(render_sales_report, **payload)
+        except BrokenProcessPool:
+            _reset_executor()
+            executor = None
+        else:
+            future.add_done_callback(partial(_on_done, job_id, cache_key, threading.get_ident()))
+            return
+
+    # Sem pool: renderiza no próprio processo
+    try:
+        content = render_sales_report(**payload)
+    except Exception as e:
+        _finish(job_id, cache_key, None, e)
+    else:
+        _finish(job_id, cache_key, content, None)
+
+
+def _on_done(job_id, cache_key, submitter_thread, future):
+    try:
+        try:
+            content = future.result()
+        except Exception as e:
+            _finish(job_id, cache_key, None, e)
+        else:
+            _finish(job_id, cache_key, content, None)
+    finally:
+        # O callback roda numa thread do executor; a conexão dela não é
+        # fechada pelo ciclo de requisição do Django
+        if threading.get_ident() != submitter_thread:
+            connection.close()
+
+
+def _finish(job_id, cache_key, content, error):
+    try:
+        if error is None:
+            path = cache_path(cache_key)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Grava num temporário e renomeia, para nunca servir um arquivo pela metade
+            with tempfile.NamedTemporaryFile(dir=path.parent, delete=False, suffix='.tmp') as tmp:
+                tmp.write(content)
+            os.replace(tmp.name, path)
+            ReportJob.objects.filter(id=job_id).update(status='done', error='', finished_at=timezone.now())
+        else:
+            ReportJob.objects.filter(id=job_id).update(status='failed', error=str(error), finished_at=timezone.now())
+    finally:
+        _in_flight.discard(job_id)
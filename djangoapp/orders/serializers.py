@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Sale, Stock, Cart, CartItem, Product, Notification
+from .models import Sale, Stock, Cart, CartItem, Product, Notification, ProductImport
 from rest_framework.exceptions import ValidationError
 
 class ProductSerializer(serializers.ModelSerializer):
@@ -10,7 +10,7 @@ class ProductSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         # Busca o estoque ativo
-        active_stock_reference = StockReference.objects.filter(is_active=True).first()
+        active_stock_reference = StockReference.get_active()
         if not active_stock_reference:
             raise serializers.ValidationError({"stock_reference": "No active stock reference found."})
         
@@ -18,6 +18,36 @@ class ProductSerializer(serializers.ModelSerializer):
         validated_data['stock_reference'] = active_stock_reference
         return super().create(validated_data)
 
+class ProductListSerializer(serializers.Serializer):
+    """Serializer leve para a listagem de produtos, alimentado por .values()"""
+    id = serializers.UUIDField(read_only=True)
+    name = serializers.CharField(read_only=True)
+    description = serializers.CharField(read_only=True)
+    quantity = serializers.IntegerField(read_only=True)
+    acquisition_value = serializers.DecimalField(max_digits=10, decimal_places=2, coerce_to_string=False, read_only=True)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+
+class ProductImportRowSerializer(serializers.Serializer):
+    """Valida uma linha da importação em lote sem consultar o banco"""
+    name = serializers.CharField(max_length=255)
+    description = serializers.CharField(max_length=255)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    quantity = serializers.IntegerField(min_value=0, default=0)
+    acquisition_value = serializers.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+class SaleBatchItemSerializer(serializers.Serializer):
+    """Valida uma venda do lote enviado pelo caixa (sales/batch/)"""
+    client_id = serializers.UUIDField()
+    product_id = serializers.UUIDField()
+    sale_quantity = serializers.IntegerField(min_value=1)
+    client_timestamp = serializers.DateTimeField()
+
+class ProductImportSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ProductImport
+        fields = ['id', 'source', 'status', 'processed_rows', 'created_count', 'updated_count',
+                  'error_count', 'errors', 'created_at', 'finished_at']
+
 class CartItemSerializer(serializers.ModelSerializer):
     product_name = serializers.ReadOnlyField(source='product.name')
     product_price = serializers.ReadOnlyField(source='product.price')
@@ -0,0 +1,417 @@
+import random
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, F, Sum
+from django.utils import timezone
+
+from .models import (
+    ActionHistory, CartItem, DailySalesRollup, Product, ProductHistory, Sale, SaleHistory, Stock, StockReference,
+)
+from .cache import SALES, STOCK, bump
+from .events import publish, stock_event
+from .notifications import open_low_stock_alerts
+from .sync import record_many as record_sync_changes
+
+
+class CheckoutError(ValueError):
+    """Erro de negócio na venda, com o status HTTP que a view deve devolver."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def build_sale_history(sale, product, employee):
+    """Monta (sem salvar) o registro de SaleHistory de uma venda"""
+    return SaleHistory(
+        sale=sale,
+        product=product,
+        product_name=product.name,
+        product_price=product.price,
+        product_acquisition_value=product.acquisition_value,
+        sale_quantity=sale.sale_quantity,
+        sale_total_value=product.price * sale.sale_quantity,
+        employee=employee,
+        employee_name=employee.name,
+        employee_email=employee.user.email,
+        employee_address=employee.address,
+        stock_reference_id=sale.stock_reference_id,
+    )
+
+
+def build_action_history(sale, product, employee):
+    """Monta (sem salvar) o registro de ActionHistory de uma venda"""
+    return ActionHistory(
+        employee=employee,
+        action=f'Venda realizada: {product.name} - Quantidade: {sale.sale_quantity}',
+        sale=sale,
+    )
+
+
+def checkout_sale(employee, product_id, sale_quantity, stock_reference=None):
+    """
+    Realiza uma venda numa única transação.
+
+    A linha de Stock é bloqueada com select_for_update antes da verificação da
+    quantidade, e o decremento é feito com F() para que vendas simultâneas do
+    mesmo produto nunca vendam mais do que existe em estoque.
+
+    Retorna a venda criada e a quantidade que restou no estoque.
+    """
+    if sale_quantity <= 0:
+        raise CheckoutError("A quantidade vendida deve ser maior que zero.")
+
+    if stock_reference is None:
+        stock_reference = StockReference.get_active()
+    if stock_reference is None:
+        raise CheckoutError("Nenhum estoque ativo encontrado.")
+
+    with transaction.atomic():
+        stock = (
+            Stock.objects
+            .select_for_update(of=('self',))
+            .select_related('product')
+            .filter(product_id=product_id, stock_reference=stock_reference)
+            .order_by('pk')
+            .first()
+        )
+
+        if stock is None:
+            if not Product.objects.filter(id=product_id).exists():
+                raise CheckoutError("Produto não encontrado.", status_code=404)
+            raise CheckoutError("Estoque não encontrado para este produto.", status_code=404)
+
+        product = stock.product
+
+        if not stock.available:
+            raise CheckoutError(f"O produto {product.name} não está disponível para venda.")
+
+        if sale_quantity > stock.quantity:
+            raise CheckoutError("A quantidade vendida excede o estoque disponível.")
+
+        # Diminui o histórico do produto; sem histórico a venda não é permitida
+        updated = ProductHistory.objects.filter(product_id=product.id).update(
+            product_quantity=F('product_quantity') - sale_quantity
+        )
+        if not updated:
+            raise CheckoutError("Historico de producto nao encontrado", status_code=404)
+
+        Stock.objects.filter(pk=stock.pk).update(quantity=F('quantity') - sale_quantity, updated_at=timezone.now())
+        bump(STOCK)
+        record_sync_changes(Stock, [stock.pk])
+        remaining_quantity = stock.quantity - sale_quantity
+        stock.quantity = remaining_quantity
+        publish(stock_reference.id, 'stock', {'items': [stock_event(stock)]})
+
+        sale = Sale.objects.create(
+            employee=employee,
+            product=product,
+            sale_quantity=sale_quantity,
+            stock_reference=stock_reference,
+        )
+        history = build_sale_history(sale, product, employee)
+        history.save()
+        build_action_history(sale, product, employee).save()
+        record_daily_sales([history])
+        open_low_stock_alerts(employee, stock_reference, [(product, remaining_quantity)])
+
+    return sale, remaining_quantity
+
+
+def checkout_cart(employee, user, stock_reference=None):
+    """
+    Vende todos os itens do carrinho do usuário numa única transação.
+
+    Todas as linhas de Stock envolvidas são bloqueadas numa só consulta e
+    as vendas, históricos e notificações são gravados com bulk_create, de
+    modo que o número de consultas não depende do tamanho do carrinho.
+    Se algum item não puder ser vendido nada é gravado.
+
+    Retorna a lista de (venda, quantidade restante no estoque).
+    """
+    if stock_reference is None:
+        stock_reference = StockReference.get_active()
+    if stock_reference is None:
+        raise CheckoutError("Nenhum estoque ativo encontrado.")
+
+    with transaction.atomic():
+        items = list(CartItem.objects.filter(cart__user=user).select_related('product'))
+        if not items:
+            raise CheckoutError("O carrinho está vazio.")
+
+        # Um mesmo produto pode aparecer em mais de uma linha do carrinho
+        quantities = defaultdict(int)
+        products = {}
+        for item in items:
+            quantities[item.product_id] += item.quantity
+            products[item.product_id] = item.product
+
+        stocks = {
+            stock.product_id: stock
+            for stock in Stock.objects
+            .select_for_update(of=('self',))
+            .filter(product_id__in=quantities, stock_reference=stock_reference)
+            .order_by('pk')
+        }
+
+        for product_id, quantity in quantities.items():
+            product = products[product_id]
+            stock = stocks.get(product_id)
+            if stock is None:
+                raise CheckoutError(f"Estoque não encontrado para o produto {product.name}.", status_code=404)
+            if not stock.available:
+                raise CheckoutError(f"O produto {product.name} não está disponível para venda.")
+            if quantity <= 0:
+                raise CheckoutError(f"Quantidade inválida para o produto {product.name}.")
+            if quantity > stock.quantity:
+                raise CheckoutError(f"A quantidade do produto {product.name} excede o estoque disponível.")
+
+        histories = lock_product_histories(quantities)
+        missing = set(quantities) - set(histories)
+        if missing:
+            product = products[missing.pop()]
+            raise CheckoutError(f"Historico do producto {product.name} nao encontrado", status_code=404)
+
+        sales = [
+            Sale(
+                employee=employee,
+                product=products[product_id],
+                sale_quantity=quantity,
+                stock_reference=stock_reference,
+            )
+            for product_id, quantity in quantities.items()
+        ]
+        record_sales(employee, stock_reference, sales, stocks, histories)
+
+        CartItem.objects.filter(id__in=[item.id for item in items]).delete()
+
+    return [(sale, stocks[sale.product_id].quantity) for sale in sales]
+
+
+# Tentativas de checkout_batch quando um envio simultâneo grava os mesmos client_id
+BATCH_ATTEMPTS = 3
+
+
+def checkout_batch(employee, entries, stock_reference=None):
+    """
+    Grava vendas feitas offline pelo caixa e enviadas em lote.
+
+    Cada venda traz um client_id gerado no caixa: as que o mesmo funcionário
+    já enviou voltam como 'duplicate' sem efeito, então reenviar o mesmo lote
+    não muda nada. As demais são conferidas contra o estoque bloqueado, na ordem do
+    client_timestamp, e aceitas enquanto houver quantidade; a que não couber
+    é recusada sem impedir as outras. Tudo numa transação, com as mesmas
+    gravações em lote de checkout_cart.
+
+    `entries` são dicts validados (client_id, product_id, sale_quantity,
+    client_timestamp). Retorna um resultado por venda, na ordem recebida.
+    """
+    if stock_reference is None:
+        stock_reference = StockReference.get_active()
+    if stock_reference is None:
+        raise CheckoutError("Nenhum estoque ativo encontrado.")
+
+    for attempt in range(BATCH_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                results = _record_batch(employee, entries, stock_reference)
+            break
+        except IntegrityError:
+            # Outro envio gravou os mesmos client_id entre a leitura e a
+            # inserção; na nova tentativa eles aparecem como já recebidos
+            if attempt == BATCH_ATTEMPTS - 1:
+                raise
+
+    for entry, result in zip(entries, results):
+        result['client_id'] = entry['client_id']
+    return results
+
+
+def _record_batch(employee, entries, stock_reference):
+    results = [None] * len(entries)
+
+    # O estoque é bloqueado antes de procurar os client_id já recebidos: um
+    # reenvio simultâneo do mesmo lote espera aqui e depois enxerga as vendas
+    stocks = {
+        stock.product_id: stock
+        for stock in Stock.objects
+        .select_for_update(of=('self',))
+        .select_related('product')
+        .filter(product_id__in={entry['product_id'] for entry in entries}, stock_reference=stock_reference)
+        .order_by('pk')
+    }
+    histories = lock_product_histories(list(stocks))
+
+    existing = {
+        client_id: (sale_id, employee_id)
+        for client_id, sale_id, employee_id in Sale.objects.filter(
+            client_id__in=[entry['client_id'] for entry in entries]
+        ).values_list('client_id', 'id', 'employee_id')
+    }
+    first_index = {}
+    repeated = []
+    for index, entry in enumerate(entries):
+        client_id = entry['client_id']
+        if client_id in existing:
+            sale_id, employee_id = existing[client_id]
+            if employee_id == employee.id:
+                results[index] = {'status': 'duplicate', 'sale_id': sale_id}
+            else:
+                # Id de venda de outro funcionário: não revela nem reaproveita a venda
+                results[index] = {'status': 'rejected', 'error': "client_id já usado por outra venda."}
+        elif client_id in first_index:
+            repeated.append(index)
+        else:
+            first_index[client_id] = index
+
+    remaining = {product_id: stock.quantity for product_id, stock in stocks.items()}
+    sales = []
+    for index in sorted(first_index.values(), key=lambda i: (entries[i]['client_timestamp'], i)):
+        entry = entries[index]
+        product_id = entry['product_id']
+        stock = stocks.get(product_id)
+        if stock is None:
+            error = "Estoque não encontrado para este produto."
+        elif not stock.available:
+            error = f"O produto {stock.product.name} não está disponível para venda."
+        elif product_id not in histories:
+            error = f"Historico do producto {stock.product.name} nao encontrado"
+        elif entry['sale_quantity'] > remaining[product_id]:
+            error = "A quantidade vendida excede o estoque disponível."
+        else:
+            error = None
+        if error:
+            results[index] = {'status': 'rejected', 'error': error}
+            continue
+
+        remaining[product_id] -= entry['sale_quantity']
+        sale = Sale(
+            employee=employee,
+            product=stock.product,
+            sale_quantity=entry['sale_quantity'],
+            stock_reference=stock_reference,
+            client_id=entry['client_id'],
+            client_timestamp=entry['client_timestamp'],
+        )
+        sales.append(sale)
+        results[index] = {'status': 'accepted', 'sale_id': sale.id, 'remaining_stock': remaining[product_id]}
+
+    record_sales(employee, stock_reference, sales, stocks, histories)
+
+    # O mesmo client_id repetido dentro do lote tem o resultado da primeira
+    # ocorrência: duplicada da venda aceita, ou recusada pelo mesmo motivo
+    for index in repeated:
+        first = results[first_index[entries[index]['client_id']]]
+        if first['status'] == 'accepted':
+            results[index] = {'status': 'duplicate', 'sale_id': first['sale_id']}
+        else:
+            results[index] = dict(first)
+    return results
+
+
+def lock_product_histories(product_ids):
+    """ProductHistory dos produtos, bloqueados para a venda, por id de produto"""
+    return {
+        history.product_id: history
+        for history in ProductHistory.objects.select_for_update().filter(product_id__in=product_ids).order_by('pk')
+    }
+
+
+def record_sales(employee, stock_reference, sales, stocks, histories):
+    """
+    Grava vendas já validadas em lote (núcleo de checkout_cart e checkout_batch).
+
+    `stocks` e `histories` são as linhas bloqueadas por id de produto; as
+    quantidades são descontadas de uma vez por produto, e vendas, históricos,
+    registros de ação e alertas são gravados com bulk_create.
+    """
+    sold = defaultdict(int)
+    for sale in sales:
+        sold[sale.product_id] += sale.sale_quantity
+    if not sold:
+        return
+
+    now = timezone.now()
+    touched = []
+    for product_id, quantity in sold.items():
+        stock = stocks[product_id]
+        stock.quantity -= quantity
+        stock.updated_at = now
+        touched.append(stock)
+        histories[product_id].product_quantity -= quantity
+
+    Stock.objects.bulk_update(touched, ['quantity', 'updated_at'])
+    record_sync_changes(Stock, [stock.pk for stock in touched])
+    publish(stock_reference.id, 'stock', {'items': [stock_event(stock) for stock in touched]})
+    ProductHistory.objects.bulk_update([histories[product_id] for product_id in sold], ['product_quantity'])
+
+    Sale.objects.bulk_create(sales)
+    bump(STOCK, SALES)
+    sale_histories = SaleHistory.objects.bulk_create(
+        build_sale_history(sale, sale.product, employee) for sale in sales
+    )
+    record_daily_sales(sale_histories)
+    ActionHistory.objects.bulk_create(
+        build_action_history(sale, sale.product, employee) for sale in sales
+    )
+
+    products = {sale.product_id: sale.product for sale in sales}
+    open_low_stock_alerts(employee, stock_reference, [(products[stock.product_id], stock.quantity) for stock in touched])
+
+
+def sale_history_totals():
+    """Agregações de SaleHistory usadas pelo dashboard e pelo DailySalesRollup"""
+    return {
+        'sale_count': Count('id'),
+        'total_quantity': Sum('sale_quantity'),
+        'total_sales_value': Sum('sale_total_value'),
+        'total_acquisition_value': Sum(
+            F('sale_quantity') * F('product_acquisition_value'),
+            output_field=DecimalField(max_digits=14, decimal_places=2),
+        ),
+    }
+
+
+def record_daily_sales(histories):
+    """
+    Soma os SaleHistory recém-criados ao DailySalesRollup de cada estoque e
+    dia, numa linha (shard) sorteada: a linha fica bloqueada até o commit da
+    venda, e com uma só por dia todas as vendas do estoque esperariam por ela.
+    """
+    shard = random.randrange(DailySalesRollup.ROLLUP_SHARDS)
+    totals = defaultdict(lambda: defaultdict(int))
+    for history in histories:
+        day = totals[(history.stock_reference_id, history.date)]
+        day['sale_count'] += 1
+        day['total_quantity'] += history.sale_quantity
+        day['total_sales_value'] += history.sale_total_value
+        day['total_acquisition_value'] += history.sale_quantity * history.product_acquisition_value
+
+    for (stock_reference_id, date), day in totals.items():
+        rollup, _ = DailySalesRollup.objects.get_or_create(
+            stock_reference_id=stock_reference_id, date=date, shard=shard,
+        )
+        DailySalesRollup.objects.filter(pk=rollup.pk).update(
+            updated_at=timezone.now(),
+            **{field: F(field) + value for field, value in day.items()}
+        )
+
+
+def rebuild_daily_sales_rollup(stock_reference=None):
+    """Recalcula o DailySalesRollup a partir do SaleHistory; retorna o número de dias gravados"""
+    histories = SaleHistory.objects.all()
+    rollups = DailySalesRollup.objects.all()
+    if stock_reference is not None:
+        histories = histories.filter(stock_reference=stock_reference)
+        rollups = rollups.filter(stock_reference=stock_reference)
+
+    rows = histories.values('stock_reference_id', 'date').annotate(**sale_history_totals()).order_by()
+
+    with transaction.atomic():
+        rollups.delete()
+        created = DailySalesRollup.objects.bulk_create(
+            (DailySalesRollup(**row) for row in rows.iterator(chunk_size=2000)),
+            batch_size=1000,
+        )
+    return len(created)
@@ -1,7 +1,11 @@
-from django.db.models.signals import post_migrate
+from django.db import transaction
+from django.db.models.signals import post_delete, post_migrate, post_save
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import Employee, StockReference
+from .models import Employee, Notification, Product, Sale, Stock, StockReference
+from .cache import EMPLOYEES, PRODUCTS, SALES, STOCK, STOCK_REFERENCES, bump, mark_stock_reset
+from .events import notification_event, publish, stock_event
+from .sync import record as record_sync_change
 from django.contrib.auth.models import UserManager
 from django.utils.crypto import get_random_string
 
@@ -35,3 +39,75 @@ def create_default_records(sender, **kwargs):
                 is_active=True,
                 stock_reference=StockReference.objects.get(name='Estoque Padrão')  # Associa ao estoque padrão
             )
+
+
+@receiver(post_save, sender=StockReference)
+@receiver(post_delete, sender=StockReference)
+def clear_active_stock_reference(sender, **kwargs):
+    # Invalida agora e de novo após o commit, para que nenhum processo
+    # recoloque no cache o estoque ativo antigo durante a transação
+    StockReference.clear_active_cache()
+    transaction.on_commit(StockReference.clear_active_cache)
+    bump(STOCK_REFERENCES)
+    mark_stock_reset()
+
+
+# Listagens em cache (orders.cache); os caminhos em lote chamam bump() por conta própria
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def bump_products(sender, **kwargs):
+    bump(PRODUCTS)
+
+
+@receiver(post_save, sender=Stock)
+@receiver(post_delete, sender=Stock)
+def bump_stock(sender, **kwargs):
+    bump(STOCK)
+
+
+@receiver(post_save, sender=Sale)
+@receiver(post_delete, sender=Sale)
+def bump_sales(sender, **kwargs):
+    bump(SALES)
+
+
+@receiver(post_save, sender=Employee)
+@receiver(post_delete, sender=Employee)
+def bump_employees(sender, **kwargs):
+    # O nome do responsável aparece na listagem de estoque
+    bump(EMPLOYEES)
+    mark_stock_reset()
+
+
+@receiver(post_save, sender=Notification)
+def publish_notification(sender, instance, created, **kwargs):
+    # Os caminhos em lote (bulk_create/update) publicam por conta própria
+    kind = 'notification' if created else ('notification_read' if instance.is_read else 'notification')
+    publish(instance.stock_reference_id, kind, {'items': [notification_event(instance)]})
+
+
+@receiver(post_save, sender=Stock)
+def publish_stock(sender, instance, **kwargs):
+    publish(instance.stock_reference_id, 'stock', {'items': [stock_event(instance)]})
+
+
+@receiver(post_delete, sender=Stock)
+def publish_stock_deleted(sender, instance, **kwargs):
+    mark_stock_reset()
+    publish(instance.stock_reference_id, 'stock_deleted', {'items': [stock_event(instance)]})
+
+
+# Registro de alterações para a sincronização dos caixas (orders.sync);
+# os caminhos em lote chamam record_many() por conta própria
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Stock)
+@receiver(post_save, sender=StockReference)
+def record_sync_upsert(sender, instance, **kwargs):
+    record_sync_change(instance)
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Stock)
+@receiver(post_delete, sender=StockReference)
+def record_sync_delete(sender, instance, **kwargs):
+    record_sync_change(instance, op='delete')
@@ -0,0 +1,176 @@
+"""
+Sincronização do catálogo (Product, Stock, StockReference) para os caixas
+que ficam offline.
+
+O caixa baixa um snapshot com a versão e um hash do conteúdo e, ao voltar a
+ficar online, pede só as alterações (upserts e remoções) com versão maior que
+a última recebida. As alterações vêm do ChangeLog, preenchido pelos signals
+e, nos caminhos em lote, por record_many(). O comando compact_sync_log apaga
+as entradas antigas; quem está abaixo do horizonte recebe 410 e baixa o
+snapshot de novo.
+
+O hash é o SHA-256 do JSON de `tables` exatamente como enviado (chaves
+ordenadas, sem espaços, decimais como texto), então o caixa pode conferir a
+sua cópia depois de aplicar as alterações.
+"""
+import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import F, Max
+from django.utils import timezone
+
+from .models import ChangeLog, Product, Stock, StockReference, SyncCompaction, SyncCounter
+
+DEFAULT_BATCH_SIZE = 500
+MAX_BATCH_SIZE = 5000
+
+MODELS = {
+    'stock_reference': StockReference,
+    'product': Product,
+    'stock': Stock,
+}
+LABELS = {model: label for label, model in MODELS.items()}
+
+# Colunas enviadas de cada modelo
+COLUMNS = {
+    'stock_reference': ('id', 'name', 'is_active', 'updated_at'),
+    'product': ('id', 'stock_reference_id', 'name', 'description', 'price', 'quantity', 'low_stock_threshold',
+                'updated_at'),
+    'stock': ('id', 'stock_reference_id', 'product_id', 'quantity', 'available', 'updated_at'),
+}
+
+
+class SyncHorizonError(Exception):
+    """A versão do cliente é anterior à última compactação do ChangeLog"""
+
+    def __init__(self, horizon):
+        super().__init__("Versão anterior à compactação do histórico; baixe o snapshot novamente.")
+        self.horizon = horizon
+
+
+def encode(payload):
+    return json.dumps(payload, cls=DjangoJSONEncoder, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+def allocate(count):
+    """
+    Reserva `count` versões e retorna a primeira. Roda numa transação curta
+    própria (ver record_many): o UPDATE bloqueia a linha de SyncCounter até
+    o commit, então quem grava depois recebe versões maiores e só as torna
+    visíveis depois destas. Um rollback devolve as versões; não há lacunas.
+    """
+    if not SyncCounter.objects.filter(pk=1).update(version=F('version') + count):
+        # Banco sem a linha (criada pela migração; um flush dos testes a apaga)
+        SyncCounter.objects.get_or_create(pk=1, defaults={'version': max(
+            ChangeLog.objects.aggregate(last=Max('id'))['last'] or 0, horizon(),
+        )})
+        SyncCounter.objects.filter(pk=1).update(version=F('version') + count)
+    return SyncCounter.objects.values_list('version', flat=True).get(pk=1) - count + 1
+
+
+def _write(label, ids, op, now):
+    with transaction.atomic():
+        first = allocate(len(ids))
+        ChangeLog.objects.bulk_create(
+            ChangeLog(id=first + offset, model=label, object_id=str(pk), op=op, created_at=now)
+            for offset, pk in enumerate(ids)
+        )
+
+
+def record(instance, op='upsert'):
+    record_many(type(instance), [instance.pk], op)
+
+
+def record_many(model, ids, op='upsert'):
+    """
+    Registra alterações; os signals chamam record() e os caminhos sem
+    signals (update, bulk_create, bulk_update) chamam esta função.
+
+    O log é gravado depois do commit da alteração, numa transação curta:
+    a linha de SyncCounter fica bloqueada só durante o INSERT no ChangeLog,
+    e não durante a venda ou a importação inteira. Como o caixa recebe o
+    estado atual do objeto, e não o da versão, a ordem entre dois commits
+    concorrentes não importa.
+    """
+    ids = list(ids)
+    if not ids:
+        return
+    label, now = LABELS[model], timezone.now()
+
+    # Função e não partial: o on_commit robusto registra a falha pelo __qualname__
+    def write():
+        _write(label, ids, op, now)
+
+    transaction.on_commit(write, robust=True)
+
+
+def horizon():
+    return SyncCompaction.objects.aggregate(horizon=Max('horizon'))['horizon'] or 0
+
+
+def stable_version():
+    """Última versão com commit; todas as menores também já estão visíveis (ver allocate)"""
+    version = SyncCounter.objects.filter(pk=1).values_list('version', flat=True).first()
+    return max(version or 0, horizon())
+
+
+def snapshot():
+    """Corpo JSON do snapshot e o seu hash"""
+    version = stable_version()
+    tables = {
+        label: [list(row) for row in MODELS[label].objects.order_by('pk').values_list(*columns)]
+        for label, columns in COLUMNS.items()
+    }
+    encoded_tables = encode(tables)
+    digest = hashlib.sha256(encoded_tables).hexdigest()
+    header = encode({'version': version, 'hash': f'sha256:{digest}', 'columns': COLUMNS})
+    # Mesmo JSON de `tables` que entrou no hash
+    body = header[:-1] + b',"tables":' + encoded_tables + b'}'
+    return body, digest
+
+
+def changes(since, limit=DEFAULT_BATCH_SIZE):
+    """
+    Alterações com versão maior que `since`, em ordem, no máximo `limit`
+    entradas do log. Cada objeto aparece uma vez, com o estado atual (ou
+    como remoção, se já não existe). Retorna o payload da resposta.
+    """
+    current_horizon = horizon()
+    if since < current_horizon:
+        raise SyncHorizonError(current_horizon)
+
+    upto = stable_version()
+    entries = list(
+        ChangeLog.objects.filter(id__gt=since, id__lte=upto)
+        .order_by('id')
+        .values_list('id', 'model', 'object_id', 'op')[:limit + 1]
+    )
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+    version = entries[-1][0] if has_more else max(upto, since)
+
+    # Só a última alteração de cada objeto
+    latest = {}
+    for entry_id, label, object_id, op in entries:
+        latest.pop((label, object_id), None)
+        latest[(label, object_id)] = (entry_id, op)
+
+    rows = {}
+    for label, model in MODELS.items():
+        ids = [object_id for (entry_label, object_id), (_, op) in latest.items() if entry_label == label and op == 'upsert']
+        if ids:
+            rows[label] = {str(row['id']): row for row in model.objects.filter(pk__in=ids).values(*COLUMNS[label])}
+
+    result = []
+    for (label, object_id), (entry_id, op) in latest.items():
+        data = rows.get(label, {}).get(object_id) if op == 'upsert' else None
+        result.append({
+            'v': entry_id,
+            'model': label,
+            'id': object_id,
+            'op': 'upsert' if data is not None else 'delete',
+            'data': data,
+        })
+    return {'version': version, 'has_more': has_more, 'changes': result}
@@ -1,3 +1,748 @@
-from django.test import TestCase
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import OperationalError, connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from people.models import Employee
+from . import cart as cart_store
+from .models import (
+    CartItem, DailySalesRollup, Notification, Product, ProductHistory, ProductImport, Sale, SaleHistory, Stock,
+    StockReference,
+)
+from .importers import import_products
+from .reports import collect_report
+from .services import CheckoutError, checkout_batch, checkout_sale, rebuild_daily_sales_rollup, sale_history_totals
+
+
+def create_product(stock_reference, employee, name, quantity=10):
+    """Produto com histórico e estoque no estoque dado"""
+    product = Product.objects.create(
+        name=name, description=f'{name} descrição', price=10, quantity=quantity,
+        acquisition_value=4, stock_reference=stock_reference,
+    )
+    ProductHistory.objects.create(
+        product=product, stock_reference=stock_reference, acquisition_value=4, product_quantity=quantity,
+    )
+    Stock.objects.create(
+        product=product, stock_reference=stock_reference, quantity=quantity, available=True,
+        responsible_user=employee,
+    )
+    return product
+
+
+class DefaultRecordsMixin:
+    """Estoque e funcionário criados pelo post_migrate (orders.signals)"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.stock_reference = StockReference.objects.get(name='Estoque Padrão')
+        self.employee = Employee.objects.get(user__username='Saide Marrapaz')
+
+
+class ConcurrentCheckoutTests(DefaultRecordsMixin, TransactionTestCase):
+    """Centenas de vendas simultâneas do mesmo produto nunca vendem mais do que existe"""
+
+    THREADS = 10
+    SALES_PER_THREAD = 20
+    SALE_QUANTITY = 2
+    STOCK_QUANTITY = 250
+    ATTEMPTS = 2000
+
+    def test_concurrent_sales_never_oversell(self):
+        product = create_product(self.stock_reference, self.employee, 'Concorrente', self.STOCK_QUANTITY)
+        history_quantity = ProductHistory.objects.get(product=product).product_quantity
+        barrier = threading.Barrier(self.THREADS + 1)
+        done = threading.Event()
+        accepted = []
+        errors = []
+        seen_quantities = []
+
+        def sell_once():
+            for _ in range(self.ATTEMPTS):
+                try:
+                    checkout_sale(self.employee, product.id, self.SALE_QUANTITY, self.stock_reference)
+                except CheckoutError:
+                    return
+                except OperationalError:
+                    # O SQLite recusa a escrita simultânea em vez de esperar a trava
+                    time.sleep(random.uniform(0.001, 0.02))
+                    continue
+                accepted.append(True)
+                return
+            errors.append('sem resposta')
+
+        def sell():
+            try:
+                barrier.wait()
+                for _ in range(self.SALES_PER_THREAD):
+                    sell_once()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        def watch():
+            # Lê o estoque enquanto as vendas acontecem
+            try:
+                barrier.wait()
+                while not done.is_set():
+                    try:
+                        seen_quantities.append(Stock.objects.values_list('quantity', flat=True).get(pk=stock_pk))
+                    except OperationalError:
+                        pass
+                    time.sleep(0.01)
+            finally:
+                connection.close()
+
+        stock_pk = Stock.objects.get(product=product, stock_reference=self.stock_reference).pk
+        watcher = threading.Thread(target=watch)
+        threads = [threading.Thread(target=sell) for _ in range(self.THREADS)]
+        watcher.start()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        done.set()
+        watcher.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(accepted), self.STOCK_QUANTITY // self.SALE_QUANTITY)
+        self.assertTrue(seen_quantities)
+        self.assertGreaterEqual(min(seen_quantities), 0)
+        sold = len(accepted) * self.SALE_QUANTITY
+
+        stock = Stock.objects.get(pk=stock_pk)
+        self.assertEqual(stock.quantity, self.STOCK_QUANTITY - sold)
+        self.assertEqual(ProductHistory.objects.get(product=product).product_quantity, history_quantity - sold)
+        self.assertEqual(Sale.objects.filter(product=product).count(), len(accepted))
+        self.assertEqual(SaleHistory.objects.filter(product=product).count(), len(accepted))
+
+
+class SaleCreateTests(DefaultRecordsMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.employee.user)
+
+    def test_locked_cart_does_not_fail_the_sale(self):
+        product = create_product(self.stock_reference, self.employee, 'Carrinho travado')
+        with mock.patch.object(cart_store, 'LOCK_WAIT', 0), cart_store.locked(self.employee.user.id), \
+                self.assertLogs('orders.views', 'WARNING'):
+            response = self.client.post('/api/sales/', {'product': str(product.id), 'sale_quantity': 1}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Sale.objects.filter(product=product).count(), 1)
+
+
+class IdempotencyKeyTests(DefaultRecordsMixin, TestCase):
+    """Header Idempotency-Key (orders.idempotency) na criação de vendas"""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.employee.user)
+        self.product = create_product(self.stock_reference, self.employee, 'Idempotente')
+
+    def sell(self, key, quantity=1):
+        return self.client.post(
+            '/api/sales/', {'product': str(self.product.id), 'sale_quantity': quantity}, format='json',
+            HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_replay_returns_stored_response(self):
+        first = self.sell('venda-1')
+        second = self.sell('venda-1')
+        self.assertEqual(first.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', first)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(Sale.objects.filter(product=self.product).count(), 1)
+
+    def test_conflict_while_first_request_runs(self):
+        retries = []
+        real_checkout = checkout_sale
+
+        def checkout_with_retry(*args):
+            # O reenvio chega enquanto a primeira requisição ainda está na view
+            retries.append(self.sell('venda-2'))
+            return real_checkout(*args)
+
+        with mock.patch('orders.views.checkout_sale', side_effect=checkout_with_retry):
+            first = self.sell('venda-2')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual([response.status_code for response in retries], [409])
+        self.assertEqual(Sale.objects.filter(product=self.product).count(), 1)
+
+    def test_same_key_with_other_body(self):
+        self.assertEqual(self.sell('venda-3').status_code, 201)
+        response = self.sell('venda-3', quantity=2)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Sale.objects.filter(product=self.product).count(), 1)
+
+    def test_key_released_after_server_error(self):
+        self.client.raise_request_exception = False
+        with mock.patch('orders.views.cart_store.clear', side_effect=RuntimeError('falha')):
+            self.assertEqual(self.sell('venda-4').status_code, 500)
+        self.assertFalse(Sale.objects.filter(product=self.product).exists())
+
+        response = self.sell('venda-4')
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(Sale.objects.filter(product=self.product).count(), 1)
+
+
+class SaleBatchTests(DefaultRecordsMixin, TestCase):
+    """Vendas offline enviadas em lote pelo caixa (sales/batch/)"""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.employee.user)
+        self.product = create_product(self.stock_reference, self.employee, 'Lote', quantity=5)
+
+    def entry(self, quantity=1, **overrides):
+        return dict({
+            'client_id': str(uuid.uuid4()), 'product_id': str(self.product.id), 'sale_quantity': quantity,
+            'client_timestamp': timezone.now().isoformat(),
+        }, **overrides)
+
+    def send(self, entries):
+        response = self.client.post('/api/sales/batch/', {'sales': entries}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def stock_quantity(self):
+        return Stock.objects.get(product=self.product, stock_reference=self.stock_reference).quantity
+
+    def test_resent_batch_is_duplicate(self):
+        entries = [self.entry(), self.entry(2)]
+        first = self.send(entries)
+        self.assertEqual((first['accepted'], first['duplicate'], first['rejected']), (2, 0, 0))
+
+        second = self.send(entries)
+        self.assertEqual((second['accepted'], second['duplicate'], second['rejected']), (0, 2, 0))
+        self.assertEqual(
+            [result['sale_id'] for result in second['results']],
+            [result['sale_id'] for result in first['results']],
+        )
+        self.assertEqual(Sale.objects.filter(product=self.product).count(), 2)
+        self.assertEqual(self.stock_quantity(), 2)
+
+    def test_bad_rows_do_not_reject_the_batch(self):
+        data = self.send([
+            self.entry(2),
+            self.entry(sale_quantity=0),
+            self.entry(10),
+            self.entry(product_id=str(uuid.uuid4())),
+            self.entry(3),
+        ])
+        self.assertEqual(
+            [result['status'] for result in data['results']],
+            ['accepted', 'rejected', 'rejected', 'rejected', 'accepted'],
+        )
+        self.assertIn('sale_quantity', data['results'][1]['errors'])
+        self.assertEqual(Sale.objects.filter(product=self.product).count(), 2)
+        self.assertEqual(self.stock_quantity(), 0)
+
+
+class CartStoreTests(DefaultRecordsMixin, TestCase):
+    """Carrinho em cache (orders.cart) e a gravação em lote no banco"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.employee.user
+        patcher = mock.patch.object(cart_store.flusher, 'mark')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.products = [create_product(self.stock_reference, self.employee, f'Cache {i}') for i in range(3)]
+
+    def flush(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(cart_store.flush([self.user.id]), set())
+
+    def saved_quantities(self):
+        return {
+            str(product_id): quantity
+            for product_id, quantity in CartItem.objects.filter(cart__user=self.user).values_list('product_id', 'quantity')
+        }
+
+    def test_flush_writes_only_changed_items(self):
+        for product in self.products:
+            cart_store.add(self.user, product.id, 1, self.stock_reference)
+        self.flush()
+        self.assertEqual(self.saved_quantities(), {str(product.id): 1 for product in self.products})
+        self.assertEqual(cart_store._pending(cart_store.load(self.user)), [])
+
+        changed = self.products[1]
+        cart_store.add(self.user, changed.id, 2, self.stock_reference)
+        with mock.patch.object(CartItem.objects, 'bulk_create', wraps=CartItem.objects.bulk_create) as bulk_create:
+            self.flush()
+        written = bulk_create.call_args.args[0]
+        self.assertEqual([(str(item.product_id), item.quantity) for item in written], [(str(changed.id), 3)])
+        self.assertEqual(self.saved_quantities()[str(changed.id)], 3)
+
+        with mock.patch.object(CartItem.objects, 'bulk_create') as bulk_create:
+            self.flush()
+        bulk_create.assert_not_called()
+
+    def test_locked_cart_is_left_for_next_flush(self):
+        cart_store.add(self.user, self.products[0].id, 1, self.stock_reference)
+        with cart_store.locked(self.user.id):
+            self.assertEqual(cart_store.flush([self.user.id]), {self.user.id})
+        self.assertEqual(self.saved_quantities(), {})
+        self.flush()
+        self.assertEqual(self.saved_quantities(), {str(self.products[0].id): 1})
+
+
+class CartConcurrencyTests(DefaultRecordsMixin, TransactionTestCase):
+    """Adições e remoções simultâneas no mesmo carrinho não se perdem (locked())"""
+
+    THREADS = 10
+    ATTEMPTS = 500
+
+    def test_concurrent_add_and_remove(self):
+        user = self.employee.user
+        patcher = mock.patch.object(cart_store.flusher, 'mark')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        added = create_product(self.stock_reference, self.employee, 'Somado', quantity=100)
+        removed = [create_product(self.stock_reference, self.employee, f'Removido {i}') for i in range(self.THREADS)]
+        for product in removed:
+            cart_store.add(user, product.id, 1, self.stock_reference)
+        entry = cart_store.load(user)
+        item_ids = [entry['items'][str(product.id)]['id'] for product in removed]
+
+        barrier = threading.Barrier(2 * self.THREADS)
+        errors = []
+
+        def retrying(operation):
+            def run():
+                try:
+                    barrier.wait()
+                    for _ in range(self.ATTEMPTS):
+                        try:
+                            return operation()
+                        except OperationalError:
+                            # O SQLite recusa a escrita simultânea em vez de esperar a trava
+                            time.sleep(random.uniform(0.001, 0.01))
+                    errors.append('sem resposta')
+                except Exception as e:
+                    errors.append(e)
+                finally:
+                    connection.close()
+            return run
+
+        threads = [
+            threading.Thread(target=retrying(lambda: cart_store.add(user, added.id, 1, self.stock_reference)))
+            for _ in range(self.THREADS)
+        ] + [
+            threading.Thread(target=retrying(lambda item_id=item_id: cart_store.remove(user, item_id)))
+            for item_id in item_ids
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        items = cart_store.load(user)['items']
+        self.assertEqual(list(items), [str(added.id)])
+        self.assertEqual(items[str(added.id)]['quantity'], self.THREADS)
+
+
+class ProductImportTests(DefaultRecordsMixin, TestCase):
+    """Importação em lote de produtos (orders.importers)"""
+
+    def setUp(self):
+        super().setUp()
+        self.other_reference = StockReference.objects.create(name='Estoque Importação')
+        self.product = create_product(self.stock_reference, self.employee, 'Importado')
+        checkout_sale(self.employee, self.product.id, 3, self.stock_reference)
+
+    def run_import(self, rows, **kwargs):
+        lines = ['name,description,price,quantity,acquisition_value'] + rows
+        job = ProductImport.objects.create(source='produtos.csv')
+        # Produtos novos entram em outro estoque; os existentes ficam onde estão
+        import_products(io.BytesIO('\n'.join(lines).encode('utf-8')), 'csv', job, self.other_reference,
+                        batch_size=2, **kwargs)
+        job.refresh_from_db()
+        return job
+
+    def test_existing_product_keeps_its_quantity(self):
+        self.product.refresh_from_db()
+        quantity = self.product.quantity
+        job = self.run_import([
+            f'Importado novo,{self.product.description},12.50,50,5',
+            'Novo,Novo descrição,3,8,1',
+        ])
+        self.assertEqual((job.status, job.created_count, job.updated_count, job.error_count), ('done', 1, 1, 0))
+
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.name, self.product.price, self.product.quantity), ('Importado novo', 12.5, quantity))
+        self.assertEqual(self.product.stock_reference, self.stock_reference)
+        # As 3 unidades vendidas desde a exportação continuam descontadas
+        self.assertEqual(ProductHistory.objects.get(product=self.product).product_quantity, 7)
+
+        created = Product.objects.get(description='Novo descrição')
+        self.assertEqual((created.quantity, created.stock_reference), (8, self.other_reference))
+        self.assertEqual(ProductHistory.objects.get(product=created).product_quantity, 8)
+
+    def test_update_quantities_replaces_the_count(self):
+        self.run_import([f'Importado,{self.product.description},10,50,4'], update_quantities=True)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 50)
+        self.assertEqual(ProductHistory.objects.get(product=self.product).product_quantity, 50)
+
+    def test_row_errors_are_reported(self):
+        job = self.run_import([
+            'Válido 1,Válido 1 descrição,10,1,4',
+            'Sem preço,Sem preço descrição,,1,4',
+            'Negativo,Negativo descrição,10,-1,4',
+            'Válido 2,Válido 2 descrição,10,1,4',
+        ])
+        self.assertEqual((job.status, job.processed_rows, job.created_count, job.error_count), ('done', 4, 2, 2))
+        self.assertEqual([error['row'] for error in job.errors], [3, 4])
+        self.assertIn('price', job.errors[0]['errors'])
+        self.assertIn('quantity', job.errors[1]['errors'])
+        self.assertFalse(Product.objects.filter(description__in=['Sem preço descrição', 'Negativo descrição']).exists())
+
+
+class ListQueryCountTests(DefaultRecordsMixin, TestCase):
+    """As listagens fazem o mesmo número de consultas com 1 ou N linhas"""
+
+    ROWS = 20
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.employee.user)
+
+    def get(self, url):
+        # As listagens ficam em cache (orders.cache); cada chamada precisa ir ao banco
+        cache.clear()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def assertConstantQueries(self, url, add_row, count_rows):
+        add_row(0)
+        with CaptureQueriesContext(connection) as single:
+            self.assertEqual(count_rows(self.get(url)), 1)
+        for i in range(1, self.ROWS):
+            add_row(i)
+        with self.assertNumQueries(len(single)):
+            self.assertEqual(count_rows(self.get(url)), self.ROWS)
+
+    def add_product(self, i):
+        return create_product(self.stock_reference, self.employee, f'Produto {i:03d}')
+
+    def add_sale(self, i):
+        product = self.add_product(i)
+        checkout_sale(self.employee, product.id, 1, self.stock_reference)
+
+    def test_products(self):
+        self.assertConstantQueries('/api/products/', self.add_product, len)
+
+    def test_stock(self):
+        self.assertConstantQueries('/api/stockmanager/', self.add_product, len)
+
+    def test_employee_sales(self):
+        self.assertConstantQueries(
+            f'/api/employee/{self.employee.id}/sales/', self.add_sale, lambda data: len(data['sales']),
+        )
+
+
+class CartCheckoutQueryCountTests(DefaultRecordsMixin, TestCase):
+    """A venda do carrinho faz o mesmo número de consultas com 1 ou N itens"""
+
+    ITEMS = 20
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.employee.user)
+        # Sem o flusher os itens ficam pendentes no cache e a venda os grava
+        for patcher in (
+            mock.patch.object(cart_store.flusher, 'mark'),
+            # A venda sorteia a linha do DailySalesRollup; fixa numa que já existe
+            mock.patch('orders.services.random.randrange', return_value=0),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        product = create_product(self.stock_reference, self.employee, 'Carrinho inicial')
+        checkout_sale(self.employee, product.id, 1, self.stock_reference)
+
+    def fill_cart(self, count):
+        for i in range(count):
+            product = create_product(self.stock_reference, self.employee, f'Carrinho {count}-{i:03d}')
+            cart_store.add(self.employee.user, product.id, 1, self.stock_reference)
+
+    def checkout(self, count):
+        response = self.client.post('/api/cart/checkout/')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(len(response.data['sales']), count)
+
+    def test_checkout(self):
+        self.fill_cart(1)
+        with CaptureQueriesContext(connection) as single:
+            self.checkout(1)
+        self.fill_cart(self.ITEMS)
+        with self.assertNumQueries(len(single)):
+            self.checkout(self.ITEMS)
+
+
+class EmployeeSalesTests(DefaultRecordsMixin, TestCase):
+    """Vendas de um funcionário agrupadas por data e produto (employee/<id>/sales/)"""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.employee.user)
+        yesterday = timezone.localdate() - timedelta(days=1)
+        for i in range(7):
+            product = create_product(self.stock_reference, self.employee, f'Página {i}', 20)
+            sales = [checkout_sale(self.employee, product.id, quantity, self.stock_reference)[0] for quantity in (1, 2)]
+            if i % 2:
+                Sale.objects.filter(pk__in=[sale.pk for sale in sales]).update(date=yesterday)
+        self.url = f'/api/employee/{self.employee.id}/sales/'
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_groups_match_sales(self):
+        data = self.get(self.url)
+        self.assertEqual(len(data['sales']), 7)
+        for row in data['sales']:
+            sales = Sale.objects.filter(id__in=row['ids'])
+            self.assertEqual(len(row['ids']), 2)
+            self.assertEqual({(sale.product.name, str(sale.date)) for sale in sales}, {(row['product_name'], row['date'])})
+            self.assertEqual(row['total_quantity'], 3)
+
+    def test_keyset_pages_do_not_overlap(self):
+        expected = [(row['date'], row['product_name']) for row in self.get(self.url)['sales']]
+
+        pages = []
+        url = f'{self.url}?page_size=3'
+        while url:
+            data = self.get(url)
+            pages.append([(row['date'], row['product_name']) for row in data['sales']])
+            url = data['next']
+
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        rows = [row for page in pages for row in page]
+        self.assertEqual(len(set(rows)), len(rows))
+        self.assertEqual(rows, sorted(expected))
+
+
+class LeaderboardTests(DefaultRecordsMixin, TestCase):
+    """Ranking de vendas (sales-by-employee/) igual às somas por funcionário"""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.employee.user)
+        product = create_product(self.stock_reference, self.employee, 'Ranking', 50)
+        self.sellers = {}
+        for name, quantities in (('Ana', (1, 2)), ('Bruno', (5,)), ('Carla', (3,)), ('Diego', ())):
+            user = User.objects.create_user(username=name.lower(), password='senha')
+            seller = Employee.objects.create(
+                user=user, name=name, contact='000', address=f'Rua {name}', role='employee',
+                stock_reference=self.stock_reference,
+            )
+            for quantity in quantities:
+                checkout_sale(seller, product.id, quantity, self.stock_reference)
+            self.sellers[name] = seller
+
+    def expected(self, date_from=None):
+        """Soma de cada funcionário como a view fazia antes, um por vez"""
+        totals = {}
+        for seller in self.sellers.values():
+            histories = SaleHistory.objects.filter(employee=seller)
+            if date_from:
+                histories = histories.filter(date__gte=date_from)
+            totals[seller.name] = sum((h.sale_quantity * h.product_price for h in histories), Decimal('0'))
+        ordered = sorted(totals.items(), key=lambda item: (-item[1], item[0]))
+        return [
+            (name, total, 1 + sum(1 for other in totals.values() if other > total))
+            for name, total in ordered
+        ]
+
+    def ranking(self, query=''):
+        response = self.client.get(f'/api/sales-by-employee/{query}')
+        self.assertEqual(response.status_code, 200)
+        return [(row['employee_name'], Decimal(str(row['total_sales'])), row['rank']) for row in response.json()]
+
+    def test_matches_per_employee_sums(self):
+        expected = self.expected()
+        self.assertEqual([rank for _, _, rank in expected], [1, 2, 2, 4])
+        self.assertEqual(self.ranking(), expected)
+
+    def test_limit(self):
+        self.assertEqual(self.ranking('?limit=2'), self.expected()[:2])
+
+    def test_date_window(self):
+        today = timezone.localdate()
+        SaleHistory.objects.filter(employee=self.sellers['Bruno']).update(date=today - timedelta(days=3))
+        self.assertEqual(self.ranking(f'?from={today}&to={today}'), self.expected(date_from=today))
+        self.assertEqual(self.ranking(f'?from={today - timedelta(days=3)}'), self.expected())
+        self.assertEqual(self.client.get('/api/sales-by-employee/?from=ontem').status_code, 400)
+
+
+class DailySalesRollupTests(DefaultRecordsMixin, TestCase):
+    """Os totais do dashboard (DailySalesRollup) batem com o SaleHistory"""
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(self.employee.user)
+        products = [create_product(self.stock_reference, self.employee, f'Rollup {i}', 50) for i in range(5)]
+        for i, product in enumerate(products):
+            for quantity in range(1, i + 3):
+                checkout_sale(self.employee, product.id, quantity, self.stock_reference)
+        checkout_batch(self.employee, [
+            {'client_id': uuid.uuid4(), 'product_id': product.id, 'sale_quantity': 2,
+             'client_timestamp': timezone.now()}
+            for product in products
+        ], self.stock_reference)
+
+    def expected(self):
+        return SaleHistory.objects.filter(stock_reference=self.stock_reference).aggregate(**sale_history_totals())
+
+    def assertRollupMatches(self):
+        expected = self.expected()
+        rollups = DailySalesRollup.objects.filter(stock_reference=self.stock_reference)
+        for field in ('sale_count', 'total_quantity', 'total_sales_value', 'total_acquisition_value'):
+            self.assertEqual(sum(getattr(rollup, field) for rollup in rollups), expected[field], field)
+
+        cache.clear()
+        response = self.client.get('/api/static-value/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_sales_value'], expected['total_sales_value'])
+        self.assertEqual(response.data['total_acquisition_value'], expected['total_acquisition_value'])
+
+    def test_totals_match_sale_history(self):
+        self.assertRollupMatches()
+
+    def test_rebuild_matches_sale_history(self):
+        rebuild_daily_sales_rollup(self.stock_reference)
+        self.assertRollupMatches()
+
+
+class ReportCacheKeyTests(DefaultRecordsMixin, TestCase):
+    """O PDF em cache carrega o número da fatura do dia em que foi gerado"""
+
+    def test_issue_date_is_part_of_the_key(self):
+        product = create_product(self.stock_reference, self.employee, 'Relatório')
+        sale, _ = checkout_sale(self.employee, product.id, 1, self.stock_reference)
+        reports = []
+        for day in (datetime(2026, 1, 1, 12), datetime(2026, 1, 2, 12)):
+            with mock.patch('orders.reports.datetime') as clock:
+                clock.now.return_value = day
+                reports.append(collect_report('receipt', {'sale_id': str(sale.id)}))
+
+        first, second = reports
+        self.assertNotEqual(first['cache_key'], second['cache_key'])
+        self.assertIn('20260101', first['cache_key'])
+        self.assertTrue(first['payload']['invoice_number'].endswith('-20260101'))
+        self.assertTrue(second['payload']['invoice_number'].endswith('-20260102'))
+
+
+class BenchmarkCommandTests(SimpleTestCase):
+    """benchmark_api roda num banco de teste próprio e cobre as rotas"""
+
+    def test_smoke(self):
+        # Processo separado: o comando cria e apaga o próprio banco de teste
+        with tempfile.TemporaryDirectory() as tmp:
+            database = Path(tmp) / 'configurado.sqlite3'
+            baseline = Path(tmp) / 'baseline.json'
+            env = dict(
+                os.environ, DB_ENGINE='django.db.backends.sqlite3', DB_NAME=str(database),
+                CACHE_BACKEND='locmem', WEB_CONCURRENCY='1',
+            )
+            result = subprocess.run(
+                [sys.executable, 'manage.py', 'benchmark_api', '--products', '5', '--employees', '2',
+                 '--sales', '10', '--cart-items', '2', '--repeat', '1', '--baseline', str(baseline)],
+                cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, timeout=600,
+            )
+            self.assertEqual(result.returncode, 0, result.stderr)
+            self.assertFalse(database.exists())
+
+            routes = json.loads(baseline.read_text())['routes']
+            for name in ('token', 'cart-checkout', 'cart-remove', 'sales-batch', 'stockmanager-create',
+                         'stockmanager-update', 'stockmanager-destroy', 'products-create', 'products-import',
+                         'sales-export-csv', 'sync-changes', 'report-job', 'stock-reference-activate',
+                         'stock-reference-deactivate', 'notification-read'):
+                self.assertIn(name, routes)
+            self.assertEqual({name: row['status'] for name, row in routes.items() if row['status'] >= 400}, {})
+
+
+@skipUnless(connection.vendor == 'postgresql', 'EXPLAIN com os índices do PostgreSQL')
+class IndexUsageTests(DefaultRecordsMixin, TestCase):
+    """As consultas dos caminhos quentes usam os índices da migração 0005"""
+
+    def setUp(self):
+        super().setUp()
+        self.today = timezone.localdate()
+        # Vender abaixo do mínimo (low_stock_threshold) também abre um alerta
+        self.product = create_product(self.stock_reference, self.employee, 'Indexado')
+        checkout_sale(self.employee, self.product.id, 1, self.stock_reference)
+        self.assertTrue(Notification.objects.filter(is_read=False).exists())
+        # Com poucas linhas o planejador prefere ler a tabela inteira
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, index_name):
+        self.assertIn(index_name, queryset.explain())
+
+    def test_active_sales_by_employee(self):
+        self.assertUsesIndex(
+            Sale.objects.filter(employee=self.employee, is_archived=False, date__gte=self.today).order_by('date'),
+            'sale_active_emp_date_idx',
+        )
+
+    def test_sale_history_by_stock_reference(self):
+        self.assertUsesIndex(
+            SaleHistory.objects.filter(stock_reference=self.stock_reference, date__gte=self.today).order_by('date'),
+            'salehistory_ref_date_idx',
+        )
+
+    def test_sale_history_by_employee(self):
+        self.assertUsesIndex(
+            SaleHistory.objects.filter(employee=self.employee, date=self.today).order_by('date'),
+            'salehistory_emp_date_idx',
+        )
+
+    def test_unread_notifications(self):
+        self.assertUsesIndex(
+            Notification.objects.filter(is_read=False, stock_reference=self.stock_reference).order_by('-created_at')[:50],
+            'notification_unread_idx',
+        )
+
+    def test_stock_by_product(self):
+        self.assertUsesIndex(
+            Stock.objects.filter(product=self.product, stock_reference=self.stock_reference),
+            'unique_stock_product_reference',
+        )
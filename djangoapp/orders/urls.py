@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
@@ -10,8 +11,9 @@ from .views import CartItemsView
 from .views import TotalProductValueView
 from .views import employee_notifications, mark_as_read
 from .views import StockReferenceViewSet
-from .views import generate_employee_report
+from .views import generate_employee_report, report_job, report_job_download, SalesExportView, HistoryExportView
 from .views import UpdateEmployeeSector
+from .views import sync_snapshot, sync_changes
 
 
 
@@ -39,12 +41,38 @@ urlpatterns = [
     path("employee/<uuid:id>/sales/", SalesByEmployeeWithIdViewSet.as_view({'get': 'list'})),
     path('cart/', CartViewSet.as_view({'get': 'list'})),
     path('cart/add/', CartViewSet.as_view({'post': 'add_to_cart'})),
+    path('cart/checkout/', CartViewSet.as_view({'post': 'checkout'})),
     path('cart/remove/<uuid:pk>/', CartViewSet.as_view({'delete': 'remove_from_cart'})),
     path('cart/items/<uuid:employee_id>/', CartItemsView.as_view(), name='cart-items') ,
     path('total-product-value/', TotalProductValueView.as_view(), name='total-stock-value'),
     path('notifications/', employee_notifications, name='employee_notifications'),
     path('api/notifications/<uuid:notification_id>/read/', mark_as_read, name='mark_as_read'),
     path('generate-report/', generate_employee_report, name='generate_employee_report'),
+    path('reports/export/', SalesExportView.as_view(), name='sales-export'),
+    path('exports/sale-history/', HistoryExportView.as_view(), {'table': 'sale-history'}, name='sale-history-export'),
+    path('exports/action-history/', HistoryExportView.as_view(), {'table': 'action-history'}, name='action-history-export'),
+    path('reports/<uuid:job_id>/', report_job, name='report-job'),
+    path('reports/<uuid:job_id>/download/', report_job_download, name='report-job-download'),
+    path('sync/snapshot/', sync_snapshot, name='sync-snapshot'),
+    path('sync/changes/', sync_changes, name='sync-changes'),
     path('employee/<uuid:employee_id>/sector', UpdateEmployeeSector.as_view(), name='update-employee-sector'),
 
-]
\ No newline at end of file
+]
+
+if settings.ASYNC_VIEWS:
+    # Modo ASGI: as leituras mais pesadas usam as views assíncronas nos mesmos caminhos
+    # O feed (long-poll e SSE) segura a conexão aberta; sob WSGI ele prenderia
+    # o worker inteiro, então só existe no modo ASGI
+    from . import async_views
+    from .feed import notification_feed
+
+    urlpatterns = [
+        path('notifications/feed/', notification_feed, name='notification-feed'),
+        path('products/', async_views.product_list),
+        path('stockmanager/', async_views.stock_list),
+        path('notifications/', async_views.notification_list),
+        path('static-value/', async_views.sales_totals),
+        path('total-product-value/', async_views.product_value),
+        path('aggregate-sales-by-date/', async_views.sales_by_date),
+        path('sales-by-employee/', async_views.sales_by_employee),
+    ] + urlpatterns
@@ -1,7 +1,6 @@
 
 from rest_framework.views import APIView
 from rest_framework import viewsets
-from datetime import datetime
 from people.models import Employee
 from orders.models import Product
 from orders.models import Stock, Sale, Cart, CartItem
@@ -9,46 +8,52 @@ from orders.serializers import SaleSerializer
 from rest_framework.permissions import IsAuthenticated
 from orders.serializers import StockManagerSerializer
 from django.shortcuts import get_object_or_404
-from .serializers import ProductSerializer
+from .serializers import ProductSerializer, ProductListSerializer
+from .pagination import KeysetPagination
+from .importers import FORMATS as IMPORT_FORMATS, guess_format, import_products
+from .models import ProductImport
+from .serializers import ProductImportSerializer
 from .models import ProductHistory
 from rest_framework.decorators import action, api_view
 from .models import StockReference
 from .serializers import StockReferenceSerializer
 from rest_framework.viewsets import ModelViewSet
+from django.core.exceptions import ValidationError
+from .services import CheckoutError, checkout_batch, checkout_cart, checkout_sale
+from .sync import record_many as record_sync_changes
+from .cache import EMPLOYEES, PRODUCTS, SALES, STOCK, STOCK_REFERENCES, cached_list
+from .idempotency import idempotent
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def product_list_queryset(stock_reference):
+    """Produtos do estoque ativo, só com as colunas da listagem (também usado em async_views)"""
+    return Product.objects.filter(stock_reference=stock_reference).values(
+        'id', 'name', 'description', 'quantity', 'acquisition_value', 'price'
+    )
+
 
 class ProductViewSet(viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticated]
 
+    @cached_list(PRODUCTS, STOCK_REFERENCES)
     def list(self, request, *args, **kwargs):
-        # Filtrar produtos apenas com stock_reference ativo
-        active_stock_reference = StockReference.objects.filter(is_active=True).first()
-        queryset = Product.objects.filter(stock_reference=active_stock_reference).order_by('name')
-        serializer = self.get_serializer(queryset, many=True)
-
-        # Para cada produto, adicionar quantidade e valor de aquisição
-        filtered_products = []
-        for product in serializer.data:
-            try:
-                # Obter instância do produto
-                product_instance = Product.objects.get(id=product['id'])
-                product_quantity = product_instance.quantity
-                acquisition_value = product_instance.acquisition_value
-            except Product.DoesNotExist:
-                product_quantity = 0
-                acquisition_value = 0.00
-
-            filtered_products.append({
-                'id': product['id'],
-                'name': product['name'],
-                'description': product['description'],
-                'quantity': product_quantity,
-                'acquisition_value': acquisition_value,
-                'price': product['price']
-            })
+        # Filtrar produtos apenas com stock_reference ativo; uma única consulta
+        # com apenas as colunas exibidas
+        queryset = product_list_queryset(StockReference.get_active())
+
+        # Paginação por (name, id) quando o cliente envia page_size ou cursor
+        paginator = KeysetPagination(ordering=('name', 'id'))
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        if page is not None:
+            return paginator.get_paginated_response(ProductListSerializer(page, many=True).data)
 
-        return Response(filtered_products)
+        products = queryset.order_by('name', 'id').iterator(chunk_size=2000)
+        return Response(ProductListSerializer(products, many=True).data)
 
      # Desabilitar os métodos padrão de criação, atualização e deleção
     
@@ -60,12 +65,13 @@ class ProductViewSet(viewsets.ModelViewSet):
         return Response({'error': 'Método não permitido.'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
     
     @action(detail=False, methods=['post'], url_path='create')
+    @idempotent
     def create_product(self, request):
         serializer = self.get_serializer(data=request.data)
 
         if serializer.is_valid():
             # Verificar se existe um stock_reference ativo
-            active_stock_reference = StockReference.objects.filter(is_active=True).first()
+            active_stock_reference = StockReference.get_active()
             if not active_stock_reference:
                 return Response(
                     {'error': 'No active stock reference found.'}, 
@@ -98,6 +104,43 @@ class ProductViewSet(viewsets.ModelViewSet):
 
 
 
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_products(self, request):
+        """Importa um arquivo CSV ou JSON lines de produtos (campo `file`) em lotes"""
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'Envie o arquivo no campo "file".'}, status=status.HTTP_400_BAD_REQUEST)
+
+        fmt = request.query_params.get('format') or request.data.get('format') or guess_format(upload.name)
+        if fmt not in IMPORT_FORMATS:
+            return Response({'error': f'Formato inválido: {fmt}.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        active_stock_reference = StockReference.get_active()
+        if not active_stock_reference:
+            return Response({'error': 'No active stock reference found.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        job = ProductImport.objects.create(
+            employee=Employee.objects.filter(user=request.user).first(),
+            source=upload.name[:255],
+        )
+        update_quantities = str(
+            request.query_params.get('update_quantities') or request.data.get('update_quantities') or ''
+        ).lower() in ('1', 'true', 'yes')
+        try:
+            import_products(upload.file, fmt, job, active_stock_reference, update_quantities=update_quantities)
+        except Exception:
+            # O job já está como 'failed', com o erro; o cliente recebe 500
+            logger.exception('Importação de produtos %s falhou.', job.id)
+            return Response(ProductImportSerializer(job).data, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        return Response(ProductImportSerializer(job).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['get'], url_path=r'import/(?P<import_id>[0-9a-f-]+)')
+    def import_status(self, request, import_id=None):
+        """Progresso e relatório de erros de uma importação"""
+        job = get_object_or_404(ProductImport, id=import_id)
+        return Response(ProductImportSerializer(job).data)
+
     @action(detail=True, methods=['PUT'], url_path='update')
     def update_product(self, request, pk=None):
         try:
@@ -114,6 +157,7 @@ class ProductViewSet(viewsets.ModelViewSet):
         product.description = data.get('description', product.description)
         product.quantity = (product.quantity + int(data.get('quantity', product.quantity)))
         product.acquisition_value = data.get("acquisition_value", product.acquisition_value)
+        product.low_stock_threshold = int(data.get('low_stock_threshold', product.low_stock_threshold))
         product.save()
 
         acquisition_value = data.get('acquisition_value')
@@ -136,6 +180,7 @@ class StockReferenceViewSet(ModelViewSet):
     queryset = StockReference.objects.all()
     serializer_class = StockReferenceSerializer
     
+    @cached_list(STOCK_REFERENCES)
     def list(self, request, *args, **kwargs):
         queryset = self.queryset
         serializer = self.serializer_class(queryset, many=True)
@@ -146,9 +191,12 @@ class StockReferenceViewSet(ModelViewSet):
     @action(detail=True, methods=['post'], url_path='activate')
     def activate(self, request, pk=None):
         instance = self.get_object()
-        StockReference.objects.filter(is_active=True).update(is_active=False)
+        active_ids = list(StockReference.objects.filter(is_active=True).values_list('id', flat=True))
+        StockReference.objects.filter(id__in=active_ids).update(is_active=False)
+        record_sync_changes(StockReference, active_ids)
         instance.is_active = True
         instance.save()
+        StockReference.clear_active_cache()
         serializer = self.get_serializer(instance)
         return Response(serializer.data, status=status.HTTP_200_OK)
     
@@ -167,28 +215,94 @@ class StockReferenceViewSet(ModelViewSet):
         instance = self.get_object()
         instance.is_active = False
         instance.save()
+        StockReference.clear_active_cache()
         serializer = self.get_serializer(instance)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+def stock_list_queryset():
+    # O responsável vem no mesmo JOIN; antes cada linha fazia uma consulta a mais
+    return (
+        Stock.objects
+        .filter(stock_reference__is_active=True)
+        .select_related('product', 'responsible_user')
+        .order_by('product__name')
+    )
+
+
+def stock_list_row(item):
+    return {
+        'product_id': item.product.id,
+        'product_name': item.product.name,
+        'price': item.product.price,
+        'quantity': item.quantity,
+        'is_available': item.available,
+        'responsible_user': item.responsible_user.name,
+    }
+
+
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.db.models import Q
+from django.utils import timezone
+from .cache import stock_reset_at
+
+# Janela de sobreposição do ?since=: cobre transações que gravaram antes de a
+# versão ser lida e só fizeram commit depois (as linhas repetidas são inofensivas)
+STOCK_SINCE_OVERLAP = timedelta(seconds=5)
+
+
+def stock_version(value):
+    """Versão do modo incremental: microssegundos desde a época"""
+    return int(value.timestamp() * 1_000_000)
+
+
+def stock_changes(since, reset_at):
+    """
+    Modo incremental da listagem de estoque: (versão, completa, queryset).
+
+    Só as linhas alteradas (estoque ou produto) desde `since`, a versão
+    devolvida na sincronização anterior; se houve remoção ou troca do estoque
+    ativo depois dela (`reset_at`), a listagem completa. ValueError se
+    `since` é inválido.
+    """
+    version = stock_version(timezone.now())
+    try:
+        since = datetime.fromtimestamp(int(since) / 1_000_000, tz=dt_timezone.utc)
+    except (TypeError, ValueError, OverflowError, OSError):
+        raise ValueError("Parâmetro since inválido.")
+
+    queryset = stock_list_queryset()
+    if since <= reset_at:
+        return version, True, queryset
+    changed_after = since - STOCK_SINCE_OVERLAP
+    return version, False, queryset.filter(
+        Q(updated_at__gt=changed_after) | Q(product__updated_at__gt=changed_after)
+    )
+
+
 class StockManagerViewSet(viewsets.ModelViewSet):
     queryset = Stock.objects.all()
     serializer_class = StockManagerSerializer
     permission_classes = [IsAuthenticated]
 
+    @cached_list(STOCK, PRODUCTS, STOCK_REFERENCES, EMPLOYEES)
     def list(self, request, *args, **kwargs):
-        stock_items = Stock.objects.filter(stock_reference__is_active=True).select_related('product').order_by('product__name')
-        custom_data = []
-        for item in stock_items:
-            custom_data.append({
-                'product_id': item.product.id,
-                'product_name': item.product.name,
-                'price': item.product.price,
-                'quantity': item.quantity,
-                'is_available': item.available,
-                'responsible_user': item.responsible_user.name,
+        # ?since=<versão>: só o que mudou desde a última sincronização (since=0 para começar)
+        if 'since' in request.query_params:
+            try:
+                version, full, queryset = stock_changes(request.query_params['since'], stock_reset_at())
+            except ValueError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({
+                'version': version,
+                'full': full,
+                'results': [stock_list_row(item) for item in queryset],
             })
+
+        custom_data = [stock_list_row(item) for item in stock_list_queryset()]
         return Response(custom_data)
+
+    @idempotent
     def create(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
             return Response({"error": "você precisa estar autenticado para realizar esta ação."}, status=status.HTTP_403_FORBIDDEN)
@@ -206,7 +320,7 @@ class StockManagerViewSet(viewsets.ModelViewSet):
 
         # Verifica se o produto já está no estoque
         try:
-            stock_ref = StockReference.objects.filter(is_active=True).first()
+            stock_ref = StockReference.get_active()
             stock = Stock.objects.get(product_id=product_id, stock_reference_id=stock_ref)
             if stock:
                 return Response({"error": "O produto já está adicionado ao estoque. Use outro endpoint para ajustar a quantidade."}, status=status.HTTP_400_BAD_REQUEST)
@@ -220,7 +334,7 @@ class StockManagerViewSet(viewsets.ModelViewSet):
         except Product.DoesNotExist:
             return Response({"error": "Produto não encontrado."}, status=status.HTTP_404_NOT_FOUND)
 
-        stock_reference = StockReference.objects.filter(is_active=True).first()
+        stock_reference = StockReference.get_active()
 
         if not stock_reference:
             return Response({"error": "Nenhum estoque ativo encontrado."}, status=status.HTTP_400_BAD_REQUEST)
@@ -250,7 +364,7 @@ class StockManagerViewSet(viewsets.ModelViewSet):
 
         # Tenta obter o objeto de estoque relacionado ao produto
         try:
-            stock_reference = StockReference.objects.filter(is_active=True).first()
+            stock_reference = StockReference.get_active()
             stock_item = Stock.objects.get(product_id=product_id, stock_reference_id=stock_reference)
         except Stock.DoesNotExist:
             return Response({"error": "Produto não encontrado no estoque."}, status=status.HTTP_404_NOT_FOUND)
@@ -279,7 +393,7 @@ class StockManagerViewSet(viewsets.ModelViewSet):
 
         # Tenta obter o item de estoque existente
         try:
-            stock_reference = StockReference.objects.filter(is_active=True).first()
+            stock_reference = StockReference.get_active()
             stock_item = Stock.objects.get(product_id=product_id, stock_reference_id=stock_reference)
         except Stock.DoesNotExist:
             return Response({"error": "Produto não encontrado no estoque."}, status=status.HTTP_404_NOT_FOUND)
@@ -306,205 +420,231 @@ class StockManagerViewSet(viewsets.ModelViewSet):
         stock_item.quantity += new_quantity
         stock_item.save()
 
-        if int(stock_item.quantity) > 10:
-            try:
-                notifications = Notification.objects.filter(product_description=product.description)
-                
-                if not notifications.exists():
-                    return Response({"error": "O produto não foi notificado"}, status=status.HTTP_400_BAD_REQUEST)
-
-                # Atualiza o campo `is_read` de cada notificação e salva
-                for notification in notifications:
-                    notification.is_read = True
-                    notification.save()
-
-            except Notification.DoesNotExist:
-                return Response({"error": "O produto não foi notificado"}, status=status.HTTP_400_BAD_REQUEST)
-
+        # Fecha de uma vez os alertas de estoque baixo se o produto voltou ao limite
+        resolve_low_stock_alerts(stock_reference, [(product, stock_item.quantity)])
 
-       
         # Serializa os dados atualizados
         serializer = self.get_serializer(stock_item)
 
         return Response(serializer.data, status=status.HTTP_200_OK)
 
-from .models import SaleHistory
+from .models import SaleHistory, DailySalesRollup
+from django.db.models import Sum
+
+# Totais lidos do DailySalesRollup (também usado em async_views)
+SALES_TOTALS = {
+    'total_sales_value': Sum('total_sales_value'),
+    'total_acquisition_value': Sum('total_acquisition_value'),
+}
+
+
+def sales_totals_response(totals):
+    total_sales_value = totals['total_sales_value'] or 0
+    total_acquisition_value = totals['total_acquisition_value'] or 0
+
+    # Calcula o lucro (profit) apenas se houver vendas
+    if total_sales_value > 0:
+        profit = total_sales_value - total_acquisition_value
+        margin = (profit / total_sales_value) * 100
+    else:
+        profit = 0  # Se não houver vendas, o lucro é zero
+        margin = 0   # E a margem também é zero
+
+    return {
+        "total_sales_value": total_sales_value,
+        "total_acquisition_value": total_acquisition_value,
+        "profit": profit,
+        "margin": margin
+    }
+
+
 class TotalSalesAndAcquisitionValueView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
         try:
-            total_sales_value = 0
-            total_acquisition_value = 0
-            total_spend = 0
-
-            # Itera por todas as vendas e calcula o valor total de vendas e de aquisição
-            stock_reference = StockReference.objects.filter(is_active=True).first()
-            sales = SaleHistory.objects.filter(stock_reference=stock_reference)
-
-            for sale in sales:
-               
-                total_sales_value += sale.sale_total_value
-                total_acquisition_value += (sale.sale_quantity * sale.product_acquisition_value)
-
-            #
-            # Calcula o lucro (profit) apenas se houver vendas
-            if total_sales_value > 0:
-                profit = total_sales_value - total_acquisition_value
-                margin = (profit / total_sales_value) * 100
-            else:
-                profit = 0  # Se não houver vendas, o lucro é zero
-                margin = 0   # E a margem também é zero
-
-            return Response({
-                "total_sales_value": total_sales_value,
-                "total_acquisition_value": total_acquisition_value,
-                "profit": profit,
-                "margin": margin
-            }, status=status.HTTP_200_OK)
+            # Lê os totais pré-calculados por dia em vez de percorrer o SaleHistory
+            stock_reference = StockReference.get_active()
+            totals = DailySalesRollup.objects.filter(stock_reference=stock_reference).aggregate(**SALES_TOTALS)
+            return Response(sales_totals_response(totals), status=status.HTTP_200_OK)
 
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 from rest_framework import views
+from django.db.models import DecimalField, F
+
+# Soma feita no banco em vez de percorrer todos os ProductHistory em Python
+PRODUCT_VALUE_TOTAL = {
+    'total_stock_value': Sum(
+        F('acquisition_value') * F('product_quantity'),
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    ),
+}
+
+
+def product_value_queryset(stock_reference):
+    return ProductHistory.objects.filter(stock_reference=stock_reference, product__isnull=False)
+
 
 class TotalProductValueView(views.APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
         """Retorna o valor total de todos os produtos em estoque"""
-        total_value = 0
-        
-        # Itera sobre todos os itens no estoque
-        stock_reference = StockReference.objects.filter(is_active=True).first()
-        product_history = ProductHistory.objects.filter(stock_reference=stock_reference)
-      
-        for product in product_history:
-           
-            if product.product_id != None:
-                total_value += (product.acquisition_value * product.product_quantity)
-
+        stock_reference = StockReference.get_active()
+        totals = product_value_queryset(stock_reference).aggregate(**PRODUCT_VALUE_TOTAL)
 
         return Response({
-            "total_stock_value": (total_value)
+            "total_stock_value": totals['total_stock_value'] or 0
         }, status=status.HTTP_200_OK)
 
 
 
+from collections import defaultdict
+from django.db import IntegrityError
+from .serializers import SaleBatchItemSerializer
+
+# Vendas aceitas por requisição em sales/batch/
+SALE_BATCH_MAX_SIZE = 1000
+
+
 class SaleViewSet(viewsets.ModelViewSet):
     queryset = Sale.objects.all()
     serializer_class = SaleSerializer
     permission_classes = [IsAuthenticated]
 
 
+    @idempotent
     def create(self, request, *args, **kwargs):
         employee_id = request.data.get("employee")
         product_id = request.data.get("product")
-        sale_quantity = int(request.data.get("sale_quantity"))
-        stock_reference = StockReference.objects.filter(is_active=True).first()
-       
 
         try:
-            # Verifica se o produto existe
-            product = Product.objects.get(id=product_id)
-        except Product.DoesNotExist:
-            return Response({"error": "Produto não encontrado."}, status=status.HTTP_404_NOT_FOUND)
-
-        try:
-            # Verifica se o estoque existe para o produto
-            
-            stock = Stock.objects.filter(product=product, stock_reference=stock_reference).first()
-    
-            if not stock:
-                return Response({"error": "Estoque não encontrado para este produto."}, status=status.HTTP_404_NOT_FOUND)
-
-        except Stock.DoesNotExist:
-            return Response({"error": "Estoque não encontrado para este produto."}, status=status.HTTP_404_NOT_FOUND)
-
+            sale_quantity = int(request.data.get("sale_quantity"))
+        except (TypeError, ValueError):
+            return Response({"error": "Quantidade de venda inválida."}, status=status.HTTP_400_BAD_REQUEST)
 
+        # Obtenha a instância do Employee correspondente ao request.user
         try:
-            # check if productHistory exist by product
-            product_history = ProductHistory.objects.get(product_id=product_id)
-        except ProductHistory.DoesNotExist:
-            return Response({'error': "Historico de producto nao encontrado"},
-                            status=status.HTTP_404_NOT_FOUND)
-        
-       
-        # Verifica se o produto está disponível
-        if not stock.available:
-            return Response({"error": f"O produto {product.name} não está disponível para venda."}, status=status.HTTP_400_BAD_REQUEST)
-
-
-        # Verifica se a quantidade de venda é válida
-        if int(sale_quantity) > int(stock.quantity):
-            return Response({"error": "A quantidade vendida excede o estoque disponível."}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Aqui você pode criar a venda
-        try:
-            sale = Sale.objects.create(
-                employee_id=employee_id,
-                product=product,
-                sale_quantity=sale_quantity,
-                stock_reference_id=stock_reference.id
-            )
+            employee = Employee.objects.select_related('user').get(user=request.user)
+        except Employee.DoesNotExist:
+            return Response({"error": "Funcionário não encontrado."}, status=status.HTTP_404_NOT_FOUND)
 
-            # Diminui a quantidade no estoque
-            stock.quantity -= sale_quantity
-            product_history.product_quantity -= sale_quantity # take less of product_quantity reference by sell
-            
-            stock.save() 
-            product_history.save()
-            # Obtenha a instância do Employee correspondente ao request.user
+        # O vendedor pode ser informado no payload; por padrão é o funcionário autenticado
+        seller = employee
+        if employee_id and str(employee_id) != str(employee.id):
             try:
-                employee = Employee.objects.get(user=request.user)  # Certifique-se de que há um relacionamento entre Employee e User
-            except Employee.DoesNotExist:
+                seller = Employee.objects.select_related('user').get(id=employee_id)
+            except (Employee.DoesNotExist, ValidationError):
                 return Response({"error": "Funcionário não encontrado."}, status=status.HTTP_404_NOT_FOUND)
 
+        stock_reference = StockReference.get_active()
 
-              # Verifica se o estoque ficou abaixo de 10 e cria uma notificação
-            if int(stock.quantity) < 10:
-                self.create_notification(employee, product.name, product.description, stock_reference)
+        try:
+            sale, remaining_quantity = checkout_sale(seller, product_id, sale_quantity, stock_reference)
+        except CheckoutError as e:
+            return Response({"error": str(e)}, status=e.status_code)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+        # A venda já está gravada; um carrinho travado por outra requisição
+        # não pode transformá-la num erro (o cliente repetiria a venda)
+        try:
             self.clear_cart(request)
+        except CartError:
+            logger.warning('Carrinho do usuário %s não foi esvaziado após a venda %s.', request.user.pk, sale.id)
 
-            return Response({
-                "message": "Venda realizada com sucesso.",
-                "sale_id": sale.id
-            }, status=status.HTTP_201_CREATED)
-        
-            
-
-        except Exception as e:
-            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            "message": "Venda realizada com sucesso.",
+            "sale_id": sale.id,
+            "remaining_stock": remaining_quantity
+        }, status=status.HTTP_201_CREATED)
 
 
 
     def clear_cart(self, request):
         """Esvazia o carrinho do usuário"""
-        cart = Cart.objects.get(user=request.user)
-        CartItem.objects.filter(cart=cart).delete()
+        cart_store.clear(request.user)
         return Response({'message': 'Carrinho esvaziado com sucesso'}, status=status.HTTP_200_OK)
 
-   
-    def create_notification(self, employee, product_name, product_description, stock_reference):
-        """Cria uma notificação quando o estoque está abaixo de 10"""
-        notification_message = f"O produto '{product_name}' está abaixo de 10 unidades em estoque."
-        Notification.objects.create(
-            employee=employee,  # Assumindo que você tem um campo user em Notification que referencia o empregado
-            message=notification_message,
-            product_description=product_description,
-            created_at=datetime.now(),  # Supondo que você tenha um campo 'created_at' em Notification
-            stock_reference_id=stock_reference.id
-        )
+    @action(detail=False, methods=['post'], url_path='batch')
+    def batch(self, request):
+        """
+        Recebe as vendas feitas offline pelo caixa: {"sales": [{client_id,
+        product_id, sale_quantity, client_timestamp}, ...]}. Devolve o
+        resultado de cada venda (accepted, duplicate ou rejected), na ordem
+        enviada; reenviar o mesmo lote não grava nada de novo.
+        """
+        entries = request.data.get('sales') if isinstance(request.data, dict) else None
+        if not isinstance(entries, list) or not entries:
+            return Response({"error": "Envie as vendas em 'sales'."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(entries) > SALE_BATCH_MAX_SIZE:
+            return Response(
+                {"error": f"No máximo {SALE_BATCH_MAX_SIZE} vendas por lote."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
+        try:
+            employee = Employee.objects.get(user=request.user)
+        except Employee.DoesNotExist:
+            return Response({"error": "Funcionário não encontrado."}, status=status.HTTP_404_NOT_FOUND)
+
+        # Vendas malformadas são recusadas uma a uma, sem derrubar o lote
+        results = [None] * len(entries)
+        valid, positions = [], []
+        for index, entry in enumerate(entries):
+            serializer = SaleBatchItemSerializer(data=entry)
+            if serializer.is_valid():
+                valid.append(serializer.validated_data)
+                positions.append(index)
+            else:
+                client_id = entry.get('client_id') if isinstance(entry, dict) else None
+                results[index] = {'status': 'rejected', 'errors': serializer.errors, 'client_id': client_id}
+
+        if valid:
+            try:
+                for index, result in zip(positions, checkout_batch(employee, valid)):
+                    results[index] = result
+            except CheckoutError as e:
+                return Response({"error": str(e)}, status=e.status_code)
+            except IntegrityError:
+                # checkout_batch já tentou de novo BATCH_ATTEMPTS vezes; reenviar devolve 'duplicate'
+                return Response(
+                    {"error": "Lote sendo processado por outra requisição; tente novamente."},
+                    status=status.HTTP_409_CONFLICT,
+                )
+
+        counts = defaultdict(int)
+        for result in results:
+            counts[result['status']] += 1
+        return Response({
+            'accepted': counts['accepted'],
+            'duplicate': counts['duplicate'],
+            'rejected': counts['rejected'],
+            'results': results,
+        }, status=status.HTTP_200_OK)
 
 
-    
 # views.py
 # sales by employ with id
 from rest_framework.exceptions import NotFound
 from collections import defaultdict
-from operator import itemgetter
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.db import connection
+from django.db.models import Sum, F
+from django.utils.dateparse import parse_date
+
+def parse_date_param(request, name):
+    """Lê um parâmetro AAAA-MM-DD da query string; levanta ValueError se for inválido"""
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    parsed = parse_date(value)
+    if parsed is None:
+        raise ValueError(f"Data inválida: {value}")
+    return parsed
+
 
 class SalesByEmployeeWithIdViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
@@ -518,74 +658,156 @@ class SalesByEmployeeWithIdViewSet(viewsets.ViewSet):
         except Employee.DoesNotExist:
             raise NotFound("Funcionário não encontrado.")
 
-        # Consulta apenas vendas não arquivadas
-        sales = (
-            Sale.objects
-            .filter(employee=employee, is_archived=False)  # Exclui vendas arquivadas
-            .select_related('product')
-            .values('id', 'product__name', 'sale_quantity', 'date', 'product__price')
-            .order_by("product__name")
+        # Consulta apenas vendas não arquivadas, opcionalmente num intervalo de datas
+        sales = Sale.objects.filter(employee=employee, is_archived=False)
+        try:
+            date_from = parse_date_param(request, 'from')
+            date_to = parse_date_param(request, 'to')
+        except ValueError:
+            return Response({"detail": "Datas inválidas; use o formato AAAA-MM-DD."}, status=status.HTTP_400_BAD_REQUEST)
+        if date_from:
+            sales = sales.filter(date__gte=date_from)
+        if date_to:
+            sales = sales.filter(date__lte=date_to)
+
+        # Agrupa por produto e data no próprio banco
+        groups = (
+            sales
+            .values('product__name', 'date')
+            .annotate(
+                total_quantity=Sum('sale_quantity'),
+                total_value=Sum(F('sale_quantity') * F('product__price')),
+            )
         )
-
-        sales_summary = defaultdict(lambda: defaultdict(lambda: {'quantity': 0, 'ids': []}))
-        total_value = 0.0
-
-        # Agrupa e calcula o total de vendas e valores
-        for sale in sales:
-            product_name = sale['product__name']
-            sale_date = sale['date']
-            sale_quantity = int(sale['sale_quantity'])
-            product_price = float(sale['product__price'])
-            sale_id = sale['id']
-
-            sales_summary[product_name][sale_date]['quantity'] += sale_quantity
-            sales_summary[product_name][sale_date]['ids'].append(sale_id)
-
-            # Incrementa o valor total com base na quantidade e preço de cada venda
-            total_value += product_price * sale_quantity
-
-        sales_list = []
-        for product, dates in sales_summary.items():
-            for date, data in dates.items():
-                # Calcula o total para cada agrupamento de produto e data
-                total_product_value = sum(
-                    sale['sale_quantity'] * sale['product__price'] for sale in sales if sale['product__name'] == product and sale['date'] == date
-                )
-                sales_list.append({
-                    'product_name': product,
-                    'date': date,
-                    'total_quantity': data['quantity'],
-                    'ids': data['ids'],
-                    'total_value': total_product_value
-                })
-
-        sales_list_sorted = sorted(sales_list, key=itemgetter('date'))
-
-        return Response({
+        if connection.vendor == 'postgresql':
+            groups = groups.annotate(ids=ArrayAgg('id'))
+
+        paginator = KeysetPagination(ordering=('date', 'product__name'))
+        page = paginator.paginate_queryset(groups, request, view=self)
+        rows = page if page is not None else list(groups.order_by('date', 'product__name'))
+
+        if connection.vendor != 'postgresql':
+            # Sem ArrayAgg: busca os ids das vendas numa segunda consulta
+            ids = defaultdict(list)
+            id_rows = sales.values_list('product__name', 'date', 'id')
+            if rows:
+                id_rows = id_rows.filter(date__gte=rows[0]['date'], date__lte=rows[-1]['date'])
+            for product_name, sale_date, sale_id in id_rows:
+                ids[(product_name, sale_date)].append(sale_id)
+            for row in rows:
+                row['ids'] = ids[(row['product__name'], row['date'])]
+
+        sales_list = [
+            {
+                'product_name': row['product__name'],
+                'date': row['date'],
+                'total_quantity': row['total_quantity'],
+                'ids': row['ids'],
+                'total_value': row['total_value']
+            }
+            for row in rows
+        ]
+
+        total_value = sales.aggregate(total=Sum(F('sale_quantity') * F('product__price')))['total'] or 0
+
+        data = {
             "employee_id": id,
-            "sales": sales_list_sorted,
-            'total_sales': total_value
-        }, status=status.HTTP_200_OK)
+            "sales": sales_list,
+            'total_sales': float(total_value)
+        }
+        if page is not None:
+            data['next'] = paginator.get_next_link()
+        return Response(data, status=status.HTTP_200_OK)
+
+def sales_by_date_queryset():
+    return (
+        Sale.objects
+        .values('date')
+        .annotate(
+            total_sales=Sum(F('sale_quantity') * F('product__price')),
+            total_quantity=Sum('sale_quantity')
+        )
+    )
+
 
 class AggregateSalesByDateViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
 
+    @cached_list(SALES, PRODUCTS)
     def list(self, request):
-        sales = (
-            Sale.objects
-            .select_related('product')
-            .values('date')
-            .annotate(
-                total_sales=Sum(F('sale_quantity') * F('product__price')),
-                total_quantity=Sum('sale_quantity')
-            )
-        )
-        return Response(list(sales))
+        return Response(list(sales_by_date_queryset()))
     
 
 from rest_framework import viewsets, status
 from rest_framework.response import Response
-from django.db.models import Sum, F
+from django.db.models import Sum, F, Q, DecimalField, Value, Window
+from django.db.models.functions import Coalesce, Rank
+from decimal import Decimal
+import uuid
+
+
+def leaderboard_queryset(request):
+    """
+    Ranking de vendas dos funcionários numa única consulta agrupada.
+
+    Parâmetros opcionais: from/to (AAAA-MM-DD), stock_reference (UUID)
+    e limit (top N). Levanta ValueError com a mensagem para o cliente.
+    """
+    try:
+        date_from = parse_date_param(request, 'from')
+        date_to = parse_date_param(request, 'to')
+    except ValueError:
+        raise ValueError("Datas inválidas; use o formato AAAA-MM-DD.")
+
+    history_filter = Q()
+    if date_from:
+        history_filter &= Q(salehistory__date__gte=date_from)
+    if date_to:
+        history_filter &= Q(salehistory__date__lte=date_to)
+
+    stock_reference_id = request.query_params.get('stock_reference')
+    if stock_reference_id:
+        try:
+            history_filter &= Q(salehistory__stock_reference_id=uuid.UUID(stock_reference_id))
+        except ValueError:
+            raise ValueError("Estoque inválido.")
+
+    try:
+        limit = int(request.query_params['limit']) if request.query_params.get('limit') else None
+    except ValueError:
+        raise ValueError("Limite inválido.")
+
+    money = DecimalField(max_digits=14, decimal_places=2)
+    # O filtro fica dentro do Sum para manter os funcionários sem vendas no ranking
+    total_sales = Coalesce(
+        Sum(
+            F('salehistory__sale_quantity') * F('salehistory__product_price'),
+            filter=history_filter or None,
+            output_field=money,
+        ),
+        Value(Decimal('0')),
+        output_field=money,
+    )
+    ranking = (
+        Employee.objects
+        .filter(role='employee')
+        .annotate(total_sales=total_sales)
+        .annotate(rank=Window(expression=Rank(), order_by=F('total_sales').desc()))
+        .order_by('rank', 'name')
+        .values('id', 'name', 'total_sales', 'rank')
+    )
+    if limit is not None and limit > 0:
+        ranking = ranking[:limit]
+    return ranking
+
+
+def leaderboard_row(row):
+    return {
+        'employee_id': row['id'],
+        'employee_name': row['name'],
+        'total_sales': row['total_sales'],
+        'rank': row['rank']
+    }
 
 
 class SalesByEmployee(viewsets.ViewSet):
@@ -595,23 +817,13 @@ class SalesByEmployee(viewsets.ViewSet):
     """
 
     def list(self, request):
-        # Obtém todos os funcionários
-        employees = Employee.objects.filter(role='employee')
+        """Ranking de vendas dos funcionários (ver leaderboard_queryset)"""
+        try:
+            ranking = leaderboard_queryset(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Cria uma lista para armazenar os dados de vendas por funcionário
-        sales_data = []
-        
-        for employee in employees:
-            # Calcula o total de vendas para cada funcionário
-            total_sales = SaleHistory.objects.filter(employee_id=employee).annotate(
-                product_pricef=F('product_price')  # Obter o preço do produto relacionado
-            ).aggregate(total=Sum(F('sale_quantity') * F('product_price')))['total'] or 0
-
-            sales_data.append({
-                'employee_id': employee.id,
-                'employee_name': employee.name,
-                'total_sales': total_sales
-            })
+        sales_data = [leaderboard_row(row) for row in ranking]
 
         return Response(sales_data, status=status.HTTP_200_OK)
 
@@ -622,105 +834,127 @@ class CartItemsView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, employee_id):
-        try:
-            # 1. Obter o usuário a partir do employee_id
-            employee = Employee.objects.get(id=employee_id)
-            user = employee.user
-            
-            # 2. Obter o carrinho do usuário
-            cart = Cart.objects.get(user=user)
-            
-            # 3. Obter os itens do carrinho
-            cart_items = CartItem.objects.filter(cart=cart)
-
-            # 4. Serializar os dados
-            serialized_items = [
-                {
-                    'product_id': item.product.id,
-                    'quantity': item.quantity,
-                    'product_name': item.product.name,
-                    "product_price": item.product.price  # Supondo que o produto tenha um nome
-                    # Adicione mais campos conforme necessário
-                }
-                for item in cart_items
-            ]
-
-            return Response(serialized_items, status=status.HTTP_200_OK)
+        # O funcionário do próprio token (claim employee_id) dispensa a consulta
+        claims = request.auth if isinstance(request.auth, Token) else {}
+        if str(employee_id) == str(claims.get('employee_id')):
+            user = request.user
+        else:
+            try:
+                user = Employee.objects.select_related('user').get(id=employee_id).user
+            except Employee.DoesNotExist:
+                return Response({"error": "Funcionário não encontrado."}, status=status.HTTP_404_NOT_FOUND)
 
-        except Employee.DoesNotExist:
-            return Response({"error": "Funcionário não encontrado."}, status=status.HTTP_404_NOT_FOUND)
-        except Cart.DoesNotExist:
+        cart = cart_store.load(user, create=False)
+        if cart is None:
             return Response({"error": "Carrinho não encontrado."}, status=status.HTTP_404_NOT_FOUND)
 
-
-from .serializers import CartSerializer
+        serialized_items = [
+            {
+                'product_id': item['product_id'],
+                'quantity': item['quantity'],
+                'product_name': item['product_name'],
+                'product_price': item['product_price'],
+            }
+            for item in cart_store.items(cart, StockReference.get_active())
+        ]
+        return Response(serialized_items, status=status.HTTP_200_OK)
+
+
+from django.db import transaction
+from django.http import Http404
+from rest_framework_simplejwt.tokens import Token
+from functools import partial
+from . import cart as cart_store
+from .cart import CartError
 class CartViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
 
     def list(self, request):
-        """Retorna o carrinho do usuário"""
-        cart, created = Cart.objects.get_or_create(user=request.user)
-        serializer = CartSerializer(cart)
-        return Response(serializer.data)
+        """Retorna o carrinho do usuário (do cache, sem consultar o banco no caminho comum)"""
+        cart = cart_store.load(request.user)
+        return Response({
+            'id': cart['cart_id'],
+            'user': cart['user_id'],
+            'items': [
+                {
+                    'id': item['id'],
+                    'product': item['product_id'],
+                    'product_name': item['product_name'],
+                    'product_price': item['product_price'],
+                    'quantity': item['quantity'],
+                }
+                for item in cart_store.items(cart, StockReference.get_active())
+            ],
+            'created_at': cart['created_at'],
+        })
 
     @action(detail=False, methods=['post'], url_path='add')
+    @idempotent
     def add_to_cart(self, request):
         product_id = request.data.get('product_id')
-        quantity = int(request.data.get('quantity'))  # Garantindo que a quantidade seja um número inteiro
+        try:
+            quantity = int(request.data.get('quantity'))
+        except (TypeError, ValueError):
+            return Response({"error": "Quantidade inválida."}, status=status.HTTP_400_BAD_REQUEST)
+        if quantity <= 0:
+            return Response({"error": "Quantidade inválida."}, status=status.HTTP_400_BAD_REQUEST)
+
+        stock_reference = StockReference.get_active()
+        if stock_reference is None:
+            return Response({"error": "Nenhum estoque ativo encontrado."}, status=status.HTTP_400_BAD_REQUEST)
 
+        # Validado contra o retrato do estoque ativo em cache; a venda confere de novo
         try:
-            # Verificar se o produto existe
-            product = Product.objects.get(id=product_id)
+            product, cart_quantity = cart_store.add(request.user, product_id, quantity, stock_reference)
+        except CartError as e:
+            return Response({"error": str(e)}, status=e.status_code)
 
-            # Obter a quantidade disponível do produto no estoque usando StockManager
-            stock_manager_entry = Stock.objects.filter(product=product).first()
-            if stock_manager_entry is None:
-                return Response({"error": "Produto não está disponível em estoque."}, status=status.HTTP_404_NOT_FOUND)
-
-            
-             # Verificar se o produto está disponível
-            if not stock_manager_entry.available:
-                return Response({"error": "Produto não está disponível para adicionar ao carrinho."}, status=status.HTTP_400_BAD_REQUEST)
-
-            
-            available_quantity = stock_manager_entry.quantity  # Aqui estamos pegando a quantidade do estoque
-
-            # Verificar se a quantidade é válida
-            if quantity > available_quantity:
-                return Response({"error": "A quantidade solicitada excede o estoque disponível."}, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Obter ou criar o carrinho do usuário
-            cart, created = Cart.objects.get_or_create(user=request.user)
-
-            # Verificar se o produto já está no carrinho
-            cart_item, created = CartItem.objects.get_or_create(cart=cart, product=product, defaults={'quantity': quantity})
-
-            if not created:
-                # Se o item já está no carrinho, apenas incrementar a quantidade
-                new_quantity = cart_item.quantity + quantity
-                if new_quantity > available_quantity:
-                    return Response({"error": "A quantidade total excede o estoque disponível."}, status=status.HTTP_400_BAD_REQUEST)
-                cart_item.quantity = new_quantity
-                cart_item.save()
+        return Response({
+            "message": "Produto adicionado ao carrinho com sucesso.",
+            "product": {
+                "id": product_id,
+                "name": product['name'],
+                "quantity": cart_quantity,
+                "price": product['price']
+            }
+        }, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'], url_path='checkout')
+    @idempotent
+    def checkout(self, request):
+        """Vende todos os itens do carrinho de uma só vez e esvazia o carrinho"""
+        try:
+            employee = Employee.objects.select_related('user').get(user=request.user)
+        except Employee.DoesNotExist:
+            return Response({"error": "Funcionário não encontrado."}, status=status.HTTP_404_NOT_FOUND)
 
-            return Response({
-                "message": "Produto adicionado ao carrinho com sucesso.",
-                "product": {
-                    "id": product.id,
-                    "name": product.name,
-                    "quantity": cart_item.quantity,
-                    "price": product.price
-                }
-            }, status=status.HTTP_201_CREATED)
+        try:
+            # Grava o carrinho do cache e vende na mesma transação, com o carrinho travado
+            results = cart_store.checkout(request.user, partial(checkout_cart, employee, request.user))
+        except (CheckoutError, CartError) as e:
+            return Response({"error": str(e)}, status=e.status_code)
 
-        except Product.DoesNotExist:
-            return Response({"error": "Produto não encontrado."}, status=status.HTTP_404_NOT_FOUND)
+        return Response({
+            "message": "Venda realizada com sucesso.",
+            "sales": [
+                {
+                    "sale_id": sale.id,
+                    "product_id": sale.product_id,
+                    "sale_quantity": sale.sale_quantity,
+                    "remaining_stock": remaining_quantity
+                }
+                for sale, remaining_quantity in results
+            ]
+        }, status=status.HTTP_201_CREATED)
 
     def remove_from_cart(self, request, pk):
         """Remove um item do carrinho"""
-        cart = Cart.objects.get(user=request.user)
-        cart_item = get_object_or_404(CartItem, cart=cart, id=pk)
-        cart_item.delete()
+        try:
+            removed = cart_store.remove(request.user, pk)
+        except CartError as e:
+            return Response({"error": str(e)}, status=e.status_code)
+        if not removed:
+            raise Http404("No CartItem matches the given query.")
 
         return Response({'message': 'Produto removido do carrinho'}, status=status.HTTP_204_NO_CONTENT)
 
@@ -731,8 +965,26 @@ class CartViewSet(viewsets.ViewSet):
 from rest_framework.decorators import api_view
 from .models import Notification
 from .serializers import NotificationSerializer
+from .notifications import MAX_NOTIFICATIONS, resolve_low_stock_alerts
 from rest_framework.decorators import permission_classes
 
+def notifications_queryset(stock_reference, request):
+    """
+    Alertas abertos do estoque, mais recentes primeiro (índice parcial
+    notification_unread_idx); no máximo ?limit= linhas.
+    """
+    try:
+        limit = min(max(int(request.query_params.get('limit', 50)), 1), MAX_NOTIFICATIONS)
+    except ValueError:
+        limit = 50
+    return (
+        Notification.objects
+        .filter(is_read=False, stock_reference=stock_reference)
+        .order_by('-created_at')
+        .only('id', 'employee_id', 'message', 'product_description', 'is_read', 'created_at')[:limit]
+    )
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def employee_notifications(request):
@@ -742,9 +994,8 @@ def employee_notifications(request):
         }, status=status.HTTP_401_UNAUTHORIZED)
     try:
 
-        # Filtra as notificações abaixo de 10
-        stock_reference = StockReference.objects.filter(is_active=True).first()
-        notifications = Notification.objects.filter(is_read=False, stock_reference=stock_reference)
+        stock_reference = StockReference.get_active()
+        notifications = notifications_queryset(stock_reference, request)
         serializer = NotificationSerializer(notifications, many=True)
         return Response(serializer.data)
     
@@ -771,152 +1022,40 @@ def mark_as_read(request, notification_id):
     serializer = NotificationSerializer(notification)
     return Response(serializer.data)
 
-from django.http import HttpResponse, JsonResponse
-from fpdf import FPDF
-from datetime import datetime
-from .models import Sale
-
-
-class PDF(FPDF):
-    def header(self):
-        # Logotipo (substitua 'path/to/logo.png' pelo caminho do seu logotipo)
-        #self.image('https://www.google.com/url?sa=i&url=https%3A%2F%2Fseekvectors.com%2Fpost%2Fimg-vector-logo&psig=AOvVaw0s2mDXYulUzs-tRKKDHHUc&ust=1736094791731000&source=images&cd=vfe&opi=89978449&ved=0CBQQjRxqFwoTCPidsp2_3IoDFQAAAAAdAAAAABAE', 10, 8, 33)
-        # Nome da empresa
-        self.set_font('Arial', 'B', 12)
-        self.cell(0, 10, 'YourCompany', ln=True, align='R')
-        self.set_font('Arial', '', 10)
-        self.cell(0, 5, '250 Executive Park Blvd, Suite 3400', ln=True, align='R')
-        self.cell(0, 5, 'San Francisco CA 94134, United States', ln=True, align='R')
-        self.ln(20)
-
-    def footer(self):
-        # Rodapé
-        self.set_y(-15)
-        self.set_font('Arial', 'I', 8)
-        self.cell(0, 10, f'Página {self.page_no()} | YourCompany - http://www.example.com', align='C')
-
-    def add_invoice_details(self, invoice_number, invoice_date, due_date):
-        self.set_font('Arial', 'B', 12)
-        self.cell(0, 10, f"Invoice {invoice_number}", ln=True)
-        self.set_font('Arial', '', 10)
-        self.cell(0, 6, f"Invoice Date: {invoice_date}", ln=True)
-        self.cell(0, 6, f"Due Date: {due_date}", ln=True)
-        self.ln(10)
-
-    def add_client_details(self, client_name, client_address):
-        self.set_font('Arial', 'B', 12)
-        self.cell(0, 10, client_name, ln=True)
-        self.set_font('Arial', '', 10)
-        for line in client_address:
-            self.cell(0, 6, line, ln=True)
-        self.ln(10)
-
-    def add_table(self, data):
-        self.set_font('Arial', 'B', 10)
-        self.cell(60, 10, 'Description', border=1, align='C')
-        self.cell(30, 10, 'Quantity', border=1, align='C')
-        self.cell(40, 10, 'Unit Price', border=1, align='C')
-        self.cell(30, 10, 'Taxes', border=1, align='C')
-        self.cell(30, 10, 'Amount', border=1, align='C')
-        self.ln()
-        self.set_font('Arial', '', 10)
-
-        for row in data:
-            self.cell(60, 10, row['description'], border=1)
-            self.cell(30, 10, str(row['quantity']), border=1, align='C')
-            self.cell(40, 10, f"${row['unit_price']:.2f}", border=1, align='C')
-            self.cell(30, 10, row['tax'], border=1, align='C')
-            self.cell(30, 10, f"${row['amount']:.2f}", border=1, align='C')
-            self.ln()
-
-    def add_totals(self, untaxed, tax, total):
-        self.ln(10)
-        self.set_font('Arial', 'B', 10)
-        self.cell(160, 10, 'Untaxed Amount', border=0, align='R')
-        self.cell(30, 10, f"${untaxed:.2f}", border=0, align='C')
-        self.ln()
-        self.cell(160, 10, 'Tax 15%', border=0, align='R')
-        self.cell(30, 10, f"${tax:.2f}", border=0, align='C')
-        self.ln()
-        self.cell(160, 10, 'Total', border=0, align='R')
-        self.cell(30, 10, f"${total:.2f}", border=0, align='C')
-
-
-
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse, FileResponse
+from django.urls import reverse
+from .models import Sale, ReportJob
+from .pdf import PDF
+from .reports import cache_path, collect_report, enqueue_report, is_stale, resume_job
 
-def generate_employee_report(request):
-    # Obtém os parâmetros da requisição (id do empregado e data)
-    employee_id = request.GET.get('id')
-    report_date = request.GET.get('date')
 
+def report_response(request, kind, params):
+    """
+    Serve o PDF direto do cache em disco ou agenda a geração em segundo plano.
+
+    Quando o relatório ainda não existe, devolve 202 com o endereço para
+    acompanhar o job e baixar o arquivo quando estiver pronto.
+    """
     try:
-        # Busca os dados do histórico de vendas filtrados por empregado e data
-        sales_history = SaleHistory.objects.filter(
-            employee_id=employee_id,
-            date=report_date
-        )
+        report = collect_report(kind, params)
 
         # Verifica se há vendas para gerar o relatório
-        if not sales_history.exists():
+        if report is None:
             return HttpResponse(
                 "Nenhum dado encontrado para o relatório.",
                 status=404,
                 content_type='text/plain'
             )
 
-        # Dados do empregado (assumindo que todos têm os mesmos dados básicos)
-        employee = sales_history.first().employee
-        client_name = employee.name
-        client_address = [employee.address]
-
-        # Dados da venda
-        sales_data = []
-        for sale in sales_history:
-            # Cálculo do valor total (amount) e do imposto (tax)
-            amount = float(sale.product_price) * sale.sale_quantity
-            tax = amount * 0.15  # 15% de imposto
-
-            # Adiciona os dados da venda à lista de vendas
-            sales_data.append({
-                "description": sale.product_name,
-                "quantity": sale.sale_quantity,
-                "unit_price": float(sale.product_price),
-                "tax": "15%",  # Exemplo de imposto fixo
-                "amount": amount,
-            })
-
-        # Calcula os totais
-        untaxed_amount = sum(item['amount'] for item in sales_data)
-        tax_amount = untaxed_amount * 0.15
-        total_amount = untaxed_amount + tax_amount
+        path = cache_path(report['cache_key'])
+        if path.exists():
+            return pdf_file_response(path, report['filename'])
 
-        # Gera o PDF mantendo o formato original
-        pdf = PDF()
-        pdf.add_page()
-
-        # Adiciona os detalhes da fatura
-        pdf.add_invoice_details(
-            invoice_number=f"EMP-{employee_id}-{datetime.now().strftime('%Y%m%d')}",
-            invoice_date=datetime.now().strftime('%d/%m/%Y'),
-            due_date=datetime.now().strftime('%d/%m/%Y')
-        )
-
-        # Adiciona os dados do cliente
-        pdf.add_client_details(client_name, client_address)
-
-        # Adiciona os dados da tabela de vendas
-        pdf.add_table(sales_data)
-
-        # Adiciona os totais de venda
-        pdf.add_totals(untaxed_amount, tax_amount, total_amount)
-
-        # Gera o PDF e retorna como resposta
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = f'inline; filename="Report-{employee_id}.pdf"'
-        response['X-Status'] = 'true'  # Adiciona o cabeçalho indicando sucesso
-        response.write(pdf.output(dest='S').encode('latin1'))
-        return response
+        job = enqueue_report(kind, params, report)
+        # Com REPORTS_MAX_WORKERS = 0 o arquivo já foi gerado aqui mesmo
+        if path.exists():
+            return pdf_file_response(path, report['filename'])
+        return report_job_response(request, job, status=202)
 
     except Exception as e:
         # Trata erros e adiciona o status false
@@ -929,88 +1068,58 @@ def generate_employee_report(request):
         return response
 
 
+def pdf_file_response(path, filename):
+    response = FileResponse(open(path, 'rb'), content_type='application/pdf')
+    response['Content-Disposition'] = f'inline; filename="{filename}"'
+    response['X-Status'] = 'true'  # Adiciona o cabeçalho indicando sucesso
+    return response
 
-def receipt_sale(request):
-    
-    sale_id = request.GET.get('sale_id')
-    
-
-    try:
-        # Busca os dados do histórico de vendas filtrados por empregado e data
-        sales_history = SaleHistory.objects.filter(
-            sale_id=sale_id
-        )
 
-        # Verifica se há vendas para gerar o relatório
-        if not sales_history.exists():
-            return HttpResponse(
-                "Nenhum dado encontrado para o relatório.",
-                status=404,
-                content_type='text/plain'
-            )
+def report_job_response(request, job, status=200):
+    return JsonResponse({
+        'job_id': str(job.id),
+        'status': job.status,
+        'error': job.error or None,
+        'status_url': request.build_absolute_uri(reverse('report-job', args=[job.id])),
+        'download_url': request.build_absolute_uri(reverse('report-job-download', args=[job.id])),
+    }, status=status)
 
-        # Dados do empregado (assumindo que todos têm os mesmos dados básicos)
-        employee = sales_history.first().employee
-        client_name = employee.name
-        client_address = [employee.address]
-
-        # Dados da venda
-        sales_data = []
-        for sale in sales_history:
-            # Cálculo do valor total (amount) e do imposto (tax)
-            amount = float(sale.product_price) * sale.sale_quantity
-            tax = amount * 0.15  # 15% de imposto
-
-            # Adiciona os dados da venda à lista de vendas
-            sales_data.append({
-                "description": sale.product_name,
-                "quantity": sale.sale_quantity,
-                "unit_price": float(sale.product_price),
-                "tax": "15%",  # Exemplo de imposto fixo
-                "amount": amount,
-            })
 
-        # Calcula os totais
-        untaxed_amount = sum(item['amount'] for item in sales_data)
-        tax_amount = untaxed_amount * 0.15
-        total_amount = untaxed_amount + tax_amount
+def generate_employee_report(request):
+    # Obtém os parâmetros da requisição (id do empregado e data)
+    employee_id = request.GET.get('id')
+    report_date = request.GET.get('date')
+    return report_response(request, 'employee', {'employee_id': employee_id, 'date': report_date})
 
-        # Gera o PDF mantendo o formato original
-        pdf = PDF()
-        pdf.add_page()
 
-        # Adiciona os detalhes da fatura
-        pdf.add_invoice_details(
-            invoice_number=f"EMP-{sale_id}-{datetime.now().strftime('%Y%m%d')}",
-            invoice_date=datetime.now().strftime('%d/%m/%Y'),
-            due_date=datetime.now().strftime('%d/%m/%Y')
-        )
+def receipt_sale(request):
+    sale_id = request.GET.get('sale_id')
+    return report_response(request, 'receipt', {'sale_id': sale_id})
 
-        # Adiciona os dados do cliente
-        pdf.add_client_details(client_name, client_address)
 
-        # Adiciona os dados da tabela de vendas
-        pdf.add_table(sales_data)
+def report_job(request, job_id):
+    """Estado de um relatório agendado"""
+    job = get_object_or_404(ReportJob, id=job_id)
+    if job.status == 'pending' and is_stale(job):
+        job = resume_job(job)
+    return report_job_response(request, job)
 
-        # Adiciona os totais de venda
-        pdf.add_totals(untaxed_amount, tax_amount, total_amount)
 
-        # Gera o PDF e retorna como resposta
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = f'inline; filename="Report-{sale_id}.pdf"'
-        response['X-Status'] = 'true'  # Adiciona o cabeçalho indicando sucesso
-        response.write(pdf.output(dest='S').encode('latin1'))
-        return response
+def report_job_download(request, job_id):
+    """Baixa o PDF de um relatório pronto"""
+    job = get_object_or_404(ReportJob, id=job_id)
+    if job.status == 'done':
+        path = cache_path(job.cache_key)
+        if path.exists():
+            return pdf_file_response(path, job.filename)
+        # O arquivo foi removido do cache: gera de novo
+        job = resume_job(job)
+    elif job.status == 'pending' and is_stale(job):
+        job = resume_job(job)
 
-    except Exception as e:
-        # Trata erros e adiciona o status false
-        response = HttpResponse(
-            f"Erro ao gerar o relatório: {str(e)}",
-            status=500,
-            content_type='text/plain'
-        )
-        response['X-Status'] = 'false'
-        return response
+    if job.status == 'done':
+        return pdf_file_response(cache_path(job.cache_key), job.filename)
+    return report_job_response(request, job, status=202 if job.status == 'pending' else 500)
 
 
 class UpdateEmployeeSector(APIView):
@@ -1039,4 +1148,155 @@ class UpdateEmployeeSector(APIView):
 
         return Response({
             "message": f"Setor do funcionário {employee_id} atualizado para: {sector.name}"
-        }, status=status.HTTP_200_OK)
\ No newline at end of file
+        }, status=status.HTTP_200_OK)
+
+from django.http import StreamingHttpResponse
+from .exports import CONTENT_TYPES, EXTENSIONS, FORMATS as EXPORT_FORMATS, export_rows, stream_export
+from .exports import HISTORY_FORMATS, HISTORY_TABLES, history_rows, stream_table
+
+
+class SalesExportView(APIView):
+    """
+    Exporta as vendas de um intervalo de datas para vários funcionários.
+
+    Parâmetros: from e to (AAAA-MM-DD, obrigatórios), employee (pode repetir
+    ou separar por vírgula) e/ou stock_reference, e output (pdf, csv ou xlsx;
+    `format` é reservado pelo DRF).
+    Sem employee nem stock_reference usa o estoque ativo. O formato pdf
+    devolve um ZIP com um PDF por funcionário.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        fmt = request.query_params.get('output', 'pdf')
+        if fmt not in EXPORT_FORMATS:
+            return Response({"detail": f"Formato inválido; use {', '.join(EXPORT_FORMATS)}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            date_from = parse_date_param(request, 'from')
+            date_to = parse_date_param(request, 'to')
+        except ValueError:
+            return Response({"detail": "Datas inválidas; use o formato AAAA-MM-DD."}, status=status.HTTP_400_BAD_REQUEST)
+        if not date_from or not date_to or date_from > date_to:
+            return Response({"detail": "Informe um intervalo válido em 'from' e 'to'."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        employee_ids = [
+            value.strip()
+            for param in request.query_params.getlist('employee')
+            for value in param.split(',')
+            if value.strip()
+        ]
+        try:
+            employee_ids = [uuid.UUID(value) for value in employee_ids]
+            stock_reference_id = request.query_params.get('stock_reference')
+            stock_reference = uuid.UUID(stock_reference_id) if stock_reference_id else None
+        except ValueError:
+            return Response({"detail": "Identificador inválido."}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not employee_ids and stock_reference is None:
+            stock_reference = StockReference.get_active()
+            if stock_reference is None:
+                return Response({"detail": "Nenhum estoque ativo encontrado."}, status=status.HTTP_404_NOT_FOUND)
+
+        rows = export_rows(date_from, date_to, employee_ids=employee_ids, stock_reference=stock_reference)
+        response = StreamingHttpResponse(stream_export(fmt, rows), content_type=CONTENT_TYPES[fmt])
+        response['Content-Disposition'] = (
+            f'attachment; filename="vendas-{date_from:%Y%m%d}-{date_to:%Y%m%d}.{EXTENSIONS[fmt]}"'
+        )
+        return response
+
+
+class HistoryExportView(APIView):
+    """
+    Exportação bruta de SaleHistory e ActionHistory para o BI.
+
+    Responde em fluxo (CSV ou NDJSON em ?output=) lendo a tabela com
+    iterator(), então a memória não cresce com o número de linhas. Para
+    cargas incrementais envie em `since` a marca da última linha recebida:
+    o id em sale-history e o action_date_timestamp (mais `since_id`) em
+    action-history.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, table):
+        fmt = request.query_params.get('output', 'csv')
+        if fmt not in HISTORY_FORMATS:
+            return Response({"detail": f"Formato inválido; use {', '.join(HISTORY_FORMATS)}."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            rows = history_rows(
+                table,
+                since=request.query_params.get('since'),
+                since_id=request.query_params.get('since_id'),
+            )
+        except (ValueError, ValidationError):
+            return Response({"detail": "Marca 'since' inválida."}, status=status.HTTP_400_BAD_REQUEST)
+
+        content_type = 'text/csv; charset=utf-8' if fmt == 'csv' else 'application/x-ndjson'
+        response = StreamingHttpResponse(stream_table(HISTORY_TABLES[table]['columns'], rows, fmt),
+                                         content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{table}.{EXTENSIONS[fmt]}"'
+        # Evita que o proxy (nginx) segure a resposta inteira em buffer
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+from django.core.cache import cache
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from .cache import get_versions, response_key
+from .sync import DEFAULT_BATCH_SIZE, MAX_BATCH_SIZE, SyncHorizonError, changes as sync_changes_since, encode
+from .sync import snapshot as sync_snapshot_body
+
+
+def sync_response(body):
+    response = HttpResponse(body, content_type='application/json')
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def sync_snapshot(request):
+    """
+    Snapshot do catálogo para os caixas: versão, hash do conteúdo e as
+    tabelas de estoques, produtos e estoque. Com o hash em If-None-Match a
+    resposta é 304 se nada mudou.
+    """
+    key, _, _ = response_key(request, get_versions((PRODUCTS, STOCK, STOCK_REFERENCES)), 'sync')
+    entry = cache.get(key)
+    if entry is None:
+        entry = sync_snapshot_body()
+        cache.set(key, entry, settings.API_CACHE_TIMEOUT)
+    body, digest = entry
+
+    etag = quote_etag(digest)
+    response = get_conditional_response(request, etag=etag) or sync_response(body)
+    response['ETag'] = etag
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def sync_changes(request):
+    """
+    Alterações do catálogo desde ?since=<versão>, em ordem, até ?limit=
+    entradas; repita com a versão devolvida enquanto has_more for true.
+    410 se a versão é anterior à compactação: baixe o snapshot de novo.
+    """
+    try:
+        since = int(request.query_params.get('since', ''))
+        limit = int(request.query_params.get('limit', DEFAULT_BATCH_SIZE))
+    except ValueError:
+        return Response({"error": "Parâmetros since e limit devem ser inteiros."}, status=status.HTTP_400_BAD_REQUEST)
+    limit = min(max(limit, 1), MAX_BATCH_SIZE)
+
+    try:
+        payload = sync_changes_since(since, limit)
+    except SyncHorizonError as e:
+        return Response({"error": str(e), "horizon": e.horizon}, status=status.HTTP_410_GONE)
+    return sync_response(encode(payload))
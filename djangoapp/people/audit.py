@@ -0,0 +1,119 @@
+"""
+Gravação em segundo plano dos registros de LoginActivity.
+
+O login só coloca o registro numa fila; uma thread do processo grava a fila
+em lotes com bulk_create, a cada LOGIN_AUDIT_FLUSH_INTERVAL segundos ou
+quando LOGIN_AUDIT_BATCH_SIZE registros se acumulam. O que ainda estiver na
+fila é gravado quando o processo termina.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .models import LoginActivity
+
+logger = logging.getLogger(__name__)
+
+# Acima disto (banco fora do ar, por exemplo) os registros novos são descartados
+MAX_PENDING = 10000
+
+
+class LoginActivityWriter:
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=MAX_PENDING)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopping = threading.Event()
+        atexit.register(self.flush)
+
+    @property
+    def batch_size(self):
+        return max(getattr(settings, 'LOGIN_AUDIT_BATCH_SIZE', 100), 1)
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, 'LOGIN_AUDIT_FLUSH_INTERVAL', 2.0)
+
+    def record(self, user, status, ip_address):
+        activity = LoginActivity(user=user, status=status, ip_address=ip_address, timestamp=timezone.now())
+        if not self.flush_interval:
+            # Modo síncrono (testes, scripts): grava na própria requisição
+            activity.save()
+            return
+
+        try:
+            self._queue.put_nowait(activity)
+        except queue.Full:
+            logger.warning('Fila de LoginActivity cheia; registro descartado.')
+            return
+        self._ensure_started()
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='login-activity-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            self._drain(batch)
+            self._write(batch)
+
+    def _drain(self, batch):
+        # Junta o que chegar até o lote encher ou o intervalo acabar
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+    def _write(self, batch):
+        try:
+            LoginActivity.objects.bulk_create(batch)
+        except Exception:
+            logger.exception('Falha ao gravar %d registros de LoginActivity.', len(batch))
+        finally:
+            # A thread não recebe request_finished; respeita CONN_MAX_AGE aqui
+            close_old_connections()
+
+    def flush(self):
+        """Para a thread e grava o que estiver na fila (chamado no encerramento do processo)"""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 5)
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            if len(batch) >= self.batch_size:
+                self._write(batch)
+                batch = []
+        if batch:
+            self._write(batch)
+        self._stopping.clear()
+        self._thread = None
+
+
+writer = LoginActivityWriter()
+
+
+def record_login(user, status, ip_address):
+    writer.record(user, status, ip_address)
@@ -6,6 +6,7 @@ from django.db.models import Sum
 from django.core.exceptions import ValidationError
 import re
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 # Create your models here.
 
@@ -88,7 +89,8 @@ class EmployeeHistory(models.Model):
 
 class LoginActivity(models.Model):
     user = models.ForeignKey('auth.User', on_delete=models.SET_NULL, null=True, blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Preenchido na hora do login; a gravação é feita depois, em lote (people.audit)
+    timestamp = models.DateTimeField(default=timezone.now)
     status = models.CharField(max_length=20)
     ip_address = models.GenericIPAddressField()
 
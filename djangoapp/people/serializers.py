@@ -3,6 +3,7 @@ import re
 from rest_framework import serializers
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.models import User
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from .models import Employee, EmployeeHistory, LoginActivity
 
 class EmployeeSerializer(serializers.ModelSerializer):
@@ -79,3 +80,30 @@ class LoginactivitySerializer(serializers.ModelSerializer):
         extra_kwargs = {'username': {'read_only': True}} 
 
 
+class EmployeeTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """
+    Login com uma única verificação de senha; o id e o papel do funcionário
+    vão como claims do token (employee_id, role) e também na resposta.
+    """
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        employee = get_employee(user)
+        token['employee_id'] = str(employee.id) if employee else None
+        token['role'] = employee.role if employee else None
+        return token
+
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        employee = get_employee(self.user)
+        data['employee'] = {'id': employee.id, 'role': employee.role} if employee else None
+        return data
+
+
+def get_employee(user):
+    # user.employee fica guardado na instância, então só a primeira chamada consulta o banco
+    try:
+        return user.employee
+    except Employee.DoesNotExist:
+        return None
@@ -12,7 +12,10 @@ from rest_framework import viewsets, status
 from rest_framework_simplejwt.views import TokenObtainPairView
 
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from django.contrib.auth import authenticate
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from .audit import record_login
+from .serializers import EmployeeTokenObtainPairSerializer
 
 class EmployeeViewSet(viewsets.ModelViewSet):
     queryset = Employee.objects.all()
@@ -89,48 +92,30 @@ class EmployeeHistoryViewSet(viewsets.ModelViewSet):
 # Token Authentication
 class CustomTokenObtainPairView(TokenObtainPairView):
     permission_classes = [AllowAny]
+    serializer_class = EmployeeTokenObtainPairSerializer
 
     def post(self, request, *args, **kwargs):
-        # Tente obter o token de autenticação
-        response = super().post(request, *args, **kwargs)
-
-        # Verifique se o usuário foi autenticado
-        user = authenticate(username=request.data.get('username'), password=request.data.get('password'))
-
-        if user:
-            LoginActivity.objects.create(
-                user=user,
-                
-                status='success',
-                ip_address=request.META.get("REMOTE_ADDR")
-
-            )
-            try:
-                # Tente obter o funcionário associado ao usuário
-                employee = Employee.objects.get(user=user)
-
-                # Adicione os dados do funcionário à resposta
-                response.data['employee'] = {
-                    'id': employee.id,
-                    'role': employee.role
-                }
-                response.data['error'] = None  # Remova qualquer mensagem de erro anterior
-            except Employee.DoesNotExist:
-                response.data['employee'] = None
-                response.data['error'] = "Dados do funcionário não encontrados."
-                response.status_code = status.HTTP_404_NOT_FOUND  # Alterado para 404, se preferir
-
-        else:
-            LoginActivity.objects.create(
-                user=None,
-                status='failure',
-                id_address=request.META.get("REMOTE_ADDR")
-            )
-            response.data['employee'] = None
-            response.data['error'] = "Credenciais inválidas."
-            response.status_code = status.HTTP_401_UNAUTHORIZED
-
-        return response
+        # Uma única autenticação (a do serializer); o registro do login é
+        # gravado em segundo plano, fora da requisição
+        serializer = self.get_serializer(data=request.data)
+        ip_address = request.META.get("REMOTE_ADDR")
+        try:
+            serializer.is_valid(raise_exception=True)
+        except AuthenticationFailed:
+            record_login(None, 'failure', ip_address)
+            raise
+        except TokenError as e:
+            raise InvalidToken(e.args[0])
+
+        record_login(serializer.user, 'success', ip_address)
+
+        data = serializer.validated_data
+        if data['employee'] is None:
+            data['error'] = "Dados do funcionário não encontrados."
+            return Response(data, status=status.HTTP_404_NOT_FOUND)
+
+        data['error'] = None
+        return Response(data, status=status.HTTP_200_OK)
 
 
 